@@ -0,0 +1 @@
+"""Shared data access and metric helpers for the FTM dashboard pages."""
@@ -0,0 +1,138 @@
+"""Daily gameplay activity of a set of learners.
+
+``ftm_daily_activity`` holds one row per (event_date, app_id, country,
+user_pseudo_id) with the number of levels played, succeeded and failed that
+day. The nightly refresh (``ftm.refresh``) appends each new day from the
+same events pass that updates ``ftm_users``, so the Daily Reading Activity
+panels read a date-partitioned, clustered table instead of scanning the raw
+``events_20*`` shards.
+
+The learners are selected with ``learner_set``: a subquery on ``ftm_users``
+with the same date, app and country predicates the pages load learners with,
+joined server-side so the request stays a few kilobytes. ``id_set`` covers
+genuinely ad-hoc sets, staging large ones in a table.
+"""
+import pandas as pd
+from google.cloud import bigquery
+
+from ftm import bq
+from ftm.filters import sql_filter
+from ftm.snapshot import FTM_USERS_TABLE
+
+DAILY_ACTIVITY_TABLE = "dataexploration-193817.user_data.ftm_daily_activity"
+
+# Ad-hoc id sets larger than this are staged in a table instead of inlined.
+INLINE_IDS_LIMIT = 10_000
+
+
+def _date(yyyymmdd):
+    return f"DATE '{yyyymmdd[:4]}-{yyyymmdd[4:6]}-{yyyymmdd[6:]}'"
+
+
+def create_sql(reset=False):
+    create = "CREATE OR REPLACE TABLE" if reset else "CREATE TABLE IF NOT EXISTS"
+    return f"""{create} `{DAILY_ACTIVITY_TABLE}` (
+  event_date DATE, app_id STRING, country STRING, user_pseudo_id STRING,
+  levels_played INT64, levels_succeeded INT64, levels_failed INT64
+)
+PARTITION BY event_date
+CLUSTER BY app_id, country, user_pseudo_id;
+"""
+
+
+def increment_sql(after, through):
+    """Replace the days in (after, through] from the ``gameplay`` temp table.
+
+    Deleting the days first makes a re-run over the same shards harmless.
+    """
+    return f"""
+DELETE FROM `{DAILY_ACTIVITY_TABLE}`
+WHERE event_date > {_date(after)} AND event_date <= {_date(through)};
+
+INSERT INTO `{DAILY_ACTIVITY_TABLE}` (
+  event_date, app_id, country, user_pseudo_id,
+  levels_played, levels_succeeded, levels_failed
+)
+SELECT PARSE_DATE('%Y%m%d', event_date), app_id, country, user_pseudo_id,
+  COUNT(*),
+  COUNTIF(action LIKE '%LevelSuccess%'),
+  COUNTIF(action LIKE '%LevelFail%')
+FROM gameplay
+GROUP BY 1, 2, 3, 4;
+"""
+
+
+def build_daily_activity(gameplay):
+    """Equivalent of ``increment_sql`` on a frame shaped like ``gameplay``.
+
+    ``gameplay`` has the columns user_pseudo_id, event_date (YYYYMMDD),
+    app_id, country and action.
+    """
+    action = gameplay["action"]
+    counts = gameplay.assign(
+        event_date=pd.to_datetime(gameplay["event_date"], format="%Y%m%d"),
+        levels_played=1,
+        levels_succeeded=action.str.contains("LevelSuccess", regex=False),
+        levels_failed=action.str.contains("LevelFail", regex=False),
+    )
+    return (
+        counts.groupby(
+            ["event_date", "app_id", "country", "user_pseudo_id"], dropna=False
+        )[["levels_played", "levels_succeeded", "levels_failed"]]
+        .sum()
+        .astype("int64")
+        .reset_index()
+    )
+
+
+def daily_activity_sql(learners_sql, conditions=()):
+    """Levels played per day by the learners of ``learners_sql``.
+
+    Takes ``@start`` and ``@end`` DATE parameters, plus those of
+    ``conditions`` (``filters.sql_filter``).
+    """
+    where = ["event_date BETWEEN @start AND @end", *conditions]
+    where.append(f"user_pseudo_id IN ({learners_sql})")
+    conditions = "\n  AND ".join(where)
+    return f"""
+SELECT event_date, SUM(levels_played) AS levels_played
+FROM `{DAILY_ACTIVITY_TABLE}`
+WHERE {conditions}
+GROUP BY event_date
+ORDER BY event_date
+"""
+
+
+def learner_set(start_date, end_date, apps=None, countries=None):
+    """Subquery selecting the learners acquired between two dates.
+
+    Returns the SQL and its query parameters. ``apps`` and ``countries`` are
+    lists or ``filters.Predicate``; None means no restriction.
+    """
+    where = ["LA_date BETWEEN @la_start AND @la_end"]
+    params = [
+        bigquery.ScalarQueryParameter(
+            "la_start", "STRING", start_date.strftime("%Y%m%d")
+        ),
+        bigquery.ScalarQueryParameter("la_end", "STRING", end_date.strftime("%Y%m%d")),
+    ]
+    for column, name, values in (
+        ("app_id", "la_apps", apps),
+        ("country", "la_countries", countries),
+    ):
+        condition = sql_filter(column, name, values)
+        if condition is not None:
+            where.append(condition[0])
+            params.append(condition[1])
+    sql = f"SELECT user_pseudo_id FROM `{FTM_USERS_TABLE}` WHERE " + " AND ".join(where)
+    return sql, params
+
+
+def id_set(client, user_ids):
+    """Subquery selecting an explicit list of user ids, and its parameters."""
+    user_ids = list(user_ids)
+    if len(user_ids) <= INLINE_IDS_LIMIT:
+        sql = "SELECT user_pseudo_id FROM UNNEST(@user_ids) AS user_pseudo_id"
+        return sql, [bigquery.ArrayQueryParameter("user_ids", "STRING", user_ids)]
+    table_id = bq.stage_column(client, "user_pseudo_id", user_ids)
+    return f"SELECT user_pseudo_id FROM `{table_id}`", []
@@ -0,0 +1,196 @@
+"""Data backends: where the pages' tables, queries and sheets come from.
+
+``BigQueryBackend`` is production: BigQuery tables and Google Sheets, using
+the service account in ``st.secrets``. ``LocalBackend`` serves the same
+tables and sheets from a DuckDB file of fixtures (see ``ftm.fixtures``), so
+the pages can be run, profiled and benchmarked with no credentials or
+network. ``config.BACKEND`` (``FTM_BACKEND``) selects one.
+
+A backend provides:
+
+* ``table_version(table_id)``: a string that changes when the table does;
+* ``read_batches(table_id)``: the table as Arrow record batches (at least
+  one, so the schema is known even when it is empty);
+* ``query_df(sql, query_parameters, label)``: run a page query, written in
+  BigQuery SQL with ``bigquery`` query parameters;
+* ``load_sheets()``: the metadata sheets as typed frames (``ftm.sheets``).
+"""
+import os
+import re
+import threading
+import time
+
+import pyarrow as pa
+
+from ftm import bq, config, sheets
+
+BACKENDS = ("bigquery", "local")
+
+BATCH_ROWS = 100_000
+
+
+def _at_least_one(batches, schema):
+    """Yield ``batches``, or one empty batch if there are none.
+
+    :param schema: called for the schema of the empty batch.
+    """
+    empty = True
+    for batch in batches:
+        empty = False
+        yield batch
+    if empty:
+        yield pa.RecordBatch.from_pylist([], schema=schema())
+
+
+class BigQueryBackend:
+    name = "bigquery"
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from ftm.clients import get_bq_client
+
+            self._client = get_bq_client()
+        return self._client
+
+    def table_version(self, table_id):
+        modified = self.client.get_table(table_id).modified
+        return modified.strftime("%Y%m%dT%H%M%SZ")
+
+    def read_batches(self, table_id):
+        # list_rows reads the table directly instead of running a billed query.
+        batches = bq.iter_batches(self.client, self.client.list_rows(table_id))
+        return _at_least_one(
+            batches, lambda: self.client.list_rows(table_id).to_arrow().schema
+        )
+
+    def query_df(self, sql, query_parameters=None, label=None):
+        return bq.query_df(self.client, sql, query_parameters, label=label)
+
+    def load_sheets(self):
+        from ftm.clients import get_sheets_session, sheet_urls
+
+        return sheets.load(get_sheets_session(), sheet_urls(sheets.SHEETS))
+
+
+def sheet_table(name):
+    """Name of the local table holding sheet ``name``."""
+    return f"sheets.{name}"
+
+
+def to_duckdb_sql(sql):
+    """Translate the BigQuery SQL used by the pages to DuckDB.
+
+    Covers the subset the pages use: backquoted table ids, ``@name``
+    parameters and ``IN UNNEST(@array)``.
+    """
+    sql = re.sub(r"`([^`]+)`", r'"\1"', sql)
+    sql = re.sub(r"IN\s+UNNEST\((@\w+)\)", r"IN (SELECT UNNEST(\1))", sql)
+    return re.sub(r"@(\w+)", r"$\1", sql)
+
+
+def query_parameter_values(query_parameters):
+    values = {}
+    for param in query_parameters or []:
+        values[param.name] = (
+            list(param.values) if hasattr(param, "values") else param.value
+        )
+    return values
+
+
+class LocalBackend:
+    name = "local"
+
+    def __init__(self, path=None):
+        self.path = path or config.LOCAL_DB
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def cursor(self):
+        """A DuckDB cursor for the calling thread."""
+        import duckdb
+
+        with self._lock:
+            if self._conn is None:
+                if not os.path.exists(self.path):
+                    raise FileNotFoundError(
+                        f"no local fixtures at {self.path}; "
+                        "generate them with python -m ftm.fixtures"
+                    )
+                self._conn = duckdb.connect(self.path, read_only=True)
+            return self._conn.cursor()
+
+    def table_version(self, table_id):
+        # Fixtures are written all at once, so the file's mtime versions them.
+        modified = os.stat(self.path).st_mtime_ns
+        seconds, nanos = divmod(modified, 10**9)
+        return time.strftime("%Y%m%dT%H%M%S", time.gmtime(seconds)) + f".{nanos:09d}Z"
+
+    def read_batches(self, table_id):
+        reader = (
+            self.cursor()
+            .execute(f'SELECT * FROM "{table_id}"')
+            .to_arrow_reader(BATCH_ROWS)
+        )
+        return _at_least_one(reader, lambda: reader.schema)
+
+    def query_df(self, sql, query_parameters=None, label=None):
+        started = time.perf_counter()
+        df = (
+            self.cursor()
+            .execute(to_duckdb_sql(sql), query_parameter_values(query_parameters))
+            .df()
+        )
+        bq.timings.append(
+            {
+                "label": label,
+                "seconds": time.perf_counter() - started,
+                "rows": len(df),
+                "bytes_processed": None,
+                "bytes_billed": None,
+                "cache_hit": False,
+                "thread": threading.get_ident(),
+                "at": time.perf_counter(),
+            }
+        )
+        return df
+
+    def load_sheets(self):
+        frames = {}
+        cur = self.cursor()
+        for name, sheet in sheets.SHEETS.items():
+            result = cur.execute(f'SELECT * FROM "{sheet_table(name)}"')
+            header = [d[0] for d in result.description]
+            rows = [list(row) for row in result.fetchall()]
+            frames[name] = sheet.frame([header] + rows)
+        return frames
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The process-wide backend selected by ``config.BACKEND``."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if config.BACKEND == "bigquery":
+                _backend = BigQueryBackend()
+            elif config.BACKEND == "local":
+                _backend = LocalBackend()
+            else:
+                raise ValueError(
+                    f"FTM_BACKEND must be one of {BACKENDS}, got {config.BACKEND!r}"
+                )
+        return _backend
+
+
+def set_backend(backend):
+    """Use ``backend`` process-wide instead of the configured one."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
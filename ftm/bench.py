@@ -0,0 +1,595 @@
+"""Benchmark of every page's data pipeline on synthetic learners.
+
+For each scale, writes fixtures (``ftm.fixtures``), snapshots them through
+``LocalBackend`` as the app would, then times each page's pipeline with a
+stage breakdown:
+
+* ``load``: sheets, snapshot reads and queries;
+* ``filter``: selecting the learners or campaigns the page shows;
+* ``groupby``: daily and per-country aggregates;
+* ``ra_segments``: RA decile segmentation;
+* ``figures``: building (not rendering) the page's Plotly figures;
+* ``serialize``: encoding them to JSON as ``st.plotly_chart`` does, which
+  gives the payload sent to the browser (``payload_kb``, ``points``);
+* ``render``: a static render of every figure, a stand-in for the
+  browser's render time, when ``kaleido`` is installed.
+
+The pipelines run the pages' computations (``ftm.compute``) with the
+default selections (first campaign, all campaigns, last 30 days...) and
+bypass the result caches, so every run measures the computation. Results
+go to a JSON file; with ``--baseline`` the medians are compared to an
+earlier file. Each fixture's entry also has the in-memory size of the
+snapshot frames, per column (``schema.memory_report``).
+
+The pipelines restate what the pages compute, so each page script is also
+run once per scale on the same fixtures (Streamlit's ``AppTest``); a page
+that raises fails the benchmark. ``--no-scripts`` skips this.
+
+``--ingest ROWS`` also compares two ways of turning a query result of
+``ROWS`` ftm_users rows into a DataFrame: per-row dicts, as the pages used
+to, and Arrow batches (``bq.arrow_to_frame``). Each runs in its own
+process so its peak RSS is measured in isolation; only the conversion is
+timed.
+
+    python -m ftm.bench --learners 1000000 10000000 --repeat 3
+    python -m ftm.bench --learners 1000000 --baseline old.json --out new.json
+    python -m ftm.bench --learners --ingest 1000000
+"""
+import argparse
+import base64
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+import pyarrow as pa
+
+from ftm import cache, compute, config, cube, figures, fixtures, sheets
+from ftm.backend import LocalBackend, set_backend
+from ftm.campaigns import LearnerIndex, campaign_windows
+from ftm.schema import learner_frame, memory_report
+from ftm.snapshot import FTM_USERS_TABLE, load_ftm_users, store
+
+STAGES = ("load", "filter", "groupby", "ra_segments", "figures", "serialize", "render")
+
+# Runs slower than the baseline by more than this factor are flagged.
+REGRESSION_RATIO = 1.25
+
+INGEST_STRATEGIES = ("dict_rows", "arrow_batches")
+INGEST_BATCH_ROWS = 100_000
+
+
+class Timer:
+    """Wall time per stage of one pipeline run."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+
+def _points(values):
+    if values is None:
+        return 0
+    if isinstance(values, dict) and "bdata" in values:
+        # Typed arrays are shipped base64 encoded.
+        return np.frombuffer(base64.b64decode(values["bdata"]), values["dtype"]).size
+    return len(values)
+
+
+def ship(timer, figs):
+    """Serialize ``figs`` for the browser; returns the payload and points."""
+    with timer.stage("serialize"):
+        specs = [pio.to_json(fig, validate=False) for fig in figs]
+    traces = [trace for fig in figs for trace in fig.data]
+    res = {
+        "payload_kb": sum(len(spec) for spec in specs) / 1024,
+        "points": sum(_points(getattr(trace, "y", None)) for trace in traces),
+        "webgl_traces": sum(trace.type.endswith("gl") for trace in traces),
+    }
+    try:
+        import kaleido  # noqa: F401
+    except ImportError:
+        return res
+    with timer.stage("render"):
+        for fig in figs:
+            pio.to_image(fig, format="png")
+    return res
+
+
+def _yesterday():
+    return pd.to_datetime("today").date() - pd.Timedelta(1, unit="D")
+
+
+def summary(backend, timer):
+    with timer.stage("load"):
+        sheets = backend.load_sheets()
+        ftm_users = load_ftm_users(backend)
+    with timer.stage("filter"):
+        ann_camp_data = sheets["annual_metrics"].astype({"year": "int"})
+        ann_camp_data = ann_camp_data[
+            ann_camp_data["year"] < pd.to_datetime("today").date().year + 1
+        ]
+        users_df = compute.year_learners(
+            ftm_users, ann_camp_data["year"].min(), ann_camp_data["year"].max()
+        )
+    with timer.stage("groupby"):
+        daily_la = compute.la_views(compute.daily_la(users_df))
+        country_la = compute.country_la(users_df)
+    with timer.stage("ra_segments"):
+        avg_total_levels = compute.average_total_levels(sheets["apps"])
+        ra_segs = compute.ra_deciles(users_df, avg_total_levels, by="campaign")
+    with timer.stage("figures"):
+        figs = [
+            figures.campaign_la(daily_la, "Monthly LA Rolling Mean"),
+            figures.country_map(country_la, fitbounds=True),
+            figures.ra_deciles(
+                ra_segs, "LA by EstRA Decile", {}, color="campaign", barmode="group"
+            ),
+        ]
+    return {"learners": len(users_df), **ship(timer, figs)}
+
+
+def campaign_comparison_summary(backend, timer):
+    with timer.stage("load"):
+        sheets = backend.load_sheets()
+    with timer.stage("filter"):
+        ftm_campaigns = sheets["campaigns"]
+        metrics = (
+            sheets["campaign_metrics"]
+            .fillna(0)
+            .astype({"la": "int", "lac": "float", "ra": "float", "rac": "float"})
+        )
+        gantt_df = pd.merge(
+            ftm_campaigns,
+            metrics,
+            how="left",
+            left_on="Campaign Name",
+            right_on="campaign_name",
+        )
+    with timer.stage("groupby"):
+        dates = ftm_campaigns.set_index("Campaign Name")
+        metrics["camp_age"] = [
+            (dates.loc[c, "End Date"] - dates.loc[c, "Start Date"]).days
+            for c in metrics["campaign_name"]
+        ]
+    with timer.stage("figures"):
+        figs = [figures.gantt(gantt_df)] + [
+            figures.quadrant(metrics, x, y, {}, f"{x} vs {y}", (0, 1, 0, 1))
+            for x, y in [("ra", "la"), ("lac", "rac"), ("la", "lac")]
+        ]
+    return {"campaigns": len(ftm_campaigns), **ship(timer, figs)}
+
+
+def campaign_details(backend, timer):
+    with timer.stage("load"):
+        sheets = backend.load_sheets()
+        campaign = sheets["campaigns"].iloc[0]
+        ftm_apps = sheets["apps"]
+        app = ftm_apps.loc[ftm_apps["language"] == campaign["Language"], "app_id"]
+        app = app.item()
+        start, end = campaign["Start Date"], campaign["End Date"]
+        countries = None if campaign["Country"] == "All" else [campaign["Country"]]
+        window = (start.strftime("%Y%m%d"), end.strftime("%Y%m%d"))
+        daily_cube = cube.load_la_daily_cube(
+            backend, *window, apps=[app], countries=countries
+        )
+        la_cube = cube.load_la_cube(backend, *window, apps=[app], countries=countries)
+        daily_activity = compute.query_daily_activity(
+            backend, start, end, [app], countries
+        )
+    with timer.stage("groupby"):
+        daily_la = cube.daily_la(daily_cube, name="Learners Acquired")
+        country_la = cube.country_la(daily_cube)
+    with timer.stage("ra_segments"):
+        total_lvls = ftm_apps.loc[ftm_apps["app_id"] == app, "total_lvls"].item()
+        ra_segs = cube.cube_ra_segments(
+            la_cube, total_lvls, cost=campaign["Total Cost (USD)"]
+        )
+    with timer.stage("figures"):
+        figs = [
+            figures.daily_la_rolling(daily_la),
+            figures.country_map(country_la),
+            figures.ra_deciles(ra_segs, "LA by RA Decile", {}),
+            *figures.levels_played(daily_activity),
+        ]
+    return {
+        "daily_cube_rows": len(daily_cube),
+        "cube_rows": len(la_cube),
+        "activity_days": len(daily_activity),
+        **ship(timer, figs),
+    }
+
+
+def campaign_comparison_details(backend, timer):
+    with timer.stage("load"):
+        sheets = backend.load_sheets()
+        ftm_users = load_ftm_users(backend)
+    with timer.stage("filter"):
+        ftm_apps = sheets["apps"]
+        windows = campaign_windows(sheets["campaigns"], ftm_apps)
+        users_df = LearnerIndex(ftm_users).select(windows)
+    with timer.stage("groupby"):
+        daily_la = compute.la_views(compute.daily_la(users_df))
+        metrics = compute.learner_metrics(users_df, windows, ftm_apps["total_lvls"][0])
+    with timer.stage("ra_segments"):
+        campaign_costs = windows.drop_duplicates("campaign").set_index("campaign")
+        ra_segs = compute.ra_deciles(
+            users_df,
+            ftm_apps["total_lvls"][0],
+            by="campaign",
+            cost=campaign_costs["cost"],
+        )
+    with timer.stage("figures"):
+        figs = [
+            figures.campaign_la(daily_la, "Monthly LA Rolling Mean"),
+            figures.ra_deciles(
+                ra_segs, "LA by RA Decile", {}, color="campaign", barmode="group"
+            ),
+        ]
+    return {
+        "learners": len(users_df),
+        "campaigns": len(metrics),
+        **ship(timer, figs),
+    }
+
+
+def manual_analysis(backend, timer):
+    with timer.stage("load"):
+        sheets = backend.load_sheets()
+        ftm_apps = sheets["apps"]
+        end = _yesterday()
+        start = end - pd.Timedelta(29, unit="D")
+        # Every app and country: no filter (ftm.filters.plan).
+        window = (start.strftime("%Y%m%d"), end.strftime("%Y%m%d"))
+        daily_cube = cube.load_la_daily_cube(backend, *window)
+        la_cube = cube.load_la_cube(backend, *window)
+    with timer.stage("groupby"):
+        daily_la = cube.daily_la(daily_cube, name="Learners Acquired")
+        country_la = cube.country_la(daily_cube, name="Learners Acquired")
+    with timer.stage("ra_segments"):
+        avg_total_levels = compute.average_total_levels(ftm_apps)
+        ra_segs = cube.cube_ra_segments(la_cube, avg_total_levels)
+    with timer.stage("figures"):
+        figs = [
+            figures.daily_la_rolling(daily_la),
+            figures.country_map(country_la, color="Learners Acquired"),
+            figures.ra_deciles(ra_segs, "LA by EstRA Decile", {}),
+        ]
+    return {
+        "daily_cube_rows": len(daily_cube),
+        "cube_rows": len(la_cube),
+        **ship(timer, figs),
+    }
+
+
+PAGES = {
+    "summary": summary,
+    "campaign_comparison_summary": campaign_comparison_summary,
+    "campaign_details": campaign_details,
+    "campaign_comparison_details": campaign_comparison_details,
+    "manual_analysis": manual_analysis,
+}
+
+
+# Page scripts, relative to config.ROOT_DIR.
+SCRIPTS = {
+    "summary": "Summary.py",
+    "campaign_comparison_summary": "pages/01_Campaign_Comparison_Summary.py",
+    "campaign_details": "pages/02_Campaign_Details.py",
+    "campaign_comparison_details": "pages/03_Campaign_Comparison_Details.py",
+    "manual_analysis": "pages/04_Manual_Analysis.py",
+}
+
+
+def run_script(backend, page, timeout=600):
+    """Run a page script on ``backend``; returns the messages it raised."""
+    from streamlit.testing.v1 import AppTest
+
+    set_backend(backend)
+    sheets.clear()
+    app = AppTest.from_file(
+        os.path.join(config.ROOT_DIR, SCRIPTS[page]), default_timeout=timeout
+    )
+    app.run()
+    return [e.message for e in app.exception]
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def _ingest_source(strategy, n):
+    """A query result of ``n`` ftm_users rows, as ``strategy`` receives it."""
+    cohort = fixtures.learners(n, 730)
+    table = fixtures.users_table(cohort, datetime.date(2021, 1, 1))
+    if strategy == "arrow_batches":
+        return table.to_batches(max_chunksize=INGEST_BATCH_ROWS)
+    from google.cloud.bigquery import Row
+
+    names = table.column_names
+    field_to_index = {name: i for i, name in enumerate(names)}
+    values = zip(*(table.column(name).to_pylist() for name in names))
+    return [Row(v, field_to_index) for v in values]
+
+
+def _ingest_convert(strategy, source):
+    from ftm.bq import arrow_to_frame
+
+    if strategy == "arrow_batches":
+        return arrow_to_frame(pa.Table.from_batches(source))
+    return pd.DataFrame([dict(row) for row in source])
+
+
+def _rss_bytes(field):
+    """``VmRSS`` or ``VmHWM`` (peak) of this process, or None off Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def ingest_one(strategy, n):
+    """Convert ``n`` rows with ``strategy`` in this process."""
+    source = _ingest_source(strategy, n)
+    try:
+        # Reset the peak RSS to the current RSS (Linux).
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    before = _rss_bytes("VmRSS")
+    started = time.perf_counter()
+    df = _ingest_convert(strategy, source)
+    seconds = time.perf_counter() - started
+    peak = _rss_bytes("VmHWM")
+    return {
+        "strategy": strategy,
+        "rows": n,
+        "seconds": seconds,
+        "rows_per_sec": n / seconds,
+        "peak_rss_delta_mb": None if peak is None else (peak - before) / 2**20,
+        "frame_mb": df.memory_usage(deep=True).sum() / 2**20,
+    }
+
+
+def ingest(n):
+    """``ingest_one`` for each strategy, each in a fresh process."""
+    results = []
+    for strategy in INGEST_STRATEGIES:
+        out = subprocess.run(
+            [sys.executable, "-m", "ftm.bench", "--ingest", str(n)]
+            + ["--ingest-strategy", strategy],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        results.append(json.loads(out.stdout))
+        print(f"{n:>12,} ingest {strategy:<21} done", file=sys.stderr)
+    return results
+
+
+def prepare(n, root, seed=0, events_limit=1_000_000, regenerate=False):
+    """Fixtures of ``n`` learners and their snapshots; returns the backend.
+
+    Fixtures are reused across invocations unless ``regenerate``.
+    """
+    path = os.path.join(root, f"ftm_{n}_{seed}.duckdb")
+    info = {"learners": n, "path": path}
+    if regenerate or not os.path.exists(path):
+        started = time.perf_counter()
+        fixtures.generate(n, path, seed=seed, events=n <= events_limit)
+        info["generate_seconds"] = time.perf_counter() - started
+    backend = LocalBackend(path)
+    started = time.perf_counter()
+    versions = {t: store.ensure(backend, t) for t in (FTM_USERS_TABLE, *cube.KEYS)}
+    info["snapshot_seconds"] = time.perf_counter() - started
+    info["memory"] = {
+        table_id: memory_report(learner_frame(store.read_table(table_id, version)))
+        .round(3)
+        .to_dict(orient="index")
+        for table_id, version in versions.items()
+    }
+    return backend, info
+
+
+def run(
+    scales,
+    pages,
+    repeat=3,
+    root=None,
+    seed=0,
+    events_limit=1_000_000,
+    regenerate=False,
+    scripts=True,
+    ingest_rows=None,
+):
+    root = root or os.path.join(config.DATA_DIR, "bench")
+    report = {
+        "started": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "versions": {"pandas": pd.__version__, "pyarrow": pa.__version__},
+        "fixtures": [],
+        "runs": [],
+        "scripts": [],
+        "ingest": ingest(ingest_rows) if ingest_rows else [],
+    }
+    for n in scales:
+        backend, info = prepare(n, root, seed, events_limit, regenerate)
+        report["fixtures"].append(info)
+        for page in pages:
+            for i in range(repeat):
+                # Figures are cached by their input; measure building them.
+                cache.store.clear()
+                cube.clear_slices()
+                timer = Timer()
+                started = time.perf_counter()
+                rows = PAGES[page](backend, timer)
+                report["runs"].append(
+                    {
+                        "learners": n,
+                        "page": page,
+                        "run": i,
+                        "seconds": time.perf_counter() - started,
+                        "stages": timer.stages,
+                        "rows": rows,
+                    }
+                )
+                print(
+                    f"{n:>12,} {page:<28} run {i}: "
+                    f"{report['runs'][-1]['seconds']:.3f}s",
+                    file=sys.stderr,
+                )
+            if scripts:
+                cache.store.clear()
+                cube.clear_slices()
+                started = time.perf_counter()
+                errors = run_script(backend, page)
+                seconds = time.perf_counter() - started
+                report["scripts"].append(
+                    {"learners": n, "page": page, "seconds": seconds, "errors": errors}
+                )
+                status = "FAILED" if errors else "ok"
+                print(
+                    f"{n:>12,} {page:<28} script: {seconds:.3f}s {status}",
+                    file=sys.stderr,
+                )
+    report["max_rss_mb"] = max_rss_mb()
+    return report
+
+
+def medians(report):
+    """Median seconds per (learners, page), in total and per stage, and the
+    size of the figures sent to the browser."""
+    runs = pd.DataFrame(
+        [
+            {"learners": r["learners"], "page": r["page"], "total": r["seconds"]}
+            | {s: r["stages"].get(s, np.nan) for s in STAGES}
+            | {k: r["rows"].get(k, np.nan) for k in ("payload_kb", "points")}
+            for r in report["runs"]
+        ]
+    )
+    return runs.groupby(["learners", "page"]).median()
+
+
+def compare(report, baseline):
+    """Median total seconds now and in ``baseline``, with their ratio."""
+    now = medians(report)["total"].rename("seconds")
+    before = medians(baseline)["total"].rename("baseline")
+    res = pd.concat([now, before], axis=1, join="inner")
+    res["ratio"] = res["seconds"] / res["baseline"]
+    res["slower"] = res["ratio"] > REGRESSION_RATIO
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the page pipelines.")
+    parser.add_argument(
+        "--learners",
+        type=int,
+        nargs="*",
+        default=[1_000_000],
+        help="learner counts to benchmark, e.g. 1000000 10000000 50000000",
+    )
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--events-limit",
+        type=int,
+        default=1_000_000,
+        help="generate gameplay events only up to this many learners",
+    )
+    parser.add_argument("--fixtures-dir", help="where fixtures are kept and reused")
+    parser.add_argument(
+        "--regenerate", action="store_true", help="write fixtures even if present"
+    )
+    parser.add_argument(
+        "--no-scripts", action="store_true", help="do not run the page scripts"
+    )
+    parser.add_argument(
+        "--ingest",
+        type=int,
+        metavar="ROWS",
+        help="also compare dict and Arrow ingestion of a ROWS-row query result",
+    )
+    parser.add_argument(
+        "--ingest-strategy", choices=INGEST_STRATEGIES, help=argparse.SUPPRESS
+    )
+    parser.add_argument(
+        "--out",
+        default=os.path.join(config.DATA_DIR, "bench.json"),
+        help="JSON results file",
+    )
+    parser.add_argument("--baseline", help="earlier results file to compare with")
+    args = parser.parse_args(argv)
+    if args.ingest_strategy:
+        print(json.dumps(ingest_one(args.ingest_strategy, args.ingest)))
+        return
+
+    report = run(
+        args.learners,
+        args.pages,
+        args.repeat,
+        args.fixtures_dir,
+        args.seed,
+        args.events_limit,
+        args.regenerate,
+        scripts=not args.no_scripts,
+        ingest_rows=args.ingest,
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    with pd.option_context("display.width", 160, "display.max_columns", None):
+        for info in report["fixtures"]:
+            for table_id, columns in info["memory"].items():
+                print(f"{info['learners']:,} learners, {table_id} in memory:")
+                print(pd.DataFrame.from_dict(columns, orient="index"))
+        for r in report["ingest"]:
+            peak = r["peak_rss_delta_mb"]
+            print(
+                f"{r['strategy']:>14}: {r['rows_per_sec']:>12,.0f} rows/s"
+                + ("" if peak is None else f"  peak RSS +{peak:,.0f} MB")
+                + f"  frame {r['frame_mb']:,.0f} MB"
+            )
+        if report["runs"]:
+            print(medians(report).round(3))
+        if args.baseline and report["runs"]:
+            with open(args.baseline) as f:
+                print(compare(report, json.load(f)).round(3))
+    print(f"Wrote {args.out}")
+    failed = [s for s in report["scripts"] if s["errors"]]
+    for script in failed:
+        print(f"{script['page']} raised:", *script["errors"], sep="\n", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""BigQuery query execution and result ingestion.
+
+Results are read as Arrow record batches (over the BigQuery Storage Read API
+when ``google-cloud-bigquery-storage`` is installed, the REST API otherwise)
+and converted to pandas column by column, instead of materialising one Python
+dict per row first.
+"""
+import collections
+import datetime
+import hashlib
+import io
+import threading
+import time
+import weakref
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from ftm import config
+
+_read_clients = weakref.WeakKeyDictionary()
+_read_clients_lock = threading.Lock()
+
+# Most recent query timings in this process, oldest first.
+timings = collections.deque(maxlen=200)
+
+
+def get_read_client(client):
+    """Return a BigQuery Storage read client sharing ``client``'s credentials.
+
+    Returns None when the storage library is not installed, in which case the
+    BigQuery client falls back to paging over REST.
+    """
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        return None
+    with _read_clients_lock:
+        read_client = _read_clients.get(client)
+        if read_client is None:
+            read_client = bigquery_storage.BigQueryReadClient(
+                credentials=client._credentials
+            )
+            _read_clients[client] = read_client
+    return read_client
+
+
+def iter_batches(client, rows):
+    """Yield the Arrow record batches of a RowIterator."""
+    return rows.to_arrow_iterable(bqstorage_client=get_read_client(client))
+
+
+def arrow_to_frame(table):
+    """Convert an Arrow table to a DataFrame with typed columns.
+
+    ``self_destruct`` releases each Arrow column as soon as it has been
+    converted, so peak memory stays close to the size of the final frame.
+    """
+    return table.to_pandas(self_destruct=True, split_blocks=True)
+
+
+def query_df(client, sql, query_parameters=None, label=None):
+    """Run a query and return its result as a DataFrame.
+
+    The job's wall time, row count and bytes processed and billed are
+    appended to ``timings`` under ``label``, with the calling thread.
+    """
+    started = time.perf_counter()
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters or [])
+    job = client.query(sql, job_config=job_config)
+    rows = job.result()
+    df = arrow_to_frame(rows.to_arrow(bqstorage_client=get_read_client(client)))
+    timings.append(
+        {
+            "label": label,
+            "seconds": time.perf_counter() - started,
+            "rows": len(df),
+            "bytes_processed": job.total_bytes_processed,
+            "bytes_billed": job.total_bytes_billed,
+            "cache_hit": job.cache_hit,
+            "thread": threading.get_ident(),
+            "at": time.perf_counter(),
+        }
+    )
+    return df
+
+
+def stage_column(client, name, values):
+    """Upload ``values`` as a one-column table and return its id.
+
+    Tables are named after their content, so staging the same values twice
+    reuses the first upload, and expire after
+    ``config.STAGING_EXPIRATION_HOURS``.
+    """
+    column = pa.array(sorted(set(values)), pa.string())
+    digest = hashlib.sha1("\n".join(column.to_pylist()).encode()).hexdigest()[:16]
+    table_id = f"{config.STAGING_DATASET}._staged_{name}_{digest}"
+    try:
+        client.get_table(table_id)
+        return table_id
+    except NotFound:
+        pass
+    buf = io.BytesIO()
+    pq.write_table(pa.table({name: column}), buf)
+    buf.seek(0)
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+    )
+    client.load_table_from_file(buf, table_id, job_config=job_config).result()
+    table = client.get_table(table_id)
+    table.expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        hours=config.STAGING_EXPIRATION_HOURS
+    )
+    client.update_table(table, ["expires"])
+    return table_id
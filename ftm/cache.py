@@ -0,0 +1,639 @@
+"""In-process result cache keyed on DataFrame fingerprints.
+
+``st.cache_data`` hashes every DataFrame argument on every rerun to find the
+cache entry, which for learner-level frames costs more than the call it
+saves. Here a frame carries a small fingerprint instead: loaders ``stamp``
+what they return with the snapshot version and filters that produced it, and
+``cached`` functions stamp their own results with their cache key, so frames
+passed along a chain of cached calls are never hashed.
+
+A stamp belongs to one frame object. Frames derived from a stamped one
+(slices, copies, new columns) are not covered and fall back to a content
+hash, which ``stats`` reports so the slow path shows up.
+
+Results are held in one process-wide store, bounded three ways:
+
+* by default an entry expires at the next nightly refresh
+  (``config.REFRESH_TIME_UTC``); ``ttl`` can also be a number of seconds or
+  None;
+* each function keeps at most ``max_entries`` results
+  (``config.CACHE_MAX_ENTRIES``);
+* the store evicts least recently used entries to stay within
+  ``config.CACHE_MEMORY_MB``.
+
+Entries also remember which snapshot tables (and versions) they were
+computed from, and ``invalidate`` drops them when the snapshot store
+downloads a new version. Expiry alone would serve stale results for a day
+when the refresh finishes late, so a lookup also compares an entry's
+versions with the latest ones (``track_versions``); the snapshot store
+asks the backend for those at most every ``config.SNAPSHOT_CHECK_SECONDS``.
+
+With ``persist=True`` DataFrame results are also written to a Parquet file
+per entry (``DiskStore``), so they survive restarts and can be computed
+ahead of time by another process (``python -m ftm.warm``). The file name is
+a digest of the cache key, which is why persisted functions should only
+take arguments with a stable ``repr``: scalars, dates, lists of them and
+DataFrames.
+
+Unlike ``st.cache_data``, results are shared rather than copied: callers
+must not modify them in place.
+"""
+import collections
+import datetime
+import functools
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ftm import config
+
+# ``ttl`` value: expire at the next nightly refresh.
+REFRESH = "refresh"
+
+_stamps = {}
+_stamps_lock = threading.Lock()
+
+
+def stamp(df, token, tables=()):
+    """Record ``token`` as the fingerprint of ``df`` and return ``df``.
+
+    :param tables: ``(table_id, version)`` of the snapshots ``df`` was
+        computed from.
+    """
+    key = id(df)
+
+    def forget(_ref, key=key):
+        with _stamps_lock:
+            if _stamps.get(key, (None,))[0] is _ref:
+                del _stamps[key]
+
+    with _stamps_lock:
+        _stamps[key] = (weakref.ref(df, forget), token, frozenset(tables))
+    return df
+
+
+def _stamp(df):
+    with _stamps_lock:
+        entry = _stamps.get(id(df))
+    if entry is not None and entry[0]() is df:
+        return entry
+    return None
+
+
+def fingerprint(df):
+    """The token ``df`` was stamped with, or None."""
+    entry = _stamp(df)
+    return entry[1] if entry is not None else None
+
+
+def content_hash(df):
+    digest = hashlib.sha1()
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _arg_key(value, cache, tables):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        entry = _stamp(value)
+        if entry is None:
+            cache.hashed += 1
+            return ("hash", content_hash(value))
+        tables.update(entry[2])
+        return entry[1]
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(
+            _arg_key(v, cache, tables) for v in value
+        )
+    if isinstance(value, dict):
+        return ("dict",) + tuple(
+            (k, _arg_key(v, cache, tables)) for k, v in sorted(value.items(), key=repr)
+        )
+    if isinstance(value, np.generic):
+        # Same key, and same repr on disk, as the equivalent Python scalar.
+        return value.item()
+    try:
+        hash(value)
+    except TypeError:
+        return ("repr", repr(value))
+    return value
+
+
+def next_refresh(now=None):
+    """Timestamp of the next nightly refresh after ``now``."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    hour, minute = (int(part) for part in config.REFRESH_TIME_UTC.split(":"))
+    at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if at <= now:
+        at += datetime.timedelta(days=1)
+    return at.timestamp()
+
+
+def sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+# Snapshots (table, version) read while computing the results currently being computed on this
+# thread, innermost last.
+_reading = threading.local()
+
+
+def depends_on(tables):
+    """Record that the results being computed read ``tables``.
+
+    :param tables: ``(table_id, version)`` pairs.
+    """
+    for collected in getattr(_reading, "stack", ()):
+        collected.update(tables)
+
+
+class Entry:
+    __slots__ = ("cache", "value", "size", "expires", "tables")
+
+    def __init__(self, cache, value, expires, tables):
+        self.cache = cache
+        self.value = value
+        self.size = sizeof(value)
+        self.expires = expires
+        self.tables = frozenset(tables)
+
+
+class Store:
+    """LRU store shared by every cached function, bounded by memory."""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        entry.cache.entries -= 1
+        entry.cache.bytes -= entry.size
+        return entry
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires is not None and entry.expires <= time.time():
+                self._drop(key).cache.expired += 1
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = entry
+            self.bytes += entry.size
+            entry.cache.entries += 1
+            entry.cache.bytes += entry.size
+            cache = entry.cache
+            if cache.max_entries is not None and cache.entries > cache.max_entries:
+                oldest = next(k for k, e in self.entries.items() if e.cache is cache)
+                self._drop(oldest).cache.evicted += 1
+            # The new entry stays even if it alone exceeds the budget.
+            while self.bytes > self.budget_bytes and len(self.entries) > 1:
+                oldest = next(iter(self.entries))
+                if oldest == key:
+                    self.entries.move_to_end(key)
+                    continue
+                self._drop(oldest).cache.evicted += 1
+
+    def discard(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+
+    def invalidate(self, table_id, version=None):
+        with self.lock:
+            stale = [
+                k
+                for k, e in self.entries.items()
+                if _stale(e.tables, table_id, version)
+            ]
+            for key in stale:
+                self._drop(key)
+        return len(stale)
+
+    def clear(self, cache=None):
+        with self.lock:
+            for key in [k for k, e in self.entries.items() if cache in (None, e.cache)]:
+                self._drop(key)
+
+
+def _stale(tables, table_id, version):
+    return any(t == table_id and v != version for t, v in tables)
+
+
+# Latest version of a snapshot table, or None if unknown; see
+# ``track_versions``.
+_versions = None
+
+
+def track_versions(current):
+    """Check results against ``current(table_id)`` when they are looked up.
+
+    :param current: returns the latest version of a snapshot table, or None
+        if it is unknown.
+    """
+    global _versions
+    _versions = current
+
+
+def _current(tables):
+    """Whether ``tables`` are the latest versions of their snapshots."""
+    current = _versions
+    if current is None:
+        return True
+    for table_id, version in tables:
+        latest = current(table_id)
+        if latest is not None and latest != version:
+            return False
+    return True
+
+
+class DiskStore:
+    """Persisted results, one Parquet file per entry.
+
+    The entry's key, expiry and snapshot dependencies are kept in the file's
+    schema metadata; ``get`` drops an entry that expired or was computed from
+    an older snapshot version. Each function keeps at most ``max_entries``
+    files, the least recently read or written removed first (by mtime).
+    Pruning reads every file's metadata, so ``put`` prunes a function's
+    directory at most once per ``prune_interval`` seconds; ``get`` removes
+    the stale files it comes across in between.
+    """
+
+    def __init__(self, root=None, prune_interval=3600, max_entries=None):
+        self.root = root or os.path.join(config.DATA_DIR, "results")
+        self.prune_interval = prune_interval
+        self.max_entries = max_entries or config.CACHE_DISK_MAX_ENTRIES
+        self._pruned = {}
+        self._pruned_lock = threading.Lock()
+        # Files per function, counted when first written to.
+        self._counts = {}
+
+    def function_dir(self, name):
+        return os.path.join(self.root, re.sub(r"[^\w.-]", "_", name))
+
+    def path(self, name, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.function_dir(name), f"{digest}.parquet")
+
+    def _meta(self, path):
+        meta = pq.read_schema(path).metadata or {}
+        return json.loads(meta[b"ftm_cache"])
+
+    def get(self, name, key):
+        """The persisted value, expiry and tables of ``key``, or None."""
+        path = self.path(name, key)
+        try:
+            table = pq.read_table(path)
+            meta = json.loads(table.schema.metadata[b"ftm_cache"])
+        except (OSError, KeyError, ValueError, pa.ArrowException):
+            return None
+        if meta["key"] != repr(key):
+            return None
+        tables = {tuple(t) for t in meta["tables"]}
+        expired = meta["expires"] is not None and meta["expires"] <= time.time()
+        if expired or not _current(tables):
+            self._remove(path)
+            return None
+        # Recently used files are the last to go.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return table.to_pandas(), meta["expires"], tables
+
+    def put(self, name, key, df, expires, tables):
+        path = self.path(name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df)
+        meta = {"key": repr(key), "expires": expires, "tables": sorted(tables)}
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), b"ftm_cache": json.dumps(meta)}
+        )
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        pq.write_table(table, tmp_path)
+        new = not os.path.exists(path)
+        os.replace(tmp_path, path)
+        if self._prune_due(name):
+            self.prune(name)
+        elif new:
+            self._added(name)
+
+    def _added(self, name):
+        with self._pruned_lock:
+            if name not in self._counts:
+                self._counts[name] = len(self._paths(name))
+            else:
+                self._counts[name] += 1
+            over = self._counts[name] > self.max_entries
+        if over:
+            self._trim(name)
+
+    def _trim(self, name):
+        """Remove the least recently used files beyond ``max_entries``."""
+        dated = []
+        for path in self._paths(name):
+            try:
+                dated.append((os.stat(path).st_mtime_ns, path))
+            except FileNotFoundError:
+                pass
+        dated.sort()
+        for _, path in dated[: -self.max_entries]:
+            self._remove(path)
+        with self._pruned_lock:
+            self._counts[name] = min(len(dated), self.max_entries)
+
+    def _prune_due(self, name):
+        now = time.time()
+        with self._pruned_lock:
+            if now - self._pruned.get(name, 0.0) < self.prune_interval:
+                return False
+            self._pruned[name] = now
+            return True
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _paths(self, name=None):
+        dirs = [self.function_dir(name)] if name else []
+        if name is None:
+            try:
+                dirs = [os.path.join(self.root, d) for d in os.listdir(self.root)]
+            except FileNotFoundError:
+                return []
+        paths = []
+        for d in dirs:
+            try:
+                paths += [os.path.join(d, n) for n in os.listdir(d)]
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+        return [p for p in paths if p.endswith(".parquet")]
+
+    def prune(self, name=None):
+        """Remove expired entries, those computed from older snapshot
+        versions and the least recently used beyond ``max_entries``."""
+        for path in self._paths(name):
+            try:
+                meta = self._meta(path)
+            except (OSError, KeyError, ValueError, pa.ArrowException):
+                continue
+            expired = meta["expires"] is not None and meta["expires"] <= time.time()
+            if expired or not _current({tuple(t) for t in meta["tables"]}):
+                self._remove(path)
+        names = [name] if name else self._names()
+        for name in names:
+            self._trim(name)
+
+    def _names(self):
+        try:
+            return [
+                n
+                for n in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, n))
+            ]
+        except FileNotFoundError:
+            return []
+
+    def invalidate(self, table_id, version=None):
+        removed = 0
+        for path in self._paths():
+            try:
+                tables = self._meta(path)["tables"]
+            except (OSError, KeyError, ValueError, pa.ArrowException):
+                continue
+            if _stale(tables, table_id, version):
+                self._remove(path)
+                removed += 1
+        return removed
+
+
+store = Store(config.CACHE_MEMORY_MB * 2**20)
+disk = DiskStore()
+
+
+def invalidate(table_id, version=None):
+    """Drop the results computed from a snapshot of ``table_id``.
+
+    With ``version``, results computed from that version are kept.
+    """
+    return store.invalidate(table_id, version) + disk.invalidate(table_id, version)
+
+
+class FunctionCache:
+    """Policy and counters for one cached function."""
+
+    def __init__(self, name, ttl, max_entries, persist=False):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist = persist
+        self.key_locks = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.loaded = 0
+        self.misses = 0
+        self.hashed = 0
+        self.expired = 0
+        self.evicted = 0
+        self.entries = 0
+        self.bytes = 0
+
+    def key(self, args, kwargs):
+        """The cache key for a call, and the tables its frame arguments read."""
+        tables = set()
+        key = (self.name, _arg_key(args, self, tables), _arg_key(kwargs, self, tables))
+        return key, tables
+
+    def expires(self):
+        if self.ttl == REFRESH:
+            return next_refresh()
+        if self.ttl is None:
+            return None
+        return time.time() + self.ttl
+
+    def lookup(self, key):
+        entry = store.get(key)
+        if entry is None:
+            return None
+        if not _current(entry.tables):
+            store.discard(key)
+            return None
+        with self.lock:
+            self.hits += 1
+        depends_on(entry.tables)
+        return entry
+
+    def get_or_compute(self, key, compute, tables=()):
+        entry = self.lookup(key)
+        if entry is not None:
+            return entry.value
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                return self._compute(key, compute, tables)
+        finally:
+            with self.lock:
+                self.key_locks.pop(key, None)
+
+    def _compute(self, key, compute, tables):
+        """``get_or_compute`` once the key's lock is held."""
+        entry = self.lookup(key)
+        if entry is not None:
+            return entry.value
+        if self.persist:
+            result = self.load(key)
+            if result is not None:
+                return result
+        with self.lock:
+            self.misses += 1
+        tables = set(tables)
+        stack = getattr(_reading, "stack", None)
+        if stack is None:
+            stack = _reading.stack = []
+        stack.append(tables)
+        try:
+            result = compute()
+        finally:
+            stack.pop()
+        depends_on(tables)
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            stamp(result, key, tables)
+        expires = self.expires()
+        store.put(key, Entry(self, result, expires, tables))
+        if self.persist and isinstance(result, pd.DataFrame):
+            try:
+                disk.put(self.name, key, result, expires, tables)
+            except (OSError, pa.ArrowException):
+                # The result is still cached in memory.
+                pass
+        return result
+
+    def load(self, key):
+        """Move a persisted result into the store; None if there is none."""
+        persisted = disk.get(self.name, key)
+        if persisted is None:
+            return None
+        result, expires, tables = persisted
+        with self.lock:
+            self.loaded += 1
+        depends_on(tables)
+        stamp(result, key, tables)
+        store.put(key, Entry(self, result, expires, tables))
+        return result
+
+    def clear(self):
+        store.clear(self)
+
+
+# Page scripts are re-executed on every rerun, redefining their functions;
+# caches are looked up by the function's file and name so they survive that.
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def function_cache(name, ttl, max_entries, persist=False):
+    """The ``FunctionCache`` registered as ``name``, with this policy.
+
+    For values kept in the store by other means than ``cached``.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = FunctionCache(name, ttl, max_entries, persist)
+        cache = _caches[name]
+        cache.ttl, cache.max_entries, cache.persist = ttl, max_entries, persist
+        return cache
+
+
+def _function_cache(func, ttl, max_entries, persist):
+    name = f"{os.path.basename(func.__code__.co_filename)}:{func.__qualname__}"
+    return function_cache(name, ttl, max_entries, persist)
+
+
+# Whether the calling thread's last cached call was served from the store.
+_outcome = threading.local()
+
+
+def last_hit():
+    return getattr(_outcome, "hit", None)
+
+
+def cached(
+    func=None, *, ttl=REFRESH, max_entries=config.CACHE_MAX_ENTRIES, persist=False
+):
+    """Memoise ``func`` in the process-wide store, keyed on fingerprints.
+
+    Usable bare or with arguments. Concurrent calls with the same key
+    compute the result once.
+
+    :param ttl: seconds to keep a result, ``REFRESH`` (the default) to keep
+        it until the next nightly refresh, or None for no expiry.
+    :param max_entries: results kept for this function, or None.
+    :param persist: also keep DataFrame results on disk (``DiskStore``),
+        with the same expiry.
+    """
+    if func is None:
+        return functools.partial(
+            cached, ttl=ttl, max_entries=max_entries, persist=persist
+        )
+    cache = _function_cache(func, ttl, max_entries, persist)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key, tables = cache.key(args, kwargs)
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return func(*args, **kwargs)
+
+        result = cache.get_or_compute(key, compute, tables)
+        _outcome.hit = not computed
+        return result
+
+    wrapper.clear = cache.clear
+    wrapper.function_cache = cache
+    return wrapper
+
+
+def stats():
+    """Counters, entry counts and memory per cached function."""
+    with _caches_lock:
+        caches = sorted(_caches.items())
+    columns = ["function", "hits", "loaded", "misses", "hashed", "expired", "evicted"]
+    rows = [[name] + [getattr(c, col) for col in columns[1:]] for name, c in caches]
+    res = pd.DataFrame(rows, columns=columns)
+    res["entries"] = [c.entries for _, c in caches]
+    res["MB"] = [c.bytes / 2**20 for _, c in caches]
+    return res
@@ -0,0 +1,135 @@
+"""Assign learners to campaigns.
+
+A campaign covers the learners of one app, in one country or in all
+countries ("All"), whose LA_date falls between its start and end dates.
+``LearnerIndex`` sorts the learners once by (app, country, LA_date) and by
+(app, LA_date); each campaign window is then two ``searchsorted`` lookups,
+so resolving every campaign costs about as much as resolving one.
+"""
+import numpy as np
+import pandas as pd
+
+ALL_COUNTRIES = "All"
+
+
+def campaign_windows(campaigns, apps):
+    """One row per campaign with its app_id, country, date window and cost.
+
+    :param campaigns: rows of the campaign sheet.
+    :param apps: rows of the apps sheet, used to map Language to app_id.
+    """
+    app_ids = apps.drop_duplicates("language").set_index("language")["app_id"]
+    return pd.DataFrame(
+        {
+            "campaign": campaigns["Campaign Name"].to_numpy(),
+            "app_id": campaigns["Language"].map(app_ids).to_numpy(),
+            "country": campaigns["Country"].to_numpy(),
+            "start": pd.to_datetime(campaigns["Start Date"]).to_numpy(),
+            "end": pd.to_datetime(campaigns["End Date"]).to_numpy(),
+            "cost": campaigns["Total Cost (USD)"].to_numpy(dtype=float),
+        }
+    )
+
+
+def _days(values):
+    return pd.to_datetime(values).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+class LearnerIndex:
+    def __init__(self, learners):
+        self.learners = learners
+        days = _days(learners["LA_date"])
+        self.app_codes, self.apps = pd.factorize(
+            learners["app_id"], use_na_sentinel=False
+        )
+        self.country_codes, self.countries = pd.factorize(
+            learners["country"], use_na_sentinel=False
+        )
+        self.min_day = days.min() if len(days) else 0
+        # Width of one (app) or (app, country) block of the composite keys.
+        self.span = (days.max() - self.min_day + 1) if len(days) else 1
+        offset = days - self.min_day
+
+        by_country = (
+            self.app_codes * len(self.countries) + self.country_codes
+        ) * self.span + offset
+        self.country_order = np.argsort(by_country, kind="stable")
+        self.country_keys = by_country[self.country_order]
+
+        by_app = self.app_codes * self.span + offset
+        self.app_order = np.argsort(by_app, kind="stable")
+        self.app_keys = by_app[self.app_order]
+
+    @property
+    def nbytes(self):
+        """Memory held by the index itself, not counting the learners."""
+        arrays = (
+            self.app_codes,
+            self.country_codes,
+            self.country_order,
+            self.country_keys,
+            self.app_order,
+            self.app_keys,
+        )
+        return sum(a.nbytes for a in arrays)
+
+    def _offsets(self, windows):
+        start = np.clip(_days(windows["start"]) - self.min_day, 0, self.span)
+        end = np.clip(_days(windows["end"]) - self.min_day, -1, self.span - 1)
+        return start, end
+
+    def _ranges(self, windows):
+        """Positions in the sorted orders covered by each window."""
+        n = len(windows)
+        lo = np.zeros(n, dtype=np.int64)
+        hi = np.zeros(n, dtype=np.int64)
+        use_country_order = np.zeros(n, dtype=bool)
+        if not n:
+            return lo, hi, use_country_order
+
+        app = self.apps.get_indexer(windows["app_id"])
+        country = self.countries.get_indexer(windows["country"])
+        all_countries = (windows["country"] == ALL_COUNTRIES).to_numpy()
+        known = (app >= 0) & windows["app_id"].notna().to_numpy()
+        known &= all_countries | (country >= 0)
+        start, end = self._offsets(windows)
+
+        sel = known & all_countries
+        base = app[sel] * self.span
+        lo[sel] = np.searchsorted(self.app_keys, base + start[sel], side="left")
+        hi[sel] = np.searchsorted(self.app_keys, base + end[sel], side="right")
+
+        sel = known & ~all_countries
+        base = (app[sel] * len(self.countries) + country[sel]) * self.span
+        lo[sel] = np.searchsorted(self.country_keys, base + start[sel], side="left")
+        hi[sel] = np.searchsorted(self.country_keys, base + end[sel], side="right")
+        use_country_order[sel] = True
+
+        hi = np.maximum(hi, lo)
+        return lo, hi, use_country_order
+
+    def select(self, windows):
+        """Learners inside each window, with a ``campaign`` column.
+
+        Learners covered by several (overlapping) campaigns appear once per
+        campaign.
+        """
+        lo, hi, use_country_order = self._ranges(windows)
+        lengths = hi - lo
+        total = int(lengths.sum())
+        starts = np.repeat(lo, lengths)
+        within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = starts + within
+        from_country_order = np.repeat(use_country_order, lengths)
+        rows = np.where(
+            from_country_order,
+            self.country_order[np.minimum(positions, len(self.country_order) - 1)],
+            self.app_order[np.minimum(positions, len(self.app_order) - 1)],
+        )
+        res = self.learners.iloc[rows].reset_index(drop=True)
+        res["campaign"] = np.repeat(windows["campaign"].to_numpy(), lengths)
+        return res
+
+
+def assign_campaigns(learners, windows):
+    return LearnerIndex(learners).select(windows)
@@ -0,0 +1,72 @@
+"""Process-wide Google credentials, BigQuery client and Sheets session.
+
+Streamlit re-executes every page script on each widget interaction, so
+anything built at module level in a page is rebuilt on every rerun of every
+session. The objects here are created once per server process, on first use,
+and shared by all sessions.
+"""
+import threading
+
+import streamlit as st
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+
+SHEETS_SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets.readonly",
+    # Drive file versions tell whether a sheet changed since it was cached.
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+
+# Sized for several concurrent sessions querying at once.
+HTTP_POOL_SIZE = 32
+
+_lock = threading.RLock()
+_credentials = {}
+_bq_client = None
+_sheets_session = None
+
+
+def get_credentials(scopes=None):
+    key = tuple(scopes or ())
+    with _lock:
+        if key not in _credentials:
+            _credentials[key] = service_account.Credentials.from_service_account_info(
+                st.secrets["gcp_service_account"], scopes=scopes
+            )
+        return _credentials[key]
+
+
+def authorized_session(credentials):
+    """A requests session with a connection pool large enough to be shared."""
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_bq_client():
+    global _bq_client
+    with _lock:
+        if _bq_client is None:
+            credentials = get_credentials(bigquery.Client.SCOPE)
+            _bq_client = bigquery.Client(
+                project=credentials.project_id,
+                credentials=credentials,
+                _http=authorized_session(credentials),
+            )
+        return _bq_client
+
+
+def get_sheets_session():
+    global _sheets_session
+    with _lock:
+        if _sheets_session is None:
+            _sheets_session = authorized_session(get_credentials(SHEETS_SCOPES))
+        return _sheets_session
+
+
+def sheet_urls(sheets):
+    """URLs of ``sheets`` (name to ``ftm.sheets.Sheet``) from the app secrets."""
+    return {name: st.secrets[sheet.secret] for name, sheet in sheets.items()}
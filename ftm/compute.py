@@ -0,0 +1,246 @@
+"""Page metrics as plain functions, usable without Streamlit.
+
+Shared by the pages, the benchmark (``ftm.bench``) and the cache warmer
+(``ftm.warm``). The first half are transforms of learner, cube or daily
+frames. The second half load from the data backend and cache their results
+in ``ftm.cache``; the small per-selection results (daily LA, country
+rollups, RA deciles, cube slices, reading activity) are persisted, so that
+``python -m ftm.warm`` can compute them for every campaign and year right
+after the nightly refresh and the pages find them on disk.
+
+Cached results are shared: callers must not modify them in place.
+"""
+import numpy as np
+import pandas as pd
+from google.cloud import bigquery
+
+from ftm import cube
+from ftm.activity import daily_activity_sql, learner_set
+from ftm.backend import get_backend
+from ftm.cache import cached
+from ftm.campaigns import LearnerIndex
+from ftm.filters import sql_filter
+from ftm.geo import country_index
+from ftm.profiler import profiled
+from ftm.segments import ra_segments
+from ftm.snapshot import load_ftm_users
+from ftm.timeseries import normalized_start, rolling_means
+
+# Rolling mean columns of the daily LA charts, and their windows in days.
+LA_WINDOWS = {"Weekly Rolling Mean": 7, "Monthly Rolling Mean": 30}
+
+
+def year_learners(users, first, last):
+    """Learners acquired from year ``first`` to ``last``, by ``campaign`` year."""
+    res = users[users["LA_date"].dt.year.between(first, last, inclusive="both")]
+    return res.assign(campaign=res["LA_date"].dt.year)
+
+
+def daily_la(users, by="campaign", name="LA"):
+    """Learners acquired per ``by`` group and day."""
+    return (
+        users.groupby([by, "LA_date"])["user_pseudo_id"].count().reset_index(name=name)
+    )
+
+
+def country_la(users, name="LA"):
+    """Learners acquired per country (``geo.CountryIndex.rollup``)."""
+    return country_index().rollup(users["country"], name=name)
+
+
+def normalize(daily, by="campaign"):
+    """Daily LA with ``LA_date`` counting days from each group's start.
+
+    The dates are kept as ``orig_date``.
+    """
+    res = normalized_start(daily, by=by)
+    return res.rename(columns={"LA_date": "orig_date", "day": "LA_date"})
+
+
+def average_total_levels(apps):
+    """Mean number of levels over apps, ignoring apps without levels."""
+    return np.nanmean(apps["total_lvls"].replace(0, np.nan))
+
+
+def ra_deciles(users, total_lvls, by=None, cost=None, weight=None):
+    """``ra_segments`` with the share of LA rounded for display."""
+    res = ra_segments(users, total_lvls, by=by, cost=cost, weight=weight)
+    res["la_perc"] = round(res["la_perc"], 2)
+    return res
+
+
+def acquisition_costs(spend, la, ra):
+    """LAC (spend per learner) and RAC (spend per learner times RA)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return spend / la, spend / (ra * la)
+
+
+def learner_metrics(users, windows, total_lvls):
+    """LA, RA, LAC and RAC per campaign, shaped like the metrics sheet.
+
+    :param users: learners with a ``campaign`` column, as selected by
+        ``LearnerIndex.select(windows)``.
+    :param windows: ``campaign_windows``, which holds the costs.
+    :param total_lvls: total levels used as the RA denominator.
+    """
+    campaigns = windows.drop_duplicates("campaign").set_index("campaign")
+    grouped = users.groupby("campaign")["max_lvl"]
+    res = pd.DataFrame(
+        {
+            "la": grouped.size().reindex(campaigns.index, fill_value=0),
+            "ra": (grouped.mean() / total_lvls).reindex(campaigns.index),
+        }
+    )
+    res["lac"], res["rac"] = acquisition_costs(campaigns["cost"], res["la"], res["ra"])
+    return res.rename_axis("campaign_name").reset_index()
+
+
+def query_daily_activity(backend, start_date, end_date, apps, countries=None):
+    """Levels played per day by the learners acquired between two dates.
+
+    :param apps: app ids, or a ``filters.Predicate`` on them; None for all.
+    :param countries: countries, or a ``filters.Predicate``; None for all.
+    """
+    # Learners of the selection, joined server-side rather than sent as ids.
+    learners_sql, learner_params = learner_set(start_date, end_date, apps, countries)
+    conditions = [
+        condition
+        for condition in (
+            sql_filter("app_id", "apps", apps),
+            sql_filter("country", "countries", countries),
+        )
+        if condition is not None
+    ]
+    sql_query = daily_activity_sql(learners_sql, [sql for sql, _ in conditions])
+    query_parameters = [
+        bigquery.ScalarQueryParameter("start", "DATE", start_date),
+        bigquery.ScalarQueryParameter(
+            "end", "DATE", pd.to_datetime("today").date() - pd.Timedelta(1, unit="D")
+        ),
+    ] + [param for _, param in conditions]
+    df = backend.query_df(sql_query, query_parameters + learner_params)
+    df["event_date"] = pd.to_datetime(df["event_date"])
+    return df
+
+
+# --- Cached, from the data backend ---
+
+
+@profiled
+@cached(max_entries=1)
+def ftm_users():
+    """Every learner, from the latest ``ftm_users`` snapshot."""
+    return load_ftm_users(get_backend())
+
+
+@profiled
+@cached(max_entries=1)
+def learner_index():
+    return LearnerIndex(ftm_users())
+
+
+@profiled
+@cached(max_entries=2)
+def annual_learners(first, last):
+    return year_learners(ftm_users(), first, last)
+
+
+@profiled
+@cached(persist=True)
+def annual_daily_la(first, last):
+    return daily_la(annual_learners(first, last))
+
+
+@profiled
+@cached(persist=True)
+def annual_country_la(first, last):
+    return country_la(annual_learners(first, last))
+
+
+@profiled
+@cached(persist=True)
+def annual_ra_deciles(years, total_lvls):
+    """RA deciles per year, for the selected ``years`` only.
+
+    Unlike the Daily LA and the map, which cover every year from the first
+    selected to the last, years in between that are not selected are left
+    out.
+    """
+    users = annual_learners(min(years), max(years))
+    users = users[users["campaign"].isin(years)]
+    return ra_deciles(users, total_lvls, by="campaign")
+
+
+@profiled
+@cached(max_entries=2)
+def campaign_learners(windows):
+    """Learners of each campaign of ``windows`` (``campaign_windows``)."""
+    return learner_index().select(windows)
+
+
+@profiled
+@cached(persist=True)
+def campaign_daily_la(windows):
+    return daily_la(campaign_learners(windows))
+
+
+@profiled
+@cached(persist=True)
+def campaign_ra_deciles(windows, total_lvls):
+    costs = windows.drop_duplicates("campaign").set_index("campaign")["cost"]
+    res = ra_deciles(campaign_learners(windows), total_lvls, by="campaign", cost=costs)
+    res["campaign_cost"] = round(res["campaign"].map(costs), 2)
+    return res
+
+
+@profiled
+@cached(persist=True)
+def campaign_metrics(windows, total_lvls):
+    return learner_metrics(campaign_learners(windows), windows, total_lvls)
+
+
+@profiled
+@cached(persist=True)
+def la_cube(start_date, end_date, apps=None, countries=None):
+    """The LA cube by ``max_lvl`` between two dates, for some apps and
+    countries.
+
+    :param apps: app ids, or a ``filters.Predicate`` on them; None for all.
+    :param countries: countries, or a ``filters.Predicate``; None for all.
+    """
+    start = start_date.strftime("%Y%m%d")
+    end = end_date.strftime("%Y%m%d")
+    return cube.load_la_cube(get_backend(), start, end, apps, countries)
+
+
+@profiled
+@cached(persist=True)
+def la_daily_cube(start_date, end_date, apps=None, countries=None):
+    """Like ``la_cube``, without ``max_lvl``: for the total, daily and
+    country LA."""
+    start = start_date.strftime("%Y%m%d")
+    end = end_date.strftime("%Y%m%d")
+    return cube.load_la_daily_cube(get_backend(), start, end, apps, countries)
+
+
+@profiled
+@cached(persist=True)
+def daily_activity(start_date, end_date, apps, countries=None):
+    return query_daily_activity(get_backend(), start_date, end_date, apps, countries)
+
+
+# Cached in memory only: they are quick to recompute from the above.
+
+
+@profiled
+@cached
+def la_views(daily, norm=False):
+    """Daily LA per campaign, gap-filled, with every ``LA_WINDOWS`` mean.
+
+    Cached, so switching between the daily and rolling views is free.
+
+    :param daily: ``daily_la`` rows.
+    :param norm: count ``LA_date`` in days from each campaign's start.
+    """
+    res = rolling_means(daily, "LA", LA_WINDOWS, by="campaign")
+    return normalize(res) if norm else res
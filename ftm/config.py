@@ -0,0 +1,53 @@
+"""Runtime settings shared by the dashboard pages and the nightly jobs.
+
+Everything can be overridden with environment variables so the same code runs
+on Streamlit Cloud, on a laptop and from cron.
+"""
+import os
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Local working directory for snapshots and other on-disk caches.
+DATA_DIR = os.environ.get("FTM_DATA_DIR", os.path.join(ROOT_DIR, ".ftm_data"))
+
+# Where the data comes from: "bigquery" (BigQuery and Google Sheets) or
+# "local" (DuckDB fixtures written by python -m ftm.fixtures).
+BACKEND = os.environ.get("FTM_BACKEND", "bigquery")
+LOCAL_DB = os.environ.get("FTM_LOCAL_DB", os.path.join(DATA_DIR, "fixtures.duckdb"))
+
+# Number of snapshot versions kept on disk per table.
+SNAPSHOT_KEEP = int(os.environ.get("FTM_SNAPSHOT_KEEP", "2"))
+
+# Time of day (UTC, HH:MM) by which the nightly refresh has finished. Cached
+# learner data expires at the next occurrence of this time.
+REFRESH_TIME_UTC = os.environ.get("FTM_REFRESH_TIME_UTC", "07:00")
+
+# Cached results are checked against the latest version of the snapshot
+# tables they were computed from at most this often, so a refresh that ends
+# after REFRESH_TIME_UTC is picked up within minutes.
+SNAPSHOT_CHECK_SECONDS = int(os.environ.get("FTM_SNAPSHOT_CHECK_SECONDS", "300"))
+
+# Upper bound on the memory held by ftm.cache across all functions.
+CACHE_MEMORY_MB = int(os.environ.get("FTM_CACHE_MEMORY_MB", "2048"))
+
+# Default number of results kept per cached function.
+CACHE_MAX_ENTRIES = int(os.environ.get("FTM_CACHE_MAX_ENTRIES", "16"))
+
+# Number of results kept on disk per persisted function. Higher than the
+# in-memory limit, since ftm.warm writes one per campaign and year.
+CACHE_DISK_MAX_ENTRIES = int(os.environ.get("FTM_CACHE_DISK_MAX_ENTRIES", "512"))
+
+# Points a time series chart ships to the browser at most, shared among its
+# lines; longer series are downsampled. Charts with more points than
+# WEBGL_POINTS are drawn with WebGL (Scattergl) rather than SVG.
+CHART_POINT_BUDGET = int(os.environ.get("FTM_CHART_POINT_BUDGET", "5000"))
+WEBGL_POINTS = int(os.environ.get("FTM_WEBGL_POINTS", "2000"))
+
+# Google Sheets are edited by hand during the day.
+SHEETS_TTL_SECONDS = int(os.environ.get("FTM_SHEETS_TTL_SECONDS", "900"))
+
+# Dataset for short-lived tables staged by queries, and their lifetime.
+STAGING_DATASET = os.environ.get(
+    "FTM_STAGING_DATASET", "dataexploration-193817.user_data"
+)
+STAGING_EXPIRATION_HOURS = int(os.environ.get("FTM_STAGING_EXPIRATION_HOURS", "6"))
@@ -0,0 +1,256 @@
+"""Plotly figure builders shared by the pages and the benchmark.
+
+Each builder takes the frame the page has computed and returns a figure
+without rendering it, so building can be timed on its own (``ftm.bench``).
+
+Builders are wrapped in ``cached_figure``: the figure's JSON is kept in the
+``ftm.cache`` store, keyed on the fingerprints of the frames and on the
+other arguments, so a rerun that only changed an unrelated widget does not
+go through plotly.express again.
+
+Daily series are downsampled to ``config.CHART_POINT_BUDGET`` points
+(``timeseries.downsample``) after their rolling means are taken
+(``timeseries.rolling_means``), and drawn with WebGL when they still have
+more than ``config.WEBGL_POINTS``.
+"""
+import functools
+import json
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from ftm import config
+from ftm.cache import cached
+from ftm.profiler import profiled
+from ftm.timeseries import downsample, rolling_means
+
+MAP_COLORS = ["#1584A3", "#DB830F", "#E6DF15"]  # blue, orange, yellow
+
+
+def from_json(spec):
+    # The JSON was produced from a validated figure; validating it again
+    # would cost most of what building it did.
+    return go.Figure(json.loads(spec), _validate=False)
+
+
+def cached_figure(builder):
+    """Cache the JSON of the figure(s) ``builder`` returns.
+
+    Each call returns new figures, which callers may modify.
+    """
+
+    def build(*args, **kwargs):
+        res = builder(*args, **kwargs)
+        figs = res if isinstance(res, tuple) else (res,)
+        return tuple(pio.to_json(fig, validate=False) for fig in figs)
+
+    # Cached functions are told apart by their name.
+    build.__qualname__ = builder.__qualname__
+    build = cached(build)
+
+    @functools.wraps(builder)
+    def wrapper(*args, **kwargs):
+        figs = tuple(from_json(spec) for spec in build(*args, **kwargs))
+        return figs if len(figs) > 1 else figs[0]
+
+    wrapper.clear = build.clear
+    wrapper.function_cache = build.function_cache
+    return wrapper
+
+
+def render_mode(points):
+    return "webgl" if points > config.WEBGL_POINTS else "svg"
+
+
+# View: (column of ``compute.la_views``, title).
+LA_VIEWS = {
+    "Daily LA": ("LA", "Daily LA"),
+    "Weekly LA Rolling Mean": ("Weekly Rolling Mean", "Weekly LA"),
+    "Monthly LA Rolling Mean": ("Monthly Rolling Mean", "Monthly LA"),
+}
+
+
+@profiled
+@cached_figure
+def campaign_la(daily_la, view="Daily LA", norm=False):
+    """Daily LA per campaign (or year), raw or as a rolling mean.
+
+    :param daily_la: ``compute.la_views`` rows; ``daily_la`` rows will do
+        for the daily view.
+    :param view: one of ``LA_VIEWS``.
+    :param norm: ``LA_date`` holds days since each campaign's start
+        (``normalized_start``) rather than dates.
+    """
+    y, title = LA_VIEWS[view]
+    days = len(daily_la)
+    daily_la = downsample(
+        daily_la, "LA_date", y, config.CHART_POINT_BUDGET, by="campaign"
+    )
+    fig = px.line(
+        daily_la,
+        x="LA_date",
+        y=y,
+        color="campaign",
+        render_mode=render_mode(len(daily_la)),
+        labels={
+            "LA_date": "Day" if norm else "Date",
+            "campaign": "Campaign",
+            y: "LA",
+        },
+        title=title,
+    )
+    if norm:
+        fig.update_xaxes(
+            tickmode="array",
+            tickvals=np.arange(0, days, 30),
+            ticktext=np.arange(0, 13, 1),
+        )
+        fig.update_layout(xaxis_title="Date (Month)")
+    return fig
+
+
+@profiled
+@cached_figure
+def daily_la_rolling(daily_la):
+    """Daily LA of one selection with its 7 and 30 day rolling means.
+
+    :param daily_la: rows of ``LA_date`` and ``Learners Acquired``; days
+        without any count as 0.
+    """
+    daily_la = rolling_means(
+        daily_la,
+        "Learners Acquired",
+        {"7 Day Rolling Mean": 7, "30 Day Rolling Mean": 30},
+    )
+    # Three lines share the budget.
+    daily_la = downsample(
+        daily_la, "LA_date", "Learners Acquired", config.CHART_POINT_BUDGET // 3
+    )
+    mode = render_mode(3 * len(daily_la))
+    fig = px.line(
+        daily_la,
+        x="LA_date",
+        y="Learners Acquired",
+        render_mode=mode,
+        labels={"LA_date": "Date", "Learners Acquired": "LA"},
+        title="Daily LA",
+    )
+    rm_fig = px.line(
+        daily_la,
+        x="LA_date",
+        y=["7 Day Rolling Mean", "30 Day Rolling Mean"],
+        render_mode=mode,
+        color_discrete_map={
+            "7 Day Rolling Mean": "green",
+            "30 Day Rolling Mean": "red",
+        },
+    )
+    fig.add_trace(rm_fig.data[0])
+    fig.add_trace(rm_fig.data[1])
+    return fig
+
+
+@profiled
+@cached_figure
+def country_map(country_la, color="LA", labels=None, fitbounds=False):
+    """LA per country, placed by ISO-3 code.
+
+    :param country_la: a ``geo.CountryIndex.rollup``; the rows without a
+        code are left out (see ``geo.unmatched_note``).
+    """
+    fig = px.choropleth(
+        country_la.dropna(subset=["iso_alpha"]),
+        locations="iso_alpha",
+        color=color,
+        hover_name="country",
+        hover_data={"iso_alpha": False},
+        color_continuous_scale=MAP_COLORS,
+        locationmode="ISO-3",
+        labels=labels,
+        title="LA by Country",
+    )
+    fig.update_layout(geo=dict(bgcolor="rgba(0,0,0,0)"))
+    if fitbounds:
+        fig.update_geos(fitbounds="locations")
+    return fig
+
+
+@profiled
+@cached_figure
+def ra_deciles(ra_segs, title, labels, **kwargs):
+    """Share of LA per RA decile; ``kwargs`` go to ``px.bar``."""
+    return px.bar(ra_segs, x="seg", y="la_perc", labels=labels, title=title, **kwargs)
+
+
+@profiled
+@cached_figure
+def levels_played(daily_activity):
+    """Levels played per day, as bars and as sized points."""
+    bars = px.bar(
+        daily_activity,
+        x="event_date",
+        y="levels_played",
+        labels={"event_date": "Date", "levels_played": "# Levels Played"},
+    )
+    points = px.scatter(
+        daily_activity,
+        x="event_date",
+        y="levels_played",
+        size="levels_played",
+        title="Levels Played Over Time",
+    )
+    return bars, points
+
+
+@profiled
+@cached_figure
+def gantt(campaigns):
+    fig = px.timeline(
+        campaigns,
+        x_start="Start Date",
+        x_end="End Date",
+        y="Campaign Name",
+        color="Campaign Name",
+        hover_data=["Total Cost (USD)", "la"],
+        labels={"Campaign Name": "Campaign", "la": "LA"},
+        title="Gantt Chart",
+    )
+    fig.update_layout(showlegend=False)
+    return fig
+
+
+@profiled
+@cached_figure
+def quadrant(metrics, x, y, labels, title, box):
+    """Campaigns scattered on two metrics, sized by age, with a target box.
+
+    :param box: ``(x0, x1, y0, y1)`` of the highlighted quadrant, in axis
+        domain fractions.
+    """
+    fig = px.scatter(
+        metrics,
+        x=x,
+        y=y,
+        color="campaign_name",
+        size="camp_age",
+        labels={
+            **labels,
+            "camp_age": "Campaign Age (Days)",
+            "campaign_name": "Campaign",
+        },
+        title=title,
+    )
+    x0, x1, y0, y1 = box
+    fig.add_shape(
+        type="rect",
+        xref="x domain",
+        yref="y domain",
+        x0=x0,
+        x1=x1,
+        y0=y0,
+        y1=y1,
+        line=dict(color="LightGreen", width=3),
+    )
+    return fig
@@ -0,0 +1,76 @@
+"""Normalized IN-list predicates for the pages' multiselects.
+
+Manual Analysis starts with every language and country selected. Sent as
+is, that is two long ``IN`` lists whose order follows the widgets, so the
+query is no cheaper than a date-only one and reordering a selection misses
+the cache. ``plan`` canonicalizes a selection against the options it was
+picked from: everything selected is no predicate at all, otherwise the
+values are sorted and deduplicated.
+
+A partial selection always means "only these". The data also holds values
+that are not among the options (GA4's "(not set)", missing countries); an
+exclude list would keep them, so deselecting one country would bring them
+in and deselecting a second would drop them again. ``plan`` therefore only
+sends the shorter exclude list when the options are ``closed``, i.e. cover
+every value the column can hold, which makes both forms equivalent. An
+exclude list itself keeps NULLs, in Parquet as in SQL.
+"""
+import collections
+
+from google.cloud import bigquery
+
+# ``op`` is "in" or "not in"; ``values`` is a sorted tuple.
+Predicate = collections.namedtuple("Predicate", ["op", "values"])
+
+
+def plan(selected, options, closed=False):
+    """The predicate selecting ``selected`` out of ``options``, or None.
+
+    :param selected: values picked, in any order, possibly repeated.
+    :param options: every value that could have been picked.
+    :param closed: whether the column only ever holds ``options``; only then
+        may the predicate be an exclude list.
+    """
+    selected = sorted(set(selected))
+    excluded = sorted(set(options).difference(selected))
+    if not excluded:
+        return None
+    if closed and len(excluded) < len(selected):
+        return Predicate("not in", tuple(excluded))
+    return Predicate("in", tuple(selected))
+
+
+def predicate(values):
+    """``values`` as a Predicate: None stays None, a list is an include list."""
+    if values is None or isinstance(values, Predicate):
+        return values
+    return Predicate("in", tuple(sorted(set(values))))
+
+
+def parquet_filter(column, values):
+    """``pyarrow.parquet`` filter conditions on ``column``, to be ANDed.
+
+    Empty for all values.
+    """
+    values = predicate(values)
+    if values is None:
+        return []
+    if not values.values and values.op == "in":
+        # pyarrow cannot infer the type of an empty list; nothing matches.
+        return [(column, "=", ""), (column, "!=", "")]
+    return [(column, values.op, list(values.values))]
+
+
+def sql_filter(column, name, values):
+    """A BigQuery condition on ``column`` and its ``@name`` array parameter.
+
+    Returns None for all values. Like ``parquet_filter``, an exclude list
+    keeps NULLs.
+    """
+    values = predicate(values)
+    if values is None:
+        return None
+    param = bigquery.ArrayQueryParameter(name, "STRING", list(values.values))
+    if values.op == "not in":
+        return f"({column} IS NULL OR {column} NOT IN UNNEST(@{name}))", param
+    return f"{column} IN UNNEST(@{name})", param
@@ -0,0 +1,428 @@
+"""Synthetic fixtures for the local backend.
+
+Generates learners with skewed app, country and acquisition-date
+distributions and a realistic drop-off in ``max_lvl``, and writes
+``ftm_users``, the LA cubes and the metadata sheets to a DuckDB file that
+``LocalBackend`` reads. With ``events`` it also generates every learner's
+LevelSuccess/LevelFail events, consistent with their ``ftm_users`` row, and
+derives ``ftm_daily_activity`` from them. Table names are the production
+table ids, so the pages' SQL runs unchanged.
+
+Learners are generated as NumPy and Arrow columns, so tens of millions of
+rows take seconds; events are about fifteen rows per learner and are best
+left out at that scale.
+
+    python -m ftm.fixtures                       # config.LOCAL_DB
+    python -m ftm.fixtures --learners 10000000 --no-events --out /tmp/ftm.duckdb
+"""
+import argparse
+import datetime
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ftm import activity, config, cube, sheets
+from ftm.backend import sheet_table
+from ftm.snapshot import FTM_USERS_TABLE
+
+# The flattened LevelSuccess/LevelFail events, shaped like the refresh's
+# ``gameplay`` temp table.
+GAMEPLAY_TABLE = "dataexploration-193817.user_data.ftm_gameplay"
+
+# (language, app_id, total_lvls, bq_project_id, bq_property_id), most
+# learners first.
+APPS = [
+    (
+        "English",
+        "org.curiouslearning.ftm_english",
+        50,
+        "ftm-english",
+        "analytics_152408808",
+    ),
+    ("Hindi", "org.curiouslearning.ftm_hindi", 45, "ftm-hindi", "analytics_174638281"),
+    (
+        "Portuguese",
+        "org.curiouslearning.ftm_brazilian_portuguese",
+        40,
+        "ftm-brazilian-portuguese",
+        "analytics_161789655",
+    ),
+    (
+        "Spanish",
+        "org.curiouslearning.ftm_spanish",
+        45,
+        "ftm-spanish",
+        "analytics_158656398",
+    ),
+    (
+        "French",
+        "org.curiouslearning.ftm_french",
+        40,
+        "ftm-french",
+        "analytics_173880465",
+    ),
+    (
+        "Swahili",
+        "org.curiouslearning.ftm_swahili",
+        35,
+        "ftm-swahili",
+        "analytics_160694316",
+    ),
+    (
+        "Somali",
+        "org.curiouslearning.ftm_somali",
+        30,
+        "ftm-somali",
+        "analytics_159630038",
+    ),
+    ("Zulu", "org.curiouslearning.ftm_zulu", 30, "ftm-zulu", "analytics_155849122"),
+    (
+        "Afrikaans",
+        "org.curiouslearning.ftm_afrikaans",
+        30,
+        "ftm-afrikaans",
+        "analytics_177200876",
+    ),
+    ("Oromo", "org.curiouslearning.ftm_oromo", 30, "ftm-oromo", "analytics_167539175"),
+]
+# Country names as GA4 reports them, most learners first. Some differ from
+# countries.csv, as they do in production.
+COUNTRIES = [
+    "India",
+    "United States",
+    "Brazil",
+    "Nigeria",
+    "Pakistan",
+    "South Africa",
+    "Kenya",
+    "Mexico",
+    "Philippines",
+    "Bangladesh",
+    "Egypt",
+    "Ethiopia",
+    "Tanzania",
+    "Indonesia",
+    "Somalia",
+    "Colombia",
+    "France",
+    "Congo - Kinshasa",
+    "Côte d’Ivoire",
+    "United Kingdom",
+    "Ghana",
+    "Uganda",
+    "Peru",
+    "Türkiye",
+    "(not set)",
+]
+
+
+def _zipf(n, s):
+    weights = 1 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def learners(n, days, seed=0):
+    """Columns of ``n`` random learners acquired over ``days`` days.
+
+    Acquisition grows over the period with a weekly cycle; apps and
+    countries follow Zipf-like shares. Most learners stop after a few
+    levels, and about one in twenty completes the app.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    daily = (1 + 2 * t / days) * (1 + 0.15 * np.sin(2 * np.pi * t / 7))
+    la_day = np.sort(rng.choice(days, size=n, p=daily / daily.sum()))
+    app = rng.choice(len(APPS), size=n, p=_zipf(len(APPS), 0.8))
+    country = rng.choice(len(COUNTRIES), size=n, p=_zipf(len(COUNTRIES), 1.1))
+    total_lvls = np.array([a[2] for a in APPS])[app]
+    max_lvl = np.where(
+        rng.random(n) < 0.05,
+        total_lvls,
+        np.minimum(rng.geometric(0.12, size=n), total_lvls),
+    )
+    # Days per level; the last level reached sets max_lvl_date.
+    pace = rng.uniform(0.2, 1.5, size=n)
+    return {
+        "id": pc.binary_join_element_wise(
+            pc.cast(pa.array(rng.integers(10**9, 10**10, size=n)), pa.string()),
+            pc.cast(pa.array(rng.integers(10**9, 10**10, size=n)), pa.string()),
+            ".",
+        ),
+        "app": app,
+        "country": country,
+        "la_day": la_day,
+        "max_lvl": max_lvl,
+        "pace": pace,
+        "max_lvl_day": np.minimum(
+            la_day + np.floor((max_lvl - 1) * pace).astype(np.int64), days - 1
+        ),
+        "replays": rng.poisson(max_lvl * 0.3),
+        "fails": rng.poisson(max_lvl * 0.4),
+    }
+
+
+def _dates(start, day):
+    """``YYYYMMDD`` strings of day offsets from ``start``."""
+    calendar = np.datetime64(start, "D") + np.arange(int(day.max(initial=0)) + 1)
+    calendar = np.char.replace(np.datetime_as_string(calendar), "-", "")
+    return pc.take(pa.array(calendar, pa.string()), pa.array(day))
+
+
+def _names(values, codes):
+    return pc.take(pa.array(values, pa.string()), pa.array(codes))
+
+
+def users_table(cohort, start):
+    """``ftm_users`` rows of ``cohort``, ordered by LA_date as in BigQuery."""
+    return pa.table(
+        {
+            "user_pseudo_id": cohort["id"],
+            "LA_date": _dates(start, cohort["la_day"]),
+            "app_id": _names([a[1] for a in APPS], cohort["app"]),
+            "country": _names(COUNTRIES, cohort["country"]),
+            "max_lvl": pa.array(cohort["max_lvl"], pa.int64()),
+            "max_lvl_date": _dates(start, cohort["max_lvl_day"]),
+            "total_lvls_succeeded": pa.array(
+                cohort["max_lvl"] + cohort["replays"], pa.int64()
+            ),
+        }
+    )
+
+
+def gameplay_table(cohort, start, seed=0):
+    """Every learner's LevelSuccess and LevelFail events.
+
+    Levels 1 to ``max_lvl`` are completed in order at the learner's pace, so
+    the first falls on LA_date and the last on max_lvl_date. Replays and
+    failed attempts fall between a level's first completion and
+    max_lvl_date, which leaves the refresh's view of the learner unchanged.
+    """
+    rng = np.random.default_rng(seed + 2)
+    max_lvl = cohort["max_lvl"]
+    replays = cohort["replays"]
+    counts = max_lvl + replays + cohort["fails"]
+    user = np.repeat(np.arange(len(max_lvl)), counts)
+    attempt = np.arange(len(user)) - np.repeat(np.cumsum(counts) - counts, counts)
+    user_max = max_lvl[user]
+    last_day = cohort["max_lvl_day"][user]
+    ordered = attempt < user_max
+    success = attempt < (max_lvl + replays)[user]
+
+    total_lvls = np.array([a[2] for a in APPS])[cohort["app"]][user]
+    top = np.where(success, user_max, np.minimum(user_max + 1, total_lvls))
+    lvl = np.where(ordered, attempt + 1, rng.integers(1, top + 1))
+    first_day = cohort["la_day"][user] + np.floor(
+        (np.minimum(lvl, user_max) - 1) * cohort["pace"][user]
+    ).astype(np.int64)
+    first_day = np.minimum(first_day, last_day)
+    later = np.floor(rng.random(len(user)) * (last_day - first_day + 1))
+    day = np.where(ordered, first_day, first_day + later.astype(np.int64))
+    # Replays of the top level keep max_lvl_date the first time it was reached.
+    day = np.where(success & ~ordered & (lvl == user_max), last_day, day)
+
+    action = pc.binary_join_element_wise(
+        pa.array(np.where(success, "LevelSuccess", "LevelFail")),
+        pc.cast(pa.array(lvl), pa.string()),
+        "_",
+    )
+    return pa.table(
+        {
+            "user_pseudo_id": pc.take(cohort["id"], pa.array(user)),
+            "event_date": _dates(start, day),
+            "app_id": _names([a[1] for a in APPS], cohort["app"][user]),
+            "country": _names(COUNTRIES, cohort["country"][user]),
+            "action": action,
+        }
+    )
+
+
+def daily_activity_table(gameplay):
+    """``activity.increment_sql`` over ``gameplay``, run in DuckDB."""
+    import duckdb
+
+    conn = duckdb.connect()
+    conn.register("gameplay", gameplay)
+    return conn.execute(
+        """
+SELECT strptime(event_date, '%Y%m%d')::DATE AS event_date, app_id, country,
+  user_pseudo_id,
+  COUNT(*) AS levels_played,
+  COUNT(*) FILTER (WHERE action LIKE '%LevelSuccess%') AS levels_succeeded,
+  COUNT(*) FILTER (WHERE action LIKE '%LevelFail%') AS levels_failed
+FROM gameplay
+GROUP BY 1, 2, 3, 4
+ORDER BY 1
+"""
+    ).to_arrow_table()
+
+
+def la_cube_table(users, table_id=cube.LA_CUBE):
+    """``cube.build_sql`` of one cube over an ``ftm_users`` table."""
+    keys = cube.KEYS[table_id]
+    counts = users.group_by(keys).aggregate([([], "count_all")])
+    counts = counts.rename_columns(
+        ["learners" if c == "count_all" else c for c in counts.column_names]
+    )
+    return counts.select(keys + ["learners"]).sort_by("LA_date")
+
+
+def _sheet_date(month):
+    day = month.item()
+    return f"{day.month}/{day.day}/{day.year}"
+
+
+def sheet_values(cohort, start, end, seed=0):
+    """The metadata sheets as rows of strings, header first.
+
+    Campaigns run one to four months on the twelve largest (app, country)
+    pairs; their metrics are computed from the learners they cover.
+    """
+    rng = np.random.default_rng(seed + 1)
+    apps = [list(sheets.APP_COLUMNS)]
+    for language, app_id, total, project, dataset in APPS:
+        apps.append([app_id, language, dataset, project, str(total)])
+
+    total_lvls = np.array([a[2] for a in APPS])[cohort["app"]]
+    ra = np.minimum(cohort["max_lvl"] / total_lvls, 1)
+    la_date = np.datetime64(start, "D") + cohort["la_day"].astype("timedelta64[D]")
+
+    campaigns = [list(sheets.CAMPAIGN_COLUMNS)]
+    metrics = [list(sheets.CAMPAIGN_METRIC_COLUMNS)]
+    months = np.arange(np.datetime64(start, "M"), np.datetime64(end, "M") + 1).astype(
+        "datetime64[D]"
+    )
+    pairs = cohort["app"] * len(COUNTRIES) + cohort["country"]
+    for pair in np.argsort(np.bincount(pairs))[::-1][:12]:
+        app, country = divmod(int(pair), len(COUNTRIES))
+        language, country = APPS[app][0], COUNTRIES[country]
+        first = rng.integers(max(len(months) - 2, 1))
+        last = min(first + int(rng.integers(0, 4)), len(months) - 1)
+        stop = (months[last].astype("datetime64[M]") + 1).astype("datetime64[D]")
+        covered = (pairs == pair) & (la_date >= months[first]) & (la_date < stop)
+        la = int(covered.sum())
+        mean_ra = float(ra[covered].mean()) if la else 0.0
+        cost = round(float(rng.uniform(2_000, 20_000)), 2)
+        name = f"{language} {country} {months[first].item():%b %Y}"
+        campaigns.append(
+            [
+                name,
+                language,
+                country,
+                _sheet_date(months[first]),
+                _sheet_date(months[last]),
+                str(cost),
+            ]
+        )
+        metrics.append(
+            [
+                name,
+                str(la),
+                f"{cost / la:.2f}" if la else "",
+                f"{mean_ra:.3f}",
+                f"{cost / (la * mean_ra):.2f}" if la and mean_ra else "",
+            ]
+        )
+
+    annual = [list(sheets.ANNUAL_METRIC_COLUMNS)]
+    years = la_date.astype("datetime64[Y]").astype(np.int64) + 1970
+    for year in np.unique(years):
+        in_year = years == year
+        annual.append([str(year), str(int(in_year.sum())), f"{ra[in_year].mean():.3f}"])
+
+    return {
+        "campaigns": campaigns,
+        "apps": apps,
+        "campaign_metrics": metrics,
+        "annual_metrics": annual,
+    }
+
+
+def build(n, start, end, seed=0, events=True):
+    """Every fixture table as an Arrow table, by table name."""
+    cohort = learners(n, (end - start).days + 1, seed)
+    users = users_table(cohort, start)
+    tables = {FTM_USERS_TABLE: users}
+    for table_id in cube.KEYS:
+        tables[table_id] = la_cube_table(users, table_id)
+    if events:
+        gameplay = gameplay_table(cohort, start, seed)
+        tables[GAMEPLAY_TABLE] = gameplay
+        tables[activity.DAILY_ACTIVITY_TABLE] = daily_activity_table(gameplay)
+    for name, values in sheet_values(cohort, start, end, seed).items():
+        header, rows = values[0], values[1:]
+        tables[sheet_table(name)] = pa.table(
+            {
+                col: pa.array([r[i] for r in rows], pa.string())
+                for i, col in enumerate(header)
+            }
+        )
+    return tables
+
+
+def write(tables, path):
+    """Write ``tables`` to a new DuckDB file at ``path``.
+
+    Without events ``ftm_daily_activity`` is created empty, so the pages'
+    activity queries still run.
+    """
+    import duckdb
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = duckdb.connect(tmp_path)
+    try:
+        for name, table in tables.items():
+            conn.register("fixture", table)
+            conn.execute(f'CREATE TABLE "{name}" AS SELECT * FROM fixture')
+            conn.unregister("fixture")
+        if activity.DAILY_ACTIVITY_TABLE not in tables:
+            conn.execute(
+                f'CREATE TABLE "{activity.DAILY_ACTIVITY_TABLE}" ('
+                "event_date DATE, app_id VARCHAR, country VARCHAR, "
+                "user_pseudo_id VARCHAR, levels_played BIGINT, "
+                "levels_succeeded BIGINT, levels_failed BIGINT)"
+            )
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+def generate(n, path, days=730, seed=0, events=True, end=None):
+    """Build and write fixtures of ``n`` learners acquired up to ``end``.
+
+    ``end`` defaults to yesterday, the newest complete day in production.
+    Returns the tables written.
+    """
+    end = end or datetime.date.today() - datetime.timedelta(days=1)
+    start = end - datetime.timedelta(days=days - 1)
+    tables = build(n, start, end, seed, events)
+    write(tables, path)
+    return tables
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write local backend fixtures.")
+    parser.add_argument("--learners", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=730, help="days of acquisition")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-events",
+        dest="events",
+        action="store_false",
+        help="skip gameplay events and daily activity",
+    )
+    parser.add_argument("--out", default=config.LOCAL_DB)
+    args = parser.parse_args(argv)
+
+    tables = generate(args.learners, args.out, args.days, args.seed, args.events)
+    for name, table in tables.items():
+        print(f"{name}: {table.num_rows:,} rows")
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
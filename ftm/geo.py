@@ -0,0 +1,157 @@
+"""Country dimension, from ``countries.csv``.
+
+GA4 reports countries by name, in its own spelling ("United States",
+"Congo - Kinshasa", "Côte d’Ivoire"), while ``countries.csv`` has the ISO
+names and codes. ``CountryIndex`` maps either spelling to the row of its
+country, an integer id, so country rollups are ``bincount``s over those ids
+and the maps place countries by ISO-3 code rather than by Plotly matching
+names in the browser. Names it does not know (territories, "(not set)")
+keep their own rows without a code; the pages list them under the map.
+"""
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from ftm import config
+
+COUNTRIES_CSV = os.path.join(config.ROOT_DIR, "countries.csv")
+
+# GA4 spellings that differ from countries.csv, by ISO-3 code.
+GA4_ALIASES = {
+    "atg": ["Antigua & Barbuda"],
+    "bih": ["Bosnia & Herzegovina"],
+    "bol": ["Bolivia"],
+    "brn": ["Brunei"],
+    "civ": ["Côte d’Ivoire", "Ivory Coast"],
+    "cod": ["Congo - Kinshasa", "Democratic Republic of the Congo"],
+    "cog": ["Congo - Brazzaville"],
+    "cpv": ["Cape Verde"],
+    "cze": ["Czech Republic"],
+    "fsm": ["Micronesia"],
+    "gbr": ["United Kingdom"],
+    "irn": ["Iran"],
+    "kna": ["St. Kitts & Nevis"],
+    "kor": ["South Korea"],
+    "lao": ["Laos"],
+    "lca": ["St. Lucia"],
+    "mda": ["Moldova"],
+    "mkd": ["Macedonia", "North Macedonia"],
+    "mmr": ["Myanmar (Burma)"],
+    "prk": ["North Korea"],
+    "rus": ["Russia"],
+    "stp": ["São Tomé & Príncipe"],
+    "swz": ["Swaziland"],
+    "syr": ["Syria"],
+    "tto": ["Trinidad & Tobago"],
+    "tur": ["Turkey"],
+    "tza": ["Tanzania"],
+    "usa": ["United States"],
+    "vct": ["St. Vincent & Grenadines"],
+    "ven": ["Venezuela"],
+    "vnm": ["Vietnam"],
+}
+
+
+def _key(name):
+    return name.strip().casefold().replace("’", "'")
+
+
+class CountryIndex:
+    """Integer ids for the countries of ``countries.csv``, in file order.
+
+    :param countries: rows of ``countries.csv``.
+    :param aliases: other names of a country, by its ``alpha3`` code.
+    """
+
+    def __init__(self, countries, aliases=GA4_ALIASES):
+        self.countries = countries.reset_index(drop=True)
+        self.iso_alpha = self.countries["alpha3"].str.upper().to_numpy()
+        self.names = self.countries["name"].to_numpy()
+        self._ids = {_key(n): i for i, n in enumerate(self.names)}
+        self._aliases = [[] for _ in self.names]
+        by_alpha3 = dict(zip(self.countries["alpha3"], range(len(self.names))))
+        for alpha3, names in aliases.items():
+            for name in names:
+                self._ids[_key(name)] = by_alpha3[alpha3]
+                self._aliases[by_alpha3[alpha3]].append(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def ids(self, names):
+        """Id of each name, or -1 if it is not a known country."""
+        return np.array(
+            [self._ids.get(_key(n), -1) if isinstance(n, str) else -1 for n in names],
+            dtype=np.int64,
+        )
+
+    def ga4_names(self, names):
+        """``names`` with every other spelling of their countries.
+
+        For filtering GA4 data by countries picked from ``countries.csv``.
+        """
+        res = list(names)
+        for i in self.ids(names):
+            if i >= 0:
+                res.extend(self._aliases[i])
+        return list(dict.fromkeys(res))
+
+    def rollup(self, country, weights=None, name="LA"):
+        """Count (or sum ``weights``) per country.
+
+        :param country: country names, one per learner or cube row.
+        :param weights: e.g. the cube's ``learners``; None counts rows.
+        :return: ``country``, ``iso_alpha`` and ``name`` columns; one row
+            per country with any, then one per unknown name, whose
+            ``iso_alpha`` is missing.
+        """
+        # Names repeat: look up each distinct one, then count by its code.
+        codes, uniques = pd.factorize(country, use_na_sentinel=False)
+        per_name = np.bincount(
+            codes,
+            weights=None if weights is None else np.asarray(weights, dtype=float),
+            minlength=len(uniques),
+        )
+        uniques = np.asarray(uniques, dtype=object)
+        ids = self.ids(uniques)
+        known = ids >= 0
+        totals = np.bincount(ids[known], weights=per_name[known], minlength=len(self))
+        found = np.flatnonzero(totals)
+        unknown = ~known & (per_name > 0)
+        res = pd.DataFrame(
+            {
+                "country": np.concatenate(
+                    [
+                        self.names[found],
+                        pd.Series(uniques[unknown]).fillna("(missing)").to_numpy(),
+                    ]
+                ),
+                "iso_alpha": np.concatenate(
+                    [self.iso_alpha[found], np.full(unknown.sum(), None)]
+                ),
+                name: np.concatenate([totals[found], per_name[unknown]]),
+            }
+        )
+        return res.astype({name: "int64"})
+
+
+@functools.lru_cache(maxsize=1)
+def country_index():
+    """The ``CountryIndex`` of ``countries.csv``, read once per process."""
+    return CountryIndex(pd.read_csv(COUNTRIES_CSV, keep_default_na=False))
+
+
+def unmatched(country_la):
+    """Rows of a ``rollup`` whose country could not be placed on a map."""
+    return country_la[country_la["iso_alpha"].isna()]
+
+
+def unmatched_note(country_la, column="LA"):
+    """Caption listing the rows ``unmatched`` in ``country_la``, or None."""
+    rows = unmatched(country_la)
+    if rows.empty:
+        return None
+    listed = ", ".join(f"{c} ({n:,})" for c, n in zip(rows["country"], rows[column]))
+    return f"Not on the map: {listed}."
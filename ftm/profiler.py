@@ -0,0 +1,266 @@
+"""Opt-in developer panel timing each rerun of a page.
+
+Enabled with the ``?profile=1`` query parameter, the ``profiler`` secret or
+``FTM_PROFILE=1``. Each page calls ``begin()`` first and ``sidebar()`` last;
+in between, every ``profiled`` function and ``span`` block records its wall
+time, whether it was served from ``ftm.cache``, the rows it took and
+returned, the queries it ran (with bytes processed and billed) and its peak
+memory above what was allocated when it started (``tracemalloc``, which
+only runs while a profiled rerun does). The peak is process-wide, so it is
+left empty for spans that overlapped another profiled rerun.
+
+The sidebar shows the current rerun and a rolling history of the last
+``HISTORY`` reruns of the session. When profiling is off, ``begin()``
+leaves nothing to record into and the wrappers only check for that.
+"""
+import functools
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+
+import pandas as pd
+
+from ftm import bq, cache
+
+HISTORY = 20
+
+_local = threading.local()
+
+# Profiled reruns in progress, and how many started while another was.
+_active = 0
+_overlaps = 0
+# Whether the profiler started tracemalloc, and so should stop it.
+_tracing = False
+_active_lock = threading.Lock()
+
+
+def enabled():
+    import streamlit as st
+
+    if os.environ.get("FTM_PROFILE") == "1":
+        return True
+    if st.query_params.get("profile") in ("1", "true"):
+        return True
+    try:
+        return bool(st.secrets.get("profiler", False))
+    except FileNotFoundError:
+        return False
+
+
+class Rerun:
+    """The spans recorded during one execution of a page script."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.wall = None
+        self.spans = []
+        self.stack = []
+
+    def frame(self):
+        return pd.DataFrame(
+            self.spans,
+            columns=[
+                "name",
+                "depth",
+                "seconds",
+                "cache",
+                "rows_in",
+                "rows_out",
+                "queries",
+                "bytes_processed",
+                "bytes_billed",
+                "peak_mb",
+            ],
+        )
+
+
+def _acquire():
+    global _active, _overlaps, _tracing
+    with _active_lock:
+        if _active:
+            _overlaps += 1
+        elif not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing = True
+        _active += 1
+
+
+def _release():
+    global _active, _tracing
+    with _active_lock:
+        _active -= 1
+        if not _active and _tracing:
+            tracemalloc.stop()
+            _tracing = False
+
+
+def _overlapping():
+    with _active_lock:
+        return _active > 1, _overlaps
+
+
+def begin(page):
+    """Start recording a rerun of ``page`` if profiling is enabled."""
+    _local.rerun = None
+    if not enabled():
+        return
+    _acquire()
+    rerun = Rerun(page)
+    # Released by sidebar(), or when the rerun is dropped if the page raised.
+    rerun.release = weakref.finalize(rerun, _release)
+    _local.rerun = rerun
+
+
+def _rows(value):
+    return len(value) if isinstance(value, (pd.DataFrame, pd.Series)) else None
+
+
+class Span:
+    def __init__(self, rerun, name):
+        self.rerun = rerun
+        self.name = name
+        self.cache = None
+        self.rows_in = None
+        self.rows_out = None
+
+    def __enter__(self):
+        rerun = self.rerun
+        current, peak = tracemalloc.get_traced_memory()
+        if rerun.stack:
+            # The parent's peak so far, before this span resets it.
+            parent = rerun.stack[-1]
+            parent.peak = max(parent.peak, peak)
+        self.depth = len(rerun.stack)
+        self.overlaps = _overlapping()
+        self.memory = current
+        self.peak = current
+        tracemalloc.reset_peak()
+        rerun.stack.append(self)
+        # Spans are listed in the order they started.
+        self.index = len(rerun.spans)
+        rerun.spans.append(None)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        rerun = self.rerun
+        rerun.stack.pop()
+        peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        if rerun.stack:
+            rerun.stack[-1].peak = max(rerun.stack[-1].peak, peak)
+        # Another rerun may have reset the peak meanwhile.
+        overlapping = self.overlaps[0] or _overlapping() != self.overlaps
+        thread = threading.get_ident()
+        queries = [
+            t
+            for t in list(bq.timings)
+            if t.get("thread") == thread and t.get("at", 0) >= self.started
+        ]
+        rerun.spans[self.index] = {
+            "name": self.name,
+            "depth": self.depth,
+            "seconds": seconds,
+            "cache": self.cache,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "queries": len(queries),
+            "bytes_processed": sum(t["bytes_processed"] or 0 for t in queries),
+            "bytes_billed": sum(t.get("bytes_billed") or 0 for t in queries),
+            "peak_mb": None if overlapping else (peak - self.memory) / 2**20,
+        }
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def span(name):
+    """Context manager recording a block as one span of the current rerun."""
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return _NoSpan()
+    return Span(rerun, name)
+
+
+def profiled(func=None, *, name=None):
+    """Record every call of ``func`` as a span.
+
+    Put it above ``cached`` so that cache hits are recorded as such.
+    """
+    if func is None:
+        return functools.partial(profiled, name=name)
+    label = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        rerun = getattr(_local, "rerun", None)
+        if rerun is None:
+            return func(*args, **kwargs)
+        with Span(rerun, label) as s:
+            s.rows_in = next((_rows(a) for a in args if _rows(a) is not None), None)
+            result = func(*args, **kwargs)
+            s.rows_out = _rows(result)
+            if hasattr(func, "function_cache"):
+                s.cache = "hit" if cache.last_hit() else "miss"
+        return result
+
+    return wrapper
+
+
+def plotly_chart(fig, container=None, **kwargs):
+    """``st.plotly_chart``, timed: figure serialisation happens here."""
+    import streamlit as st
+
+    title = fig.layout.title.text or "figure"
+    with span(f"plotly_chart: {title}"):
+        return (container or st).plotly_chart(fig, **kwargs)
+
+
+def _history():
+    import streamlit as st
+
+    return st.session_state.setdefault("_profiler_history", [])
+
+
+def sidebar():
+    """Finish the current rerun and show the profiler in the sidebar."""
+    rerun = getattr(_local, "rerun", None)
+    _local.rerun = None
+    if rerun is None:
+        return
+    import streamlit as st
+
+    rerun.wall = time.perf_counter() - rerun.started
+    rerun.release()
+    history = _history()
+    history.append(
+        {
+            "page": rerun.page,
+            "at": pd.Timestamp.now().strftime("%H:%M:%S"),
+            "seconds": rerun.wall,
+            "traced_seconds": sum(s["seconds"] for s in rerun.spans if not s["depth"]),
+            "spans": len(rerun.spans),
+        }
+    )
+    del history[:-HISTORY]
+
+    panel = st.sidebar.expander("Profiler", expanded=True)
+    panel.metric("Rerun wall time", f"{rerun.wall:.3f}s")
+    spans = rerun.frame()
+    spans["name"] = ["  " * d + n for d, n in zip(spans["depth"], spans["name"])]
+    panel.dataframe(
+        spans.drop(columns="depth").round(3), hide_index=True, width="stretch"
+    )
+    panel.caption(f"Last {len(history)} reruns")
+    panel.dataframe(pd.DataFrame(history).round(3), hide_index=True, width="stretch")
+    panel.caption("Result caches")
+    panel.dataframe(cache.stats().round(2), hide_index=True, width="stretch")
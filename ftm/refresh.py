@@ -0,0 +1,369 @@
+"""Incremental nightly refresh of ``ftm_users``.
+
+``ftm_users_nightly_refresh_query`` rebuilds the table from every events
+shard since 2021, three times over. Instead, this keeps two state tables and
+folds in only the daily shards added since the last run:
+
+* ``ftm_user_cohort``: one row per (user, app, country) with the first date
+  level 1 was completed (``LA_date``).
+* ``ftm_user_levels``: one row per user with the highest level completed,
+  the date it was first reached and the number of levels completed.
+
+The same pass appends the new days to ``ftm_daily_activity`` (see
+``ftm.activity``), the per-user daily gameplay counts behind the Daily
+Reading Activity panels.
+
+``ftm_refresh_state`` stores the watermark (last shard folded in, as
+``YYYYMMDD``). ``ftm_users`` is then rebuilt from the two state tables, which
+costs a join of learner-sized tables instead of an events scan, and the
+derived LA cubes (see ``ftm.cube``) are rebuilt from ``ftm_users``.
+
+Starting from empty state tables and the initial watermark gives the same
+result as the full rebuild, so ``--full`` simply resets the state first.
+The MERGE adds each shard's counts to the totals, so a shard cannot be folded
+in twice and must be final when it is. A property's shard is taken as final
+once its next day's shard exists (``newest_shards_sql``), so each run folds
+in the shards from the watermark up to the day before the oldest of the
+properties' newest shards. A property that stops exporting therefore holds
+the refresh back until it is removed from ``FTM_PROPERTIES``.
+
+``apply_increment`` and ``build_ftm_users`` implement the same logic on
+DataFrames and serve as a local stand-in for the BigQuery tables.
+
+    python -m ftm.refresh            # fold in new shards
+    python -m ftm.refresh --full     # rebuild state from 2021-01-01
+    python -m ftm.refresh --print --watermark 20240101   # show the script only
+"""
+import argparse
+import datetime
+
+import pandas as pd
+
+from ftm import activity, cube
+
+DATASET = "dataexploration-193817.user_data"
+FTM_USERS = f"{DATASET}.ftm_users"
+COHORT_TABLE = f"{DATASET}.ftm_user_cohort"
+LEVELS_TABLE = f"{DATASET}.ftm_user_levels"
+STATE_TABLE = f"{DATASET}.ftm_refresh_state"
+
+INITIAL_WATERMARK = "20201231"
+
+# (project, analytics dataset, first shard date) of every FTM property.
+FTM_PROPERTIES = [
+    ("ftm-afrikaans", "analytics_177200876", "2021-01-01"),
+    ("ftm-hindi", "analytics_174638281", "2021-01-01"),
+    ("ftm-brazilian-portuguese", "analytics_161789655", "2021-01-01"),
+    ("ftm-b9d99", "analytics_159643920", "2021-01-01"),
+    ("ftm-english", "analytics_152408808", "2022-12-01"),
+    ("ftm-french", "analytics_173880465", "2021-01-01"),
+    ("ftm-isixhosa", "analytics_180747962", "2021-01-01"),
+    ("ftm-kinayrwanda", "analytics_177922191", "2021-01-01"),
+    ("ftm-oromo", "analytics_167539175", "2021-01-01"),
+    ("ftm-swahili", "analytics_160694316", "2021-01-01"),
+    ("ftm-somali", "analytics_159630038", "2021-01-01"),
+    ("ftm-sepedi", "analytics_180755978", "2021-01-01"),
+    ("ftm-zulu", "analytics_155849122", "2021-01-01"),
+    ("ftm-southafricanenglish", "analytics_173750850", "2021-01-01"),
+    ("ftm-spanish", "analytics_158656398", "2021-01-01"),
+]
+
+LEVEL_EXPR = "CAST(SUBSTR(action, (STRPOS(action, '_') + 1)) AS INT64)"
+
+
+def events_union(after, through, columns="*"):
+    """UNION ALL of every property's daily shards in (after, through].
+
+    ``after`` and ``through`` are ``YYYYMMDD`` strings. They are compared to
+    ``_table_suffix`` as constants so BigQuery only opens matching shards.
+    """
+    parts = []
+    for project, dataset, first_date in FTM_PROPERTIES:
+        first = first_date.replace("-", "")
+        lower = max(after, _previous_day(first))
+        parts.append(
+            f"""SELECT {columns} FROM `{project}.{dataset}.events_20*`
+    WHERE _table_suffix > '{lower[2:]}' AND _table_suffix <= '{through[2:]}'"""
+        )
+    return "\n    UNION ALL\n    ".join(parts)
+
+
+def _previous_day(yyyymmdd):
+    day = datetime.datetime.strptime(yyyymmdd, "%Y%m%d").date()
+    return (day - datetime.timedelta(days=1)).strftime("%Y%m%d")
+
+
+def gameplay_sql(after, through):
+    """LevelSuccess and LevelFail events of the shards in (after, through]."""
+    return f"""SELECT user_pseudo_id, event_date, app_info.id AS app_id, geo.country AS country,
+    params.value.string_value AS action
+  FROM
+  (
+    {events_union(after, through)}
+  ),
+  UNNEST(event_params) AS params
+  WHERE event_name LIKE 'GamePlay'
+  AND params.key = 'action'
+  AND (params.value.string_value LIKE '%LevelSuccess%'
+  OR params.value.string_value LIKE '%LevelFail%')"""
+
+
+def level_success_sql():
+    return f"""SELECT user_pseudo_id, event_date, app_id, country, {LEVEL_EXPR} AS lvl
+  FROM gameplay
+  WHERE action LIKE 'LevelSuccess%'"""
+
+
+def create_state_sql(reset=False):
+    create = "CREATE OR REPLACE TABLE" if reset else "CREATE TABLE IF NOT EXISTS"
+    return f"""
+{create} `{COHORT_TABLE}` (
+  user_pseudo_id STRING, app_id STRING, country STRING, LA_date STRING
+) CLUSTER BY user_pseudo_id;
+{create} `{LEVELS_TABLE}` (
+  user_pseudo_id STRING, max_lvl INT64, max_lvl_date STRING, total_lvls_succeeded INT64
+) CLUSTER BY user_pseudo_id;
+{create} `{STATE_TABLE}` (table_name STRING, watermark STRING);
+{activity.create_sql(reset)}"""
+
+
+def watermark_sql():
+    return f"""
+SELECT MAX(watermark) AS watermark FROM `{STATE_TABLE}` WHERE table_name = 'ftm_users'
+"""
+
+
+def newest_shards_sql():
+    """The newest daily shard (``YYYYMMDD``) of every property."""
+    parts = [
+        f"""SELECT '{dataset}' AS dataset, SUBSTR(MAX(table_name), 8) AS newest
+  FROM `{project}.{dataset}.INFORMATION_SCHEMA.TABLES`
+  WHERE table_name LIKE 'events_2%'"""
+        for project, dataset, _ in FTM_PROPERTIES
+    ]
+    return "\nUNION ALL\n".join(parts)
+
+
+def latest_complete_shard(newest_shards, today=None):
+    """The newest shard that is final in every property.
+
+    :param newest_shards: newest shard of each property, None for one that
+        has none yet.
+    :return: the day before the oldest of ``newest_shards``, and at most
+        the day before yesterday.
+    """
+    today = today or datetime.datetime.utcnow().date()
+    yesterday = (today - datetime.timedelta(days=1)).strftime("%Y%m%d")
+    newest = [shard for shard in newest_shards if shard] + [yesterday]
+    return _previous_day(min(newest))
+
+
+def increment_sql(watermark, new_watermark):
+    """Multi-statement script folding shards in (watermark, new_watermark]."""
+    return f"""
+CREATE TEMP TABLE gameplay AS
+{gameplay_sql(watermark, new_watermark)};
+
+CREATE TEMP TABLE level_success AS
+{level_success_sql()};
+
+BEGIN TRANSACTION;
+{activity.increment_sql(watermark, new_watermark)}
+MERGE `{COHORT_TABLE}` T
+USING (
+  SELECT user_pseudo_id, app_id, country, MIN(event_date) AS LA_date
+  FROM level_success
+  WHERE lvl = 1
+  GROUP BY user_pseudo_id, app_id, country
+) S
+ON T.user_pseudo_id = S.user_pseudo_id
+AND T.app_id IS NOT DISTINCT FROM S.app_id
+AND T.country IS NOT DISTINCT FROM S.country
+WHEN MATCHED AND S.LA_date < T.LA_date THEN
+  UPDATE SET LA_date = S.LA_date
+WHEN NOT MATCHED THEN
+  INSERT (user_pseudo_id, app_id, country, LA_date)
+  VALUES (S.user_pseudo_id, S.app_id, S.country, S.LA_date);
+
+MERGE `{LEVELS_TABLE}` T
+USING (
+  SELECT user_pseudo_id,
+    ARRAY_AGG(STRUCT(lvl, event_date) ORDER BY lvl DESC, event_date LIMIT 1)[OFFSET(0)] AS top,
+    COUNT(lvl) AS n
+  FROM level_success
+  GROUP BY user_pseudo_id
+) S
+ON T.user_pseudo_id = S.user_pseudo_id
+WHEN MATCHED THEN
+  UPDATE SET
+    max_lvl = IF(S.top.lvl > T.max_lvl, S.top.lvl, T.max_lvl),
+    max_lvl_date = IF(S.top.lvl > T.max_lvl, S.top.event_date, T.max_lvl_date),
+    total_lvls_succeeded = T.total_lvls_succeeded + S.n
+WHEN NOT MATCHED THEN
+  INSERT (user_pseudo_id, max_lvl, max_lvl_date, total_lvls_succeeded)
+  VALUES (S.user_pseudo_id, S.top.lvl, S.top.event_date, S.n);
+
+DELETE FROM `{STATE_TABLE}` WHERE table_name = 'ftm_users';
+INSERT INTO `{STATE_TABLE}` (table_name, watermark) VALUES ('ftm_users', '{new_watermark}');
+
+COMMIT TRANSACTION;
+"""
+
+
+def rebuild_sql():
+    return f"""
+CREATE OR REPLACE TABLE `{FTM_USERS}` AS
+SELECT learner_cohort.user_pseudo_id,
+  learner_cohort.LA_date,
+  learner_cohort.app_id,
+  learner_cohort.country,
+  levels.max_lvl,
+  levels.max_lvl_date,
+  levels.total_lvls_succeeded
+FROM `{COHORT_TABLE}` AS learner_cohort
+LEFT JOIN `{LEVELS_TABLE}` AS levels
+ON learner_cohort.user_pseudo_id = levels.user_pseudo_id
+WHERE levels.total_lvls_succeeded > 0
+ORDER BY learner_cohort.LA_date;
+"""
+
+
+def refresh_script(watermark, new_watermark):
+    return increment_sql(watermark, new_watermark) + rebuild_sql() + cube.build_sql()
+
+
+# --- Local stand-in ---
+# ``events`` frames have the columns of the level_success temp table:
+# user_pseudo_id, event_date (YYYYMMDD), app_id, country, lvl.
+
+COHORT_COLUMNS = ["user_pseudo_id", "app_id", "country", "LA_date"]
+LEVELS_COLUMNS = ["user_pseudo_id", "max_lvl", "max_lvl_date", "total_lvls_succeeded"]
+
+
+def empty_state():
+    return pd.DataFrame(columns=COHORT_COLUMNS), pd.DataFrame(columns=LEVELS_COLUMNS)
+
+
+def apply_increment(cohort, levels, events):
+    """Fold a batch of LevelSuccess events into the state frames.
+
+    Mirrors the two MERGE statements of ``increment_sql`` and returns new
+    ``(cohort, levels)`` frames.
+    """
+    new_cohort = (
+        events[events["lvl"] == 1]
+        .groupby(["user_pseudo_id", "app_id", "country"], dropna=False)["event_date"]
+        .min()
+        .reset_index(name="LA_date")
+    )
+    cohort = (
+        pd.concat([cohort, new_cohort], ignore_index=True)
+        .groupby(["user_pseudo_id", "app_id", "country"], dropna=False)["LA_date"]
+        .min()
+        .reset_index()
+    )
+
+    top = events.sort_values(
+        ["user_pseudo_id", "lvl", "event_date"], ascending=[True, False, True]
+    ).drop_duplicates("user_pseudo_id")
+    new_levels = top.rename(columns={"lvl": "max_lvl", "event_date": "max_lvl_date"})[
+        ["user_pseudo_id", "max_lvl", "max_lvl_date"]
+    ].merge(
+        events.groupby("user_pseudo_id")["lvl"]
+        .count()
+        .reset_index(name="total_lvls_succeeded"),
+        on="user_pseudo_id",
+    )
+    # Existing rows come first so that a tie on max_lvl keeps the earlier date,
+    # as the MERGE does.
+    both = pd.concat([levels, new_levels], ignore_index=True)
+    totals = both.groupby("user_pseudo_id")["total_lvls_succeeded"].sum()
+    best = both.sort_values("max_lvl", ascending=False, kind="stable").drop_duplicates(
+        "user_pseudo_id"
+    )
+    levels = best.drop(columns="total_lvls_succeeded").merge(
+        totals.reset_index(), on="user_pseudo_id"
+    )[LEVELS_COLUMNS]
+    return cohort[COHORT_COLUMNS], levels.reset_index(drop=True)
+
+
+def build_ftm_users(cohort, levels):
+    """Equivalent of ``rebuild_sql`` on the state frames."""
+    users = cohort.merge(levels, on="user_pseudo_id", how="left")
+    users = users[users["total_lvls_succeeded"] > 0]
+    return users[
+        [
+            "user_pseudo_id",
+            "LA_date",
+            "app_id",
+            "country",
+            "max_lvl",
+            "max_lvl_date",
+            "total_lvls_succeeded",
+        ]
+    ].sort_values("LA_date", kind="stable", ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh ftm_users incrementally.")
+    parser.add_argument(
+        "--full", action="store_true", help="reset the state and rebuild from 2021"
+    )
+    parser.add_argument(
+        "--print",
+        action="store_true",
+        help="print the script instead of running it, without reading the "
+        "warehouse; see --watermark and --through",
+    )
+    parser.add_argument(
+        "--watermark", help="with --print: last shard folded in (default: none)"
+    )
+    parser.add_argument(
+        "--through",
+        help="with --print: last shard to fold in (default: the day before "
+        "yesterday)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.print:
+        watermark = args.watermark or INITIAL_WATERMARK
+        new_watermark = args.through or latest_complete_shard([])
+        script = refresh_script(watermark, new_watermark)
+        if args.full:
+            script = create_state_sql(reset=True) + script
+        print(script)
+        return
+
+    from ftm.clients import get_bq_client
+
+    client = get_bq_client()
+    shards = list(client.query(newest_shards_sql()).result())
+    new_watermark = latest_complete_shard([row["newest"] for row in shards])
+    if args.full:
+        watermark = INITIAL_WATERMARK
+    else:
+        client.query(create_state_sql()).result()
+        rows = list(client.query(watermark_sql()).result())
+        watermark = rows[0]["watermark"] or INITIAL_WATERMARK
+    if watermark >= new_watermark:
+        waiting = [
+            row["dataset"]
+            for row in shards
+            if row["newest"] and _previous_day(row["newest"]) <= watermark
+        ]
+        print(f"ftm_users is up to date (watermark {watermark}), waiting on {waiting}")
+        return
+
+    script = refresh_script(watermark, new_watermark)
+    if args.full:
+        script = create_state_sql(reset=True) + script
+    job = client.query(script)
+    job.result()
+    print(
+        f"Folded in shards {watermark} < day <= {new_watermark}: "
+        f"{job.total_bytes_processed or 0:,} bytes processed"
+    )
+
+
+if __name__ == "__main__":
+    main()
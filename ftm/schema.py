@@ -0,0 +1,73 @@
+"""Canonical in-memory schema for learner-level and cube frames.
+
+Applied to the Arrow table before conversion to pandas, so object columns
+are never materialised:
+
+* ``LA_date`` and ``max_lvl_date`` (``YYYYMMDD`` strings upstream) become
+  ``datetime64`` at second resolution, the coarsest numpy unit pandas
+  supports.
+* ``app_id`` and ``country`` become categoricals.
+* Level counts are narrowed to the smallest integer type that holds them.
+* ``user_pseudo_id`` becomes an Arrow-backed string.
+"""
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DATE_COLUMNS = ("LA_date", "max_lvl_date")
+CATEGORY_COLUMNS = ("app_id", "country")
+INT_COLUMNS = ("max_lvl", "total_lvls_succeeded")
+
+# No int8: small enough arithmetic on it overflows silently.
+_INT_TYPES = (pa.int16(), pa.int32())
+
+
+def _narrow_int(col):
+    if col.null_count:
+        # pandas would turn a nullable integer column into float64 anyway.
+        return pc.cast(col, pa.float32())
+    if len(col) == 0:
+        return pc.cast(col, pa.int16())
+    bounds = pc.min_max(col)
+    lo, hi = bounds["min"].as_py(), bounds["max"].as_py()
+    for int_type in _INT_TYPES:
+        limit = 2 ** (int_type.bit_width - 1)
+        if -limit <= lo and hi < limit:
+            return pc.cast(col, int_type)
+    return col
+
+
+def learner_frame(table):
+    """Convert an ftm_users (or LA cube) Arrow table to a compact DataFrame.
+
+    The table's buffers are released during conversion; do not reuse it.
+    """
+    columns = {}
+    for name in table.column_names:
+        col = table[name]
+        if name in DATE_COLUMNS and pa.types.is_string(col.type):
+            col = pc.strptime(col, format="%Y%m%d", unit="s", error_is_null=True)
+        elif name in CATEGORY_COLUMNS:
+            col = pc.dictionary_encode(col)
+        elif name in INT_COLUMNS and pa.types.is_integer(col.type):
+            col = _narrow_int(col)
+        columns[name] = col
+    return pa.table(columns).to_pandas(
+        self_destruct=True,
+        split_blocks=True,
+        types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get,
+    )
+
+
+def memory_report(df):
+    """Memory used by each column, largest first."""
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame(
+        {
+            "dtype": df.dtypes.astype(str),
+            "MB": usage / 2**20,
+            "bytes/row": usage / max(len(df), 1),
+        }
+    ).sort_values("MB", ascending=False)
+    report["share"] = report["MB"] / report["MB"].sum()
+    return report
@@ -0,0 +1,93 @@
+"""Reading Acquisition (RA) decile segmentation.
+
+A learner's RA is ``max_lvl / total_lvls``. Deciles are labelled by their
+upper bound, as the pages always have: ``perc < 0.1`` is 0.1,
+``0.1 <= perc < 0.2`` is 0.2, and so on, with everything from 0.9 up
+(including RA above 1) labelled 1.0.
+"""
+import numpy as np
+import pandas as pd
+
+from ftm.profiler import profiled
+
+DECILE_EDGES = np.arange(1, 10) / 10
+N_DECILES = len(DECILE_EDGES) + 1
+
+
+def _per_group(value, groups, name):
+    """Broadcast a scalar or a mapping keyed by group to one value per group."""
+    if np.isscalar(value):
+        return np.full(len(groups), value, dtype=float)
+    values = pd.Series(value, dtype=float).reindex(groups)
+    if values.isna().any():
+        missing = list(groups[values.isna().to_numpy()])
+        raise KeyError(f"No {name} for group(s): {missing}")
+    return values.to_numpy()
+
+
+@profiled
+def ra_segments(user_data, total_lvls, by=None, cost=None, weight=None):
+    """Count learners and average RA per RA decile.
+
+    :param user_data: learner rows with a ``max_lvl`` column; not modified.
+    :param total_lvls: total levels used as the RA denominator, either a
+        scalar or a mapping from group to total.
+    :param by: optional column to segment each group (e.g. campaign)
+        separately in the same pass.
+    :param cost: optional spend, scalar or mapping from group to spend. When
+        given, the result has a ``rac`` column.
+    :param weight: optional column holding the number of learners each row
+        stands for, for pre-aggregated input such as the LA cube.
+    :returns: one row per non-empty (group, decile) with columns ``seg``,
+        ``la``, ``ra`` (mean RA), ``la_perc`` (share of the group's LA) and
+        optionally ``rac``, preceded by ``by`` when grouping.
+    """
+    if by is None:
+        codes = np.zeros(len(user_data), dtype=np.intp)
+        groups = pd.Index([None])
+    else:
+        codes, groups = pd.factorize(user_data[by], sort=True)
+    n_groups = len(groups)
+
+    max_lvl = user_data["max_lvl"].to_numpy(dtype=float)
+    w = None if weight is None else user_data[weight].to_numpy(dtype=float)
+    if (codes < 0).any():
+        # Like groupby, leave out rows whose group is missing.
+        rows = codes >= 0
+        codes, max_lvl = codes[rows], max_lvl[rows]
+        w = None if w is None else w[rows]
+    perc = max_lvl / _per_group(total_lvls, groups, "total_lvls")[codes]
+    # digitize matches the historical if/elif chain exactly, including NaN
+    # (which used to fall through to the top decile).
+    key = codes * N_DECILES + np.digitize(perc, DECILE_EDGES)
+    size = n_groups * N_DECILES
+    if w is None:
+        w = np.ones(len(perc))
+    valid = ~np.isnan(perc)
+    la = np.bincount(key, weights=w, minlength=size).astype(np.int64)
+    ra_sum = np.bincount(key, weights=np.where(valid, perc * w, 0.0), minlength=size)
+    ra_count = np.bincount(key, weights=np.where(valid, w, 0.0), minlength=size)
+
+    la = la.reshape(n_groups, N_DECILES)
+    group_la = la.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ra = (ra_sum / ra_count).reshape(n_groups, N_DECILES)
+        la_perc = la / group_la
+
+    group_idx, seg_idx = np.nonzero(la)
+    res = pd.DataFrame(
+        {
+            "seg": (seg_idx + 1) / 10,
+            "la": la[group_idx, seg_idx],
+            "ra": ra[group_idx, seg_idx],
+            "la_perc": la_perc[group_idx, seg_idx],
+        }
+    )
+    if cost is not None:
+        group_cost = _per_group(cost, groups, "cost")[group_idx]
+        res["rac"] = round(
+            group_cost * res["la_perc"] / (res["ra"] * group_la[group_idx, 0]), 2
+        )
+    if by is not None:
+        res.insert(0, by, groups[group_idx])
+    return res
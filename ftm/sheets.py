@@ -0,0 +1,236 @@
+"""Google Sheets metadata: campaigns, apps, campaign metrics, annual metrics.
+
+gsheetsdb emulated SQL over the Sheets API, one sheet per round-trip. Here
+every sheet is read with one ``values:batchGetByDataFilter`` request per
+spreadsheet (spreadsheets are fetched in parallel) and parsed into typed
+frames.
+
+The raw values are kept in a local cache file per spreadsheet together with
+the Drive file version they were read at. A load first asks Drive for the
+current version, a small metadata request, and only refetches the values
+when it changed. Within ``config.SHEETS_TTL_SECONDS`` of the last check the
+parsed frames are reused without any request.
+"""
+import concurrent.futures
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+import requests
+
+from ftm import config
+
+SHEETS_API = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_API = "https://www.googleapis.com/drive/v3/files"
+
+CAMPAIGN_COLUMNS = [
+    "Campaign Name",
+    "Language",
+    "Country",
+    "Start Date",
+    "End Date",
+    "Total Cost (USD)",
+]
+APP_COLUMNS = ["app_id", "language", "bq_property_id", "bq_project_id", "total_lvls"]
+CAMPAIGN_METRIC_COLUMNS = ["campaign_name", "la", "lac", "ra", "rac"]
+ANNUAL_METRIC_COLUMNS = ["year", "la", "ra"]
+
+
+def _campaigns(df):
+    df["Start Date"] = pd.to_datetime(df["Start Date"]).dt.date
+    # The sheet gives the end month; campaigns run to its last day.
+    df["End Date"] = (
+        pd.to_datetime(df["End Date"])
+        + pd.DateOffset(months=1)
+        - pd.Timedelta(1, unit="D")
+    ).dt.date
+    df["Total Cost (USD)"] = pd.to_numeric(df["Total Cost (USD)"], errors="coerce")
+    return df
+
+
+def _apps(df):
+    df["total_lvls"] = pd.to_numeric(df["total_lvls"], errors="coerce")
+    return df
+
+
+def _numeric(columns):
+    def parse(df):
+        for col in columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        return df
+
+    return parse
+
+
+class Sheet:
+    """One sheet: the secret holding its URL, its columns and a parser.
+
+    With ``by_header`` the columns are picked by their header names, as the
+    apps query did; otherwise the sheet's first columns are taken in order.
+    """
+
+    def __init__(self, secret, columns, parse, by_header=False):
+        self.secret = secret
+        self.columns = columns
+        self.parse = parse
+        self.by_header = by_header
+
+    def frame(self, values):
+        header, rows = (values[0], values[1:]) if values else ([], [])
+        width = len(header)
+        rows = [list(row) + [None] * (width - len(row)) for row in rows]
+        df = pd.DataFrame(rows, columns=header) if width else pd.DataFrame()
+        if self.by_header:
+            df = df.reindex(columns=self.columns)
+        else:
+            df = df.iloc[:, : len(self.columns)]
+            df.columns = self.columns[: df.shape[1]]
+            df = df.reindex(columns=self.columns)
+        return self.parse(df.replace("", None))
+
+
+SHEETS = {
+    "campaigns": Sheet("Campaign_gsheets_url", CAMPAIGN_COLUMNS, _campaigns),
+    "apps": Sheet("ftm_apps_gsheets_url", APP_COLUMNS, _apps, by_header=True),
+    "campaign_metrics": Sheet(
+        "campaign_metrics_gsheets_url",
+        CAMPAIGN_METRIC_COLUMNS,
+        _numeric(["la", "lac", "ra", "rac"]),
+    ),
+    "annual_metrics": Sheet(
+        "ann_camp_metrics_gsheets_url",
+        ANNUAL_METRIC_COLUMNS,
+        _numeric(ANNUAL_METRIC_COLUMNS),
+    ),
+}
+
+
+def parse_url(url):
+    """Spreadsheet id and sheet (gid) of a Google Sheets URL."""
+    spreadsheet = re.search(r"/spreadsheets/d/([\w-]+)", url)
+    if spreadsheet is None:
+        raise ValueError(f"not a Google Sheets URL: {url}")
+    gid = re.search(r"[#&?]gid=(\d+)", url)
+    return spreadsheet.group(1), int(gid.group(1)) if gid else 0
+
+
+class SheetsCache:
+    """Raw sheet values on disk, keyed by spreadsheet and Drive version."""
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(config.DATA_DIR, "sheets")
+
+    def path(self, spreadsheet_id):
+        return os.path.join(self.root, f"{spreadsheet_id}.json")
+
+    def read(self, spreadsheet_id):
+        try:
+            with open(self.path(spreadsheet_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, spreadsheet_id, version, values):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(spreadsheet_id)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": version, "values": values}, f)
+        os.replace(tmp_path, path)
+
+
+def drive_version(session, spreadsheet_id):
+    resp = session.get(
+        f"{DRIVE_API}/{spreadsheet_id}",
+        params={"fields": "version", "supportsAllDrives": "true"},
+    )
+    resp.raise_for_status()
+    return resp.json()["version"]
+
+
+def batch_get(session, spreadsheet_id, gids):
+    """Values of several sheets of one spreadsheet in a single request."""
+    resp = session.post(
+        f"{SHEETS_API}/{spreadsheet_id}/values:batchGetByDataFilter",
+        json={
+            "dataFilters": [{"gridRange": {"sheetId": gid}} for gid in gids],
+            "valueRenderOption": "UNFORMATTED_VALUE",
+            "dateTimeRenderOption": "FORMATTED_STRING",
+        },
+    )
+    resp.raise_for_status()
+    ranges = resp.json().get("valueRanges", [])
+    return [r.get("valueRange", {}).get("values", []) for r in ranges]
+
+
+def fetch_spreadsheet(session, spreadsheet_id, gids, disk):
+    """Values per gid, refetched only when the Drive version changed."""
+    cached = disk.read(spreadsheet_id)
+    values = None
+    if cached is not None:
+        values = {int(g): v for g, v in cached["values"].items()}
+        if not all(gid in values for gid in gids):
+            values = None
+    try:
+        version = drive_version(session, spreadsheet_id)
+    except requests.RequestException as exc:
+        # Serve the last copy rather than fail the page when Google is down.
+        if values is not None:
+            return values
+        raise RuntimeError(
+            f"cannot reach Google Drive for spreadsheet {spreadsheet_id} and "
+            f"the cache does not hold all of its sheets {gids}"
+        ) from exc
+    if values is not None and cached["version"] == version:
+        return values
+    values = dict(zip(gids, batch_get(session, spreadsheet_id, gids)))
+    disk.write(spreadsheet_id, version, {str(g): v for g, v in values.items()})
+    return values
+
+
+def load(session, urls, disk=None):
+    """Fetch and parse every sheet in ``urls`` (name to sheet URL)."""
+    disk = disk or SheetsCache()
+    locations = {name: parse_url(url) for name, url in urls.items()}
+    by_spreadsheet = {}
+    for spreadsheet_id, gid in locations.values():
+        by_spreadsheet.setdefault(spreadsheet_id, set()).add(gid)
+    with concurrent.futures.ThreadPoolExecutor(len(by_spreadsheet) or 1) as pool:
+        futures = {
+            spreadsheet_id: pool.submit(
+                fetch_spreadsheet, session, spreadsheet_id, sorted(gids), disk
+            )
+            for spreadsheet_id, gids in by_spreadsheet.items()
+        }
+        values = {s: f.result() for s, f in futures.items()}
+    return {
+        name: SHEETS[name].frame(values[spreadsheet_id][gid])
+        for name, (spreadsheet_id, gid) in locations.items()
+    }
+
+
+_frames = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def clear():
+    """Drop the loaded sheets; the next ``get`` loads them again."""
+    global _frames
+    with _lock:
+        _frames = None
+
+
+def get(name):
+    """A fresh copy of one sheet's frame, loading all sheets if stale."""
+    global _frames, _checked_at
+    with _lock:
+        if _frames is None or time.time() - _checked_at > config.SHEETS_TTL_SECONDS:
+            from ftm.backend import get_backend
+
+            _frames = get_backend().load_sheets()
+            _checked_at = time.time()
+        return _frames[name].copy()
@@ -0,0 +1,218 @@
+"""Serve date-windowed snapshot reads from earlier, wider ones.
+
+Moving Campaign Details' or Manual Analysis' date window by a day changes
+the arguments of ``compute.la_cube``, so its result cache misses even when
+a cached cube already covers the new window. ``SliceCache`` keeps the last
+frames read from a snapshot together with the predicate they were read
+with (date range, app and country filters). A read whose predicate is
+contained in one of them is answered by filtering that frame in memory; one
+that only partly overlaps it reads just the missing days before or after
+and puts the pieces together.
+
+The frames returned are stamped exactly as a direct read would be, so
+results computed from them are cached under the same keys.
+"""
+import datetime
+import threading
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from ftm import cache, config, snapshot
+from ftm.filters import predicate
+
+# Unbounded ends of a date range.
+FIRST_DAY = datetime.date.min
+LAST_DAY = datetime.date.max
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def contains(outer, inner):
+    """Whether predicate ``outer`` keeps every value ``inner`` keeps.
+
+    Both are lists, ``filters.Predicate`` or None (everything).
+    """
+    outer, inner = predicate(outer), predicate(inner)
+    if outer is None:
+        return True
+    if inner is None:
+        return False
+    if outer.op == "in":
+        return inner.op == "in" and set(inner.values) <= set(outer.values)
+    if inner.op == "in":
+        return not set(inner.values) & set(outer.values)
+    return set(outer.values) <= set(inner.values)
+
+
+def _day(value, default):
+    if value is None:
+        return default
+    return datetime.datetime.strptime(value, "%Y%m%d").date()
+
+
+def _yyyymmdd(day):
+    if day in (FIRST_DAY, LAST_DAY):
+        return None
+    return day.strftime("%Y%m%d")
+
+
+def _select(frame, start, end, apps, countries):
+    """Rows of ``frame`` within a date range and app and country filters."""
+    mask = pd.Series(True, index=frame.index)
+    if start != FIRST_DAY:
+        mask &= frame["LA_date"] >= pd.Timestamp(start)
+    if end != LAST_DAY:
+        mask &= frame["LA_date"] <= pd.Timestamp(end)
+    for column, values in (("app_id", apps), ("country", countries)):
+        values = predicate(values)
+        if values is not None:
+            isin = frame[column].isin(values.values)
+            mask &= ~isin if values.op == "not in" else isin
+    return frame[mask.to_numpy()]
+
+
+def _concat(frames):
+    """Concatenate frames read separately, merging their categories."""
+    frames = [f for f in frames if len(f)] or frames[:1]
+    res = pd.concat(frames, ignore_index=True)
+    for column, dtype in frames[0].dtypes.items():
+        if len(frames) > 1 and isinstance(dtype, pd.CategoricalDtype):
+            res[column] = union_categoricals(
+                [f[column] for f in frames], ignore_order=True
+            )
+    return res
+
+
+class Slice:
+    __slots__ = ("version", "start", "end", "apps", "countries")
+
+    def __init__(self, version, start, end, apps, countries):
+        self.version = version
+        self.start = start
+        self.end = end
+        self.apps = predicate(apps)
+        self.countries = predicate(countries)
+
+    def key(self, name):
+        """The slice's key in ``cache.store``."""
+        return (name, self.version, self.start, self.end, self.apps, self.countries)
+
+    def covers(self, other):
+        return (
+            self.version == other.version
+            and self.start <= other.start
+            and other.end <= self.end
+            and contains(self.apps, other.apps)
+            and contains(self.countries, other.countries)
+        )
+
+    def overlap(self, other):
+        """Days of ``other`` this slice can answer; 0 if it cannot."""
+        if not (
+            self.version == other.version
+            and contains(self.apps, other.apps)
+            and contains(self.countries, other.countries)
+        ):
+            return 0
+        first, last = max(self.start, other.start), min(self.end, other.end)
+        return max((last - first).days + 1, 0)
+
+
+class SliceCache:
+    """The last ``max_entries`` frames read from one snapshot table.
+
+    The frames are held in ``cache.store`` as the results of
+    ``slices:<table_id>``, so they count towards ``config.CACHE_MEMORY_MB``,
+    show in ``cache.stats`` and are evicted and invalidated like the other
+    results; a slice whose frame was evicted is forgotten.
+
+    :param table_id: the snapshot's table, whose frames have ``LA_date``,
+        ``app_id`` and ``country`` columns.
+    """
+
+    def __init__(self, table_id, max_entries=None):
+        self.table_id = table_id
+        self.max_entries = max_entries or config.CACHE_MAX_ENTRIES
+        self.cache = cache.function_cache(f"slices:{table_id}", None, None)
+        self.slices = []
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.partial = 0
+        self.misses = 0
+
+    def clear(self):
+        with self.lock:
+            self.slices = []
+        self.cache.clear()
+
+    def _best(self, request):
+        """The slice answering most of ``request``, moved to the end, and its
+        frame; (None, None) if there is none."""
+        with self.lock:
+            self.slices = [s for s in self.slices if s.version == request.version]
+            while True:
+                scored = [(s.overlap(request), i) for i, s in enumerate(self.slices)]
+                days, i = max(scored, default=(0, None))
+                if not days:
+                    return None, None
+                best = self.slices.pop(i)
+                entry = cache.store.get(best.key(self.cache.name))
+                if entry is not None:
+                    self.slices.append(best)
+                    return best, entry.value
+
+    def _add(self, new, frame):
+        tables = {(self.table_id, new.version)}
+        cache.store.put(
+            new.key(self.cache.name), cache.Entry(self.cache, frame, None, tables)
+        )
+        with self.lock:
+            dropped = [s for s in self.slices if new.covers(s)]
+            self.slices = [s for s in self.slices if not new.covers(s)]
+            self.slices.append(new)
+            dropped += self.slices[: -self.max_entries]
+            del self.slices[: -self.max_entries]
+        for s in dropped:
+            cache.store.discard(s.key(self.cache.name))
+
+    def _count(self, outcome):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def _read(self, version, start, end, apps, countries):
+        filters = snapshot.learner_filters(
+            _yyyymmdd(start), _yyyymmdd(end), apps, countries
+        )
+        return snapshot.load(self.table_id, version, filters)
+
+    def load(self, version, start=None, end=None, apps=None, countries=None):
+        """``snapshot.load`` with ``learner_filters(start, end, apps, countries)``."""
+        filters = snapshot.learner_filters(start, end, apps, countries)
+        request = Slice(
+            version, _day(start, FIRST_DAY), _day(end, LAST_DAY), apps, countries
+        )
+        best, frame = self._best(request)
+        if best is None:
+            self._count("misses")
+            frame = self._read(version, request.start, request.end, apps, countries)
+            self._add(request, frame)
+            return frame
+        first, last = max(best.start, request.start), min(best.end, request.end)
+        pieces = []
+        if request.start < first:
+            pieces.append(
+                self._read(version, request.start, first - _ONE_DAY, apps, countries)
+            )
+        pieces.append(_select(frame, first, last, apps, countries))
+        if last < request.end:
+            pieces.append(
+                self._read(version, last + _ONE_DAY, request.end, apps, countries)
+            )
+        frame = snapshot.stamp(_concat(pieces), self.table_id, version, filters)
+        if len(pieces) == 1:
+            self._count("hits")
+        else:
+            self._count("partial")
+            self._add(request, frame)
+        return frame
@@ -0,0 +1,168 @@
+"""Local columnar snapshots of the nightly BigQuery tables.
+
+The nightly refresh rewrites ``ftm_users`` once a day, so there is no reason
+for every cold Streamlit process to export it again. A snapshot is a Parquet
+file named after the upstream table's last-modified time; it is downloaded
+once per refresh and every loader reads (and filters) the local file.
+
+The store also tells ``ftm.cache`` the latest version of each table, asking
+the backend at most every ``config.SNAPSHOT_CHECK_SECONDS``, so cached
+results are dropped soon after the table changes even if the refresh ran
+late.
+"""
+import os
+import threading
+import time
+
+import pyarrow.parquet as pq
+
+from ftm import bq, cache, config
+from ftm.backend import get_backend
+from ftm.filters import parquet_filter
+from ftm.schema import learner_frame
+
+FTM_USERS_TABLE = "dataexploration-193817.user_data.ftm_users"
+
+
+class SnapshotStore:
+    def __init__(self, root=None, keep=None):
+        self.root = root or os.path.join(config.DATA_DIR, "snapshots")
+        self.keep = keep or config.SNAPSHOT_KEEP
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # Latest version seen per table by this process, when it was
+        # checked, and the backend it came from.
+        self._current = {}
+
+    def _lock(self, table_id):
+        with self._locks_guard:
+            return self._locks.setdefault(table_id, threading.Lock())
+
+    def table_dir(self, table_id):
+        return os.path.join(self.root, table_id.replace(".", "__"))
+
+    def path(self, table_id, version):
+        return os.path.join(self.table_dir(table_id), f"{version}.parquet")
+
+    def versions(self, table_id):
+        """Return the locally available versions of a table, oldest first."""
+        try:
+            names = os.listdir(self.table_dir(table_id))
+        except FileNotFoundError:
+            return []
+        return sorted(n[: -len(".parquet")] for n in names if n.endswith(".parquet"))
+
+    def ensure(self, backend, table_id):
+        """Make sure the latest upstream version is on disk and return it.
+
+        Only the table metadata is fetched when the local copy is current.
+        Cached results computed from an older version are invalidated.
+        """
+        version = backend.table_version(table_id)
+        path = self.path(table_id, version)
+        if not os.path.exists(path):
+            with self._lock(table_id):
+                if not os.path.exists(path):
+                    self._download(backend, table_id, path)
+                    self._prune(table_id)
+        return self._seen(backend, table_id, version)
+
+    def _seen(self, backend, table_id, version):
+        with self._locks_guard:
+            previous = self._current.get(table_id, (None,))[0]
+            self._current[table_id] = (version, time.monotonic(), backend)
+        if previous is not None and version is not None and previous != version:
+            cache.invalidate(table_id, version)
+        return version
+
+    def current(self, table_id):
+        """The latest version of a table, or None if it cannot be found out.
+
+        The backend is asked at most every ``config.SNAPSHOT_CHECK_SECONDS``
+        (the one last passed to ``ensure``, else ``get_backend()``). Cached
+        results computed from an older version are invalidated.
+        """
+        with self._locks_guard:
+            version, checked, backend = self._current.get(table_id, (None, None, None))
+        if checked is not None and (
+            time.monotonic() - checked < config.SNAPSHOT_CHECK_SECONDS
+        ):
+            return version
+        try:
+            backend = backend or get_backend()
+            latest = backend.table_version(table_id)
+        except Exception:
+            # Keep serving what is cached; the check is retried later.
+            latest = version
+        return self._seen(backend, table_id, latest)
+
+    def _download(self, backend, table_id, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        # Batches are written as they arrive so the whole table is never held
+        # in memory.
+        writer = None
+        try:
+            for batch in backend.read_batches(table_id):
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, batch.schema)
+                writer.write_batch(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        os.replace(tmp_path, path)
+
+    def _prune(self, table_id):
+        for version in self.versions(table_id)[: -self.keep]:
+            try:
+                os.remove(self.path(table_id, version))
+            except FileNotFoundError:
+                pass
+
+    def read_table(self, table_id, version, filters=None, columns=None):
+        return pq.read_table(
+            self.path(table_id, version), columns=columns, filters=filters or None
+        )
+
+    def read(self, table_id, version, filters=None, columns=None):
+        return bq.arrow_to_frame(self.read_table(table_id, version, filters, columns))
+
+
+store = SnapshotStore()
+cache.track_versions(store.current)
+
+
+def learner_filters(start=None, end=None, apps=None, countries=None):
+    """Build Parquet filters equivalent to the pages' ftm_users WHERE clauses.
+
+    ``start`` and ``end`` are inclusive ``YYYYMMDD`` strings, matching the
+    format of ``LA_date`` in the table. ``apps`` and ``countries`` are lists
+    or ``filters.Predicate``; None means no restriction.
+    """
+    filters = []
+    if start is not None:
+        filters.append(("LA_date", ">=", start))
+    if end is not None:
+        filters.append(("LA_date", "<=", end))
+    filters += parquet_filter("app_id", apps)
+    filters += parquet_filter("country", countries)
+    return filters
+
+
+def stamp(df, table_id, version, filters):
+    """Stamp ``df`` as read from a snapshot with ``filters``."""
+    cache.depends_on({(table_id, version)})
+    token = (table_id, version, repr(filters))
+    return cache.stamp(df, token, {(table_id, version)})
+
+
+def load(table_id, version, filters):
+    """Read a snapshot as a compact frame stamped with its provenance."""
+    df = learner_frame(store.read_table(table_id, version, filters=filters))
+    return stamp(df, table_id, version, filters)
+
+
+def load_ftm_users(backend, start=None, end=None, apps=None, countries=None):
+    version = store.ensure(backend, FTM_USERS_TABLE)
+    filters = learner_filters(start, end, apps, countries)
+    return load(FTM_USERS_TABLE, version, filters)
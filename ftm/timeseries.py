@@ -0,0 +1,158 @@
+"""Transforms on daily per-campaign (or per-year) LA series."""
+import numpy as np
+import pandas as pd
+
+ALIGN_UNITS = ("D", "W", "M")
+
+
+def normalized_start(daily, by="campaign", date="LA_date", unit="D", name="day"):
+    """Align each group's series on its own start date.
+
+    Returns a copy of ``daily`` with a ``name`` column holding the number of
+    days, weeks or whole months elapsed since the group's first date, plus
+    one (the first period is 1). Missing dates leave gaps in the index rather
+    than shifting later rows, and the input order is irrelevant. With weekly
+    or monthly units several rows share a period; sum them if one point per
+    period is wanted.
+    """
+    if unit not in ALIGN_UNITS:
+        raise ValueError(f"unit must be one of {ALIGN_UNITS}, got {unit!r}")
+    dates = pd.to_datetime(daily[date])
+    start = dates.groupby(daily[by]).transform("min")
+    if unit == "M":
+        elapsed = (dates.dt.year - start.dt.year) * 12 + (
+            dates.dt.month - start.dt.month
+        )
+        elapsed -= (dates.dt.day < start.dt.day).astype(int)
+    else:
+        elapsed = (dates - start).dt.days
+        if unit == "W":
+            elapsed //= 7
+    res = daily.copy()
+    res[name] = elapsed.to_numpy() + 1
+    return res
+
+
+def rolling_means(daily, column, windows, by=None, date="LA_date"):
+    """Trailing means of ``column`` over several windows, per ``by`` group.
+
+    Each group's series is reindexed to every day from its first to its
+    last (every integer, when ``date`` holds day numbers), missing days
+    counting as 0. All the means are then taken from one cumulative sum, so
+    a window never reaches into the previous group. As with
+    ``Series.rolling``, a mean is NaN until its window is full.
+
+    :param windows: mapping from output column to window length in days.
+    :returns: one row per group and day, sorted, with ``by``, ``date``,
+        ``column`` and one column per window.
+    """
+    if by is not None and daily[by].isna().any():
+        # Like groupby, leave out rows whose group is missing.
+        daily = daily[daily[by].notna()]
+    dates = daily[date]
+    is_datetime = pd.api.types.is_datetime64_any_dtype(dates)
+    if is_datetime:
+        days = dates.to_numpy().astype("datetime64[D]").astype(np.int64)
+    else:
+        days = dates.to_numpy(dtype=np.int64)
+    if by is None:
+        codes = np.zeros(len(daily), dtype=np.int64)
+        n_groups = 1 if len(daily) else 0
+    else:
+        codes, groups = pd.factorize(daily[by], sort=True)
+        n_groups = len(groups)
+    first = np.full(n_groups, np.iinfo(np.int64).max)
+    last = np.full(n_groups, np.iinfo(np.int64).min)
+    np.minimum.at(first, codes, days)
+    np.maximum.at(last, codes, days)
+    lengths = last - first + 1
+    starts = np.cumsum(lengths) - lengths
+    total = int(lengths.sum())
+
+    group = np.repeat(np.arange(n_groups), lengths)
+    offset = np.arange(total) - starts[group]
+    values = np.bincount(
+        starts[codes] + days - first[codes],
+        weights=daily[column].to_numpy(dtype=float),
+        minlength=total,
+    )
+    sums = np.concatenate([[0.0], np.cumsum(values)])
+
+    res = {}
+    if by is not None:
+        res[by] = groups.take(group)
+    day = first[group] + offset
+    if is_datetime:
+        res[date] = day.astype("datetime64[D]").astype(dates.dtype)
+    else:
+        res[date] = day
+    if pd.api.types.is_integer_dtype(daily[column]):
+        res[column] = values.round().astype(np.int64)
+    else:
+        res[column] = values
+    end = np.arange(1, total + 1)
+    for name, window in windows.items():
+        mean = (sums[end] - sums[np.maximum(end - window, 0)]) / window
+        mean[offset < window - 1] = np.nan
+        res[name] = mean
+    return pd.DataFrame(res)
+
+
+def lttb(x, y, n):
+    """Positions of ``n`` of the points (x, y) that keep the series' shape.
+
+    Largest-Triangle-Three-Buckets: the first and last points are kept, the
+    others are split into ``n - 2`` buckets and from each the point forming
+    the largest triangle with the point kept from the previous bucket and
+    the mean of the next bucket is kept. ``x`` must be sorted.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < n - 1:
+            nxt = slice(edges[i + 1], edges[i + 2])
+            next_x, next_y = x[nxt].mean(), y[nxt].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        prev = keep[i]
+        area = np.abs(
+            (x[prev] - next_x) * (y[lo:hi] - y[prev])
+            - (x[prev] - x[lo:hi]) * (next_y - y[prev])
+        )
+        keep[i + 1] = lo + np.argmax(area)
+    return keep
+
+
+def downsample(daily, x, y, budget, by=None):
+    """At most about ``budget`` rows of ``daily``, shared among ``by`` groups.
+
+    Each group's series is reduced with ``lttb`` on ``y`` to an equal share
+    of the budget; the other columns follow the rows kept. Rows with a
+    missing ``y`` (such as the start of a rolling mean) are dropped first,
+    as the chart would not draw them anyway.
+    """
+    daily = daily[daily[y].notna()]
+    if len(daily) <= budget:
+        return daily
+    daily = daily.sort_values([by, x] if by else [x], kind="stable")
+    if by is None:
+        starts, ends = np.array([0]), np.array([len(daily)])
+    else:
+        groups = daily[by].to_numpy()
+        changes = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+        starts = np.concatenate([[0], changes])
+        ends = np.concatenate([changes, [len(daily)]])
+    share = max(budget // len(starts), 3)
+    xs = daily[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype("datetime64[s]").astype(np.int64)
+    ys = daily[y].to_numpy(dtype=float)
+    rows = [lo + lttb(xs[lo:hi], ys[lo:hi], share) for lo, hi in zip(starts, ends)]
+    return daily.iloc[np.concatenate(rows)]
@@ -0,0 +1,149 @@
+"""Precompute the pages' results right after the nightly refresh.
+
+Downloads the new snapshots and drops the results computed from older ones,
+then runs the persisted ``ftm.compute`` functions with the arguments the
+pages pass by default and for each year and campaign they can select, so
+that the results are on disk (``ftm.cache.DiskStore``) before anyone opens
+the dashboard:
+
+* Summary: every year, and all years together;
+* Campaign Details: the LA cube and the Daily Reading Activity of every
+  campaign;
+* Campaign Comparison Details: every campaign, and all campaigns together;
+* Manual Analysis: the last 30 days over all apps and countries.
+
+Results expire at the next ``FTM_REFRESH_TIME_UTC`` like any cached result,
+so run this once that time has passed, on the host (or with the
+``FTM_DATA_DIR``) the app uses, e.g. from the refresh cron job:
+
+    python -m ftm.refresh && python -m ftm.warm
+    python -m ftm.warm --pages summary --no-activity
+"""
+import argparse
+import datetime
+import sys
+import time
+import traceback
+
+import pandas as pd
+
+from ftm import cache, compute, cube
+from ftm.backend import get_backend
+from ftm.campaigns import campaign_windows
+from ftm.snapshot import FTM_USERS_TABLE, store
+
+
+def summary(sheets, activity):
+    annual = sheets["annual_metrics"].astype({"year": "int"})
+    years = annual.loc[annual["year"] < pd.to_datetime("today").year + 1, "year"]
+    years = sorted(years.unique().tolist())
+    total_lvls = compute.average_total_levels(sheets["apps"])
+    for selected in [years] + [[y] for y in years]:
+        first, last = min(selected), max(selected)
+        yield f"{first}-{last}", compute.annual_daily_la, (first, last)
+        yield f"{first}-{last}", compute.annual_country_la, (first, last)
+        yield f"{first}-{last}", compute.annual_ra_deciles, (selected, total_lvls)
+
+
+def campaign_details(sheets, activity):
+    apps = sheets["apps"]
+    for _, campaign in sheets["campaigns"].iterrows():
+        name = campaign["Campaign Name"]
+        app = apps.loc[apps["language"] == campaign["Language"], "app_id"]
+        if len(app) != 1:
+            print(f"skipping {name}: no single app for its language", file=sys.stderr)
+            continue
+        countries = None if campaign["Country"] == "All" else [campaign["Country"]]
+        args = (campaign["Start Date"], campaign["End Date"], [app.item()], countries)
+        yield name, compute.la_daily_cube, args
+        yield name, compute.la_cube, args
+        if activity:
+            yield name, compute.daily_activity, args
+
+
+def campaign_comparison_details(sheets, activity):
+    campaigns = sheets["campaigns"]
+    apps = sheets["apps"]
+    total_lvls = apps["total_lvls"][0]
+    selections = [("all", campaigns)] + [
+        (name, campaigns[campaigns["Campaign Name"] == name])
+        for name in campaigns["Campaign Name"].unique()
+    ]
+    for label, selected in selections:
+        windows = campaign_windows(selected, apps)
+        yield label, compute.campaign_daily_la, (windows,)
+        yield label, compute.campaign_metrics, (windows, total_lvls)
+        yield label, compute.campaign_ra_deciles, (windows, total_lvls)
+
+
+def manual_analysis(sheets, activity):
+    today = pd.to_datetime("today").date()
+    # Every app and country, which ftm.filters.plan turns into no filter.
+    args = (
+        today - pd.Timedelta(30, unit="D"),
+        today - pd.Timedelta(1, unit="D"),
+        None,
+        None,
+    )
+    yield "last 30 days", compute.la_daily_cube, args
+    yield "last 30 days", compute.la_cube, args
+
+
+PAGES = {
+    "summary": summary,
+    "campaign_details": campaign_details,
+    "campaign_comparison_details": campaign_comparison_details,
+    "manual_analysis": manual_analysis,
+}
+
+
+def warm(pages, activity=True):
+    """Compute every result of ``pages``; returns the number that failed."""
+    backend = get_backend()
+    for table_id in (FTM_USERS_TABLE, *cube.KEYS):
+        started = time.perf_counter()
+        version = store.ensure(backend, table_id)
+        cache.invalidate(table_id, version)
+        elapsed = time.perf_counter() - started
+        print(f"snapshot {table_id} {version} ({elapsed:.1f}s)", file=sys.stderr)
+    sheets = backend.load_sheets()
+    failed = 0
+    for page in pages:
+        for label, func, args in PAGES[page](sheets, activity):
+            started = time.perf_counter()
+            try:
+                func(*args)
+            except Exception:
+                failed += 1
+                print(f"{page} {label} {func.__name__} failed:", file=sys.stderr)
+                traceback.print_exc()
+                continue
+            print(
+                f"{page:<28} {label:<32} {func.__name__:<22} "
+                f"{time.perf_counter() - started:.2f}s",
+                file=sys.stderr,
+            )
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the pages' results.")
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES))
+    parser.add_argument(
+        "--no-activity",
+        action="store_true",
+        help="skip the Daily Reading Activity queries (billed BigQuery jobs)",
+    )
+    args = parser.parse_args(argv)
+
+    failed = warm(args.pages, activity=not args.no_activity)
+    expires = datetime.datetime.fromtimestamp(
+        cache.next_refresh(), datetime.timezone.utc
+    )
+    print(cache.stats().to_string(index=False))
+    print(f"Results expire at {expires:%Y-%m-%d %H:%M} UTC; {failed} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
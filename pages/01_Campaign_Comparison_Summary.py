@@ -3,84 +3,34 @@
 # Last updated Dec 2022
 # 01_Campaign_Comparison_Summary.py
 import streamlit as st
-from google.oauth2 import service_account
-from google.cloud import bigquery
-from gsheetsdb import connect
 import datetime
 import pandas as pd
 import db_dtypes
+from ftm import figures, profiler, sheets
 import json
 import plotly
 import plotly.express as px
 import plotly.graph_objects as go
 
-# --- DATA ---
-# Create a Google Sheets connection object.
-credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"],
-    scopes=[
-        "https://www.googleapis.com/auth/spreadsheets",
-    ],
-)
-conn = connect(credentials=credentials)
-# Create BigQuery API client.
-bq_credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"]
-)
-client = bigquery.Client(credentials=bq_credentials)
+# Developer profiler, enabled with ?profile=1 (see ftm.profiler).
+profiler.begin("Campaign Comparison Summary")
 
-
-def run_query(query):
-    rows = conn.execute(query, headers=1)
-    rows = rows.fetchall()
-    return rows
+# --- DATA ---
 
 
-@st.cache_data
+@profiler.profiled
 def get_campaign_data():
-    campaign_sheet_url = st.secrets["Campaign_gsheets_url"]
-    campaign_rows = run_query(f'SELECT * FROM "{campaign_sheet_url}"')
-    campaign_data = pd.DataFrame(
-        columns=[
-            "Campaign Name",
-            "Language",
-            "Country",
-            "Start Date",
-            "End Date",
-            "Total Cost (USD)",
-        ],
-        data=campaign_rows,
-    )
-    campaign_data["Start Date"] = (pd.to_datetime(campaign_data["Start Date"])).dt.date
-    campaign_data["End Date"] = (
-        pd.to_datetime(campaign_data["End Date"])
-        + pd.DateOffset(months=1)
-        - pd.Timedelta(1, unit="D")
-    ).dt.date
-    campaign_data = campaign_data.astype({"Total Cost (USD)": "float"})
-    return campaign_data
+    return sheets.get("campaigns")
 
 
-@st.cache_data
+@profiler.profiled
 def get_apps_data():
-    apps_sheet_url = st.secrets["ftm_apps_gsheets_url"]
-    apps_rows = run_query(
-        f'SELECT app_id, language, bq_property_id, bq_project_id, total_lvls FROM "{apps_sheet_url}"'
-    )
-    apps_data = pd.DataFrame(
-        columns=["app_id", "language", "bq_property_id", "bq_project_id", "total_lvls"],
-        data=apps_rows,
-    )
-    return apps_data
+    return sheets.get("apps")
 
 
-@st.cache_data
+@profiler.profiled
 def get_campaign_metrics():
-    camp_metrics_url = st.secrets["campaign_metrics_gsheets_url"]
-    camp_metrics_rows = run_query(f'SELECT * FROM "{camp_metrics_url}"')
-    camp_metrics_data = pd.DataFrame(
-        columns=["campaign_name", "la", "lac", "ra", "rac"], data=camp_metrics_rows
-    )
+    camp_metrics_data = sheets.get("campaign_metrics")
     camp_metrics_data = camp_metrics_data.astype(
         {"la": "int", "lac": "float", "ra": "float", "rac": "float"}
     )
@@ -172,18 +122,8 @@ gantt_df = pd.merge(
     left_on="Campaign Name",
     right_on="campaign_name",
 )
-gantt = px.timeline(
-    gantt_df,
-    x_start="Start Date",
-    x_end="End Date",
-    y="Campaign Name",
-    color="Campaign Name",
-    hover_data=["Total Cost (USD)", "la"],
-    labels={"Campaign Name": "Campaign", "la": "LA"},
-    title="Gantt Chart",
-)
-gantt.update_layout(showlegend=False)
-st.plotly_chart(gantt)
+gantt = figures.gantt(gantt_df)
+profiler.plotly_chart(gantt)
 
 # LEADERBOARD
 st.markdown("***")
@@ -240,85 +180,39 @@ ftm_campaign_metrics["rac"] = round(ftm_campaign_metrics["rac"], 3)
 ftm_campaign_metrics["lac"] = round(ftm_campaign_metrics["lac"], 3)
 # Convert NaN values to 0
 ftm_campaign_metrics = ftm_campaign_metrics.fillna(0)
-lavsra = px.scatter(
+lavsra = figures.quadrant(
     ftm_campaign_metrics,
-    x="ra",
-    y="la",
-    color="campaign_name",
-    size="camp_age",
-    labels={
-        "ra": "RA",
-        "la": "LA",
-        "camp_age": "Campaign Age (Days)",
-        "campaign_name": "Campaign",
-    },
-    title="LA vs RA",
-)
-lavsra.add_shape(
-    type="rect",
-    xref="x domain",
-    yref="y domain",
-    x0=0.5,
-    x1=1,
-    y0=0.5,
-    y1=1,
-    line=dict(color="LightGreen", width=3),
+    "ra",
+    "la",
+    {"ra": "RA", "la": "LA"},
+    "LA vs RA",
+    (0.5, 1, 0.5, 1),
 )
-st.plotly_chart(lavsra)
+profiler.plotly_chart(lavsra)
 st.markdown("***")
 
 st.subheader("Cost Analysis")
 st.markdown("*Which campaigns are the most cost effective?*")
-lacvsrac = px.scatter(
+lacvsrac = figures.quadrant(
     ftm_campaign_metrics,
-    x="lac",
-    y="rac",
-    color="campaign_name",
-    size="camp_age",
-    labels={
-        "lac": "LAC",
-        "rac": "RAC",
-        "camp_age": "Campaign Age (Days)",
-        "campaign_name": "Campaign",
-    },
-    title="LAC vs RAC",
+    "lac",
+    "rac",
+    {"lac": "LAC", "rac": "RAC"},
+    "LAC vs RAC",
+    (0, 0.5, 0, 0.5),
 )
-lacvsrac.add_shape(
-    type="rect",
-    xref="x domain",
-    yref="y domain",
-    x0=0,
-    x1=0.5,
-    y0=0,
-    y1=0.5,
-    line=dict(color="LightGreen", width=3),
-)
-st.plotly_chart(lacvsrac)
+profiler.plotly_chart(lacvsrac)
 st.markdown(
     "*Which campaigns are the most cost effective at reaching learners at scale?*"
 )
-lavslac = px.scatter(
+lavslac = figures.quadrant(
     ftm_campaign_metrics,
-    x="la",
-    y="lac",
-    color="campaign_name",
-    size="camp_age",
-    labels={
-        "la": "LA",
-        "lac": "LAC",
-        "camp_age": "Campaign Age (Days)",
-        "campaign_name": "Campaign",
-    },
-    title="LA vs LAC",
-)
-lavslac.add_shape(
-    type="rect",
-    xref="x domain",
-    yref="y domain",
-    x0=0.5,
-    x1=1,
-    y0=0,
-    y1=0.5,
-    line=dict(color="LightGreen", width=3),
+    "la",
+    "lac",
+    {"la": "LA", "lac": "LAC"},
+    "LA vs LAC",
+    (0.5, 1, 0, 0.5),
 )
-st.plotly_chart(lavslac)
+profiler.plotly_chart(lavslac)
+
+profiler.sidebar()
@@ -2,12 +2,10 @@
 # Last updated Dec 2022
 # 02_Campaign_Details.py
 import streamlit as st
-from google.oauth2 import service_account
-from google.cloud import bigquery
-from gsheetsdb import connect
 import datetime
 import pandas as pd
 import db_dtypes
+from ftm import compute, cube, figures, geo, profiler, sheets
 import json
 import plotly
 import plotly.express as px
@@ -17,150 +15,28 @@ from millify import millify
 # from plotly_calplot import calplot
 import calplot
 
-# --- DATA ---
-# Create a Google Sheets connection object.
-credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"],
-    scopes=[
-        "https://www.googleapis.com/auth/spreadsheets",
-    ],
-)
-conn = connect(credentials=credentials)
-# Create BigQuery API client.
-bq_credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"]
-)
-client = bigquery.Client(credentials=bq_credentials)
+# Developer profiler, enabled with ?profile=1 (see ftm.profiler).
+profiler.begin("Campaign Details")
 
-
-def run_query(query):
-    rows = conn.execute(query, headers=1)
-    rows = rows.fetchall()
-    return rows
+# --- DATA ---
+# The LA cube and reading activity come from ftm.compute, which reads the
+# data backend (BigQuery, or local fixtures with FTM_BACKEND=local) and
+# caches results until the next nightly refresh.
 
 
-@st.cache_data
+@profiler.profiled
 def get_campaign_data():
-    campaign_sheet_url = st.secrets["Campaign_gsheets_url"]
-    campaign_rows = run_query(f'SELECT * FROM "{campaign_sheet_url}"')
-    campaign_data = pd.DataFrame(
-        columns=[
-            "Campaign Name",
-            "Language",
-            "Country",
-            "Start Date",
-            "End Date",
-            "Total Cost (USD)",
-        ],
-        data=campaign_rows,
-    )
-    campaign_data["Start Date"] = (pd.to_datetime(campaign_data["Start Date"])).dt.date
-    campaign_data["End Date"] = (
-        pd.to_datetime(campaign_data["End Date"])
-        + pd.DateOffset(months=1)
-        - pd.Timedelta(1, unit="D")
-    ).dt.date
-    campaign_data = campaign_data.astype({"Total Cost (USD)": "float"})
-    return campaign_data
+    return sheets.get("campaigns")
 
 
-@st.cache_data
-def get_user_data(start_date, end_date, app, country):
-    start = start_date.strftime("%Y%m%d")
-    end = end_date.strftime("%Y%m%d")
-    if country == "All":
-        sql_query = f"""
-            SELECT * FROM `dataexploration-193817.user_data.ftm_users`
-            WHERE LA_date BETWEEN @start AND @end
-            AND app_id = @app
-        """
-    else:
-        sql_query = f"""
-            SELECT * FROM `dataexploration-193817.user_data.ftm_users`
-            WHERE LA_date BETWEEN @start AND @end
-            AND app_id = @app
-            AND country = @country
-        """
-    query_parameters = [
-        bigquery.ScalarQueryParameter("start", "STRING", start),
-        bigquery.ScalarQueryParameter("end", "STRING", end),
-        bigquery.ScalarQueryParameter("app", "STRING", app),
-        bigquery.ScalarQueryParameter("country", "STRING", country),
-    ]
-    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
-    rows_raw = client.query(sql_query, job_config=job_config)
-    rows = [dict(row) for row in rows_raw]
-    df = pd.DataFrame(rows)
-    df["LA_date"] = (pd.to_datetime(df["LA_date"])).dt.date
-    df["max_lvl_date"] = (pd.to_datetime(df["max_lvl_date"])).dt.date
-    return df
-
-
-@st.cache_data
+@profiler.profiled
 def get_apps_data():
-    apps_sheet_url = st.secrets["ftm_apps_gsheets_url"]
-    apps_rows = run_query(
-        f'SELECT app_id, language, bq_property_id, bq_project_id, total_lvls FROM "{apps_sheet_url}"'
-    )
-    apps_data = pd.DataFrame(
-        columns=["app_id", "language", "bq_property_id", "bq_project_id", "total_lvls"],
-        data=apps_rows,
-    )
-    return apps_data
-
-
-# @st.cache_data
-def get_ra_segments(campaign_data, total_lvls, user_data):
-    df = pd.DataFrame(columns=["segment", "la", "perc_la", "ra", "rac"])
-    seg = []
-    ra = []
-    for lvl in user_data["max_lvl"]:
-        perc = lvl / total_lvls
-        ra.append(perc)
-        if perc < 0.1:
-            seg.append(0.1)
-        elif 0.1 <= perc < 0.2:
-            seg.append(0.2)
-        elif 0.2 <= perc < 0.3:
-            seg.append(0.3)
-        elif 0.3 <= perc < 0.4:
-            seg.append(0.4)
-        elif 0.4 <= perc < 0.5:
-            seg.append(0.5)
-        elif 0.5 <= perc < 0.6:
-            seg.append(0.6)
-        elif 0.6 <= perc < 0.7:
-            seg.append(0.7)
-        elif 0.7 <= perc < 0.8:
-            seg.append(0.8)
-        elif 0.8 <= perc < 0.9:
-            seg.append(0.9)
-        else:
-            seg.append(1)
-    user_data["seg"] = seg
-    user_data["ra"] = ra
-    res = (
-        user_data.groupby("seg")
-        .agg(la=("user_pseudo_id", "count"), ra=("ra", "mean"))
-        .reset_index()
-    )
-    res["la_perc"] = res["la"] / res["la"].sum()
-    res["rac"] = round(
-        campaign_data["Total Cost (USD)"][0]
-        * res["la_perc"]
-        / (res["ra"] * res["la"].sum()),
-        2,
-    )
-    return res
+    return sheets.get("apps")
 
 
-@st.cache_data
+@profiler.profiled
 def get_campaign_metrics():
-    camp_metrics_url = st.secrets["campaign_metrics_gsheets_url"]
-    camp_metrics_rows = run_query(f'SELECT * FROM "{camp_metrics_url}"')
-    camp_metrics_data = pd.DataFrame(
-        columns=["campaign_name", "la", "lac", "ra", "rac"], data=camp_metrics_rows
-    )
+    camp_metrics_data = sheets.get("campaign_metrics")
     camp_metrics_data = camp_metrics_data.fillna(0)
     camp_metrics_data = camp_metrics_data.astype(
         {"la": "int", "lac": "float", "ra": "float", "rac": "float"}
@@ -168,57 +44,6 @@ def get_campaign_metrics():
     return camp_metrics_data
 
 
-@st.cache_data
-def get_daily_activity(user_data, start_date, app, country, bq_id, property_id):
-    user_ids = user_data["user_pseudo_id"].tolist()
-    if country == "All":
-        sql_query = f"""
-            SELECT event_date, COUNT(event_name) AS levels_played FROM `{bq_id}.analytics_{property_id}.events_20*`,
-            UNNEST(event_params) AS params
-            WHERE PARSE_DATE('%y%m%d', _table_suffix) BETWEEN @start AND @end
-            AND app_info.id = @app
-            AND user_pseudo_id IN UNNEST(@user_ids)
-            AND event_name LIKE 'GamePlay'
-            AND params.key = 'action'
-            AND (params.value.string_value LIKE '%LevelSuccess%'
-            OR params.value.string_value LIKE '%LevelFail%')
-            GROUP BY event_date
-            ORDER BY event_date
-        """
-    else:
-        sql_query = f"""
-            SELECT event_date, COUNT(event_name) AS levels_played FROM `{bq_id}.analytics_{property_id}.events_20*`,
-            UNNEST(event_params) AS params
-            WHERE PARSE_DATE('%y%m%d', _table_suffix) BETWEEN @start AND @end
-            AND app_info.id = @app
-            AND geo.country = @country
-            AND user_pseudo_id IN UNNEST(@user_ids)
-            AND event_name LIKE 'GamePlay'
-            AND params.key = 'action'
-            AND (params.value.string_value LIKE '%LevelSuccess%'
-            OR params.value.string_value LIKE '%LevelFail%')
-            GROUP BY event_date
-            ORDER BY event_date 
-        """
-    query_parameters = [
-        bigquery.ScalarQueryParameter("start", "DATE", start_date),
-        bigquery.ScalarQueryParameter(
-            "end", "DATE", pd.to_datetime("today").date() - pd.Timedelta(1, unit="D")
-        ),
-        bigquery.ScalarQueryParameter("app", "STRING", app),
-        bigquery.ScalarQueryParameter("country", "STRING", country),
-        bigquery.ScalarQueryParameter("bq_id", "STRING", bq_id),
-        bigquery.ScalarQueryParameter("property_id", "STRING", property_id),
-        bigquery.ArrayQueryParameter("user_ids", "STRING", user_ids),
-    ]
-    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
-    rows_raw = client.query(sql_query, job_config=job_config)
-    rows = [dict(row) for row in rows_raw]
-    df = pd.DataFrame(rows)
-    df["event_date"] = pd.to_datetime(df["event_date"])
-    return df
-
-
 # --- UI ---
 st.title("Campaign Details")
 expander = st.expander("Definitions")
@@ -282,14 +107,13 @@ app = ftm_apps.loc[ftm_apps["language"] == language, "app_id"].item()
 country = ftm_campaigns.loc[
     ftm_campaigns["Campaign Name"] == campaign, "Country"
 ].item()
-bq_id = ftm_apps.loc[ftm_apps["language"] == language, "bq_project_id"].item()
-property_id = ftm_apps.loc[ftm_apps["language"] == language, "bq_property_id"].item()
-users_df = get_user_data(start_date, end_date, app, country)
+countries = None if country == "All" else [country]
+daily_cube = compute.la_daily_cube(start_date, end_date, [app], countries)
 campaign_data = get_campaign_metrics()
 
 # METRICS
 col1, col2, col3, col4, col5 = st.columns(5)
-col1.metric("Total LA", millify(str(len(users_df))))
+col1.metric("Total LA", millify(str(cube.total_la(daily_cube))))
 col2.metric(
     "Avg RA",
     millify(
@@ -319,63 +143,34 @@ col5.metric(
 )
 
 # DAILY LEARNERS ACQUIRED
-daily_la = (
-    users_df.groupby(["LA_date"])["user_pseudo_id"]
-    .count()
-    .reset_index(name="Learners Acquired")
-)
-daily_la["7 Day Rolling Mean"] = daily_la["Learners Acquired"].rolling(7).mean()
-daily_la["30 Day Rolling Mean"] = daily_la["Learners Acquired"].rolling(30).mean()
-daily_la_fig = px.line(
-    daily_la,
-    x="LA_date",
-    y="Learners Acquired",
-    labels={"LA_date": "Date", "Learners Acquired": "LA"},
-    title="Daily LA",
-)
-rm_fig = px.line(
-    daily_la,
-    x="LA_date",
-    y=["7 Day Rolling Mean", "30 Day Rolling Mean"],
-    color_discrete_map={"7 Day Rolling Mean": "green", "30 Day Rolling Mean": "red"},
-)
-daily_la_fig.add_trace(rm_fig.data[0])
-daily_la_fig.add_trace(rm_fig.data[1])
-st.plotly_chart(daily_la_fig)
+daily_la = cube.daily_la(daily_cube, name="Learners Acquired")
+daily_la_fig = figures.daily_la_rolling(daily_la)
+profiler.plotly_chart(daily_la_fig)
 
 if country == "All":
-    country_la = (
-        users_df.groupby(["country"])["user_pseudo_id"].count().reset_index(name="LA")
-    )
-    country_fig = px.choropleth(
-        country_la,
-        locations="country",
-        color="LA",
-        color_continuous_scale=[
-            "#1584A3",
-            "#DB830F",
-            "#E6DF15",
-        ],  # ['blue', 'red', 'yellow'],
-        locationmode="country names",
-        title="LA by Country",
-    )
-    country_fig.update_layout(geo=dict(bgcolor="rgba(0,0,0,0)"))
-    st.plotly_chart(country_fig)
+    country_la = cube.country_la(daily_cube)
+    country_fig = figures.country_map(country_la)
+    profiler.plotly_chart(country_fig)
+    note = geo.unmatched_note(country_la)
+    if note:
+        st.caption(note)
 
 # READING ACQUISITION DECILES
 total_lvls = ftm_apps.loc[ftm_apps["language"] == language, "total_lvls"].item()
-ra_segs = get_ra_segments(ftm_campaigns, total_lvls, users_df)
+campaign_cost = ftm_campaigns.loc[
+    ftm_campaigns["Campaign Name"] == campaign, "Total Cost (USD)"
+].item()
+la_cube = compute.la_cube(start_date, end_date, [app], countries)
+ra_segs = cube.cube_ra_segments(la_cube, total_lvls, cost=campaign_cost)
 ra_segs["la_perc"] = round(ra_segs["la_perc"], 2)
-ra_segs_fig = px.bar(
+ra_segs_fig = figures.ra_deciles(
     ra_segs,
-    x="seg",
-    y="la_perc",
+    "LA by RA Decile",
+    {"seg": "RA Decile", "rac": "RAC (USD)", "la_perc": "% LA", "la": "LA"},
     hover_data=["la", "rac"],
-    labels={"seg": "RA Decile", "rac": "RAC (USD)", "la_perc": "% LA", "la": "LA"},
     text_auto=True,
-    title="LA by RA Decile",
 )
-st.plotly_chart(ra_segs_fig)
+profiler.plotly_chart(ra_segs_fig)
 st.caption(
     """The chart above displays LA by *RA Decile*.
     RA Deciles represent the progression of reading acquisition split into ten percentage groups.
@@ -390,29 +185,13 @@ st.markdown(
 col5, col6 = st.columns(2)
 cb = col5.checkbox("View")
 if cb == True:
-    daily_activity = get_daily_activity(
-        users_df, start_date, app, country, bq_id, property_id
-    )
+    daily_activity = compute.daily_activity(start_date, end_date, [app], countries)
     col6.metric("Total Levels Played", millify(daily_activity["levels_played"].sum()))
     tab1, tab2 = st.tabs(["Timeseries", "Heatmap"])
-    daily_activity_fig = px.bar(
-        daily_activity,
-        x="event_date",
-        y="levels_played",
-        labels={"event_date": "Date", "levels_played": "# Levels Played"},
-    )
-    tab1.plotly_chart(daily_activity_fig)
-
-    import numpy as np
-
-    fig = px.scatter(
-        daily_activity,
-        x="event_date",
-        y="levels_played",
-        size="levels_played",
-        title="Levels Played Over Time",
-    )
-
-    tab2.plotly_chart(fig, use_container_width=True)
+    daily_activity_fig, fig = figures.levels_played(daily_activity)
+    profiler.plotly_chart(daily_activity_fig, tab1)
+    profiler.plotly_chart(fig, tab2, use_container_width=True)
 
 st.markdown("***")
+
+profiler.sidebar()
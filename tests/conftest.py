@@ -0,0 +1,31 @@
+import pytest
+
+from ftm import cache, cube, fixtures, snapshot
+from ftm.backend import LocalBackend
+
+
+@pytest.fixture(scope="session")
+def local_db(tmp_path_factory):
+    """Path of a small generated fixture database (``ftm.fixtures``)."""
+    path = tmp_path_factory.mktemp("fixtures") / "fixtures.duckdb"
+    fixtures.generate(3000, str(path), seed=0)
+    return str(path)
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Snapshots and persisted results under ``tmp_path``, with empty caches."""
+    monkeypatch.setattr(snapshot.store, "root", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(cache.disk, "root", str(tmp_path / "results"))
+    # Versions seen by earlier tests.
+    monkeypatch.setattr(snapshot.store, "_current", {})
+    cache.store.clear()
+    cube.clear_slices()
+    yield tmp_path
+    cache.store.clear()
+    cube.clear_slices()
+
+
+@pytest.fixture
+def backend(local_db, data_dir):
+    return LocalBackend(local_db)
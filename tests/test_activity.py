@@ -0,0 +1,56 @@
+import types
+
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
+
+from ftm import activity, config
+
+
+class FakeClient:
+    """The BigQuery client calls ``bq.stage_column`` makes, in memory."""
+
+    def __init__(self):
+        self.tables = {}
+        self.loads = 0
+
+    def get_table(self, table_id):
+        if table_id not in self.tables:
+            raise NotFound(table_id)
+        return self.tables[table_id]
+
+    def load_table_from_file(self, buf, table_id, job_config):
+        self.loads += 1
+        self.tables[table_id] = types.SimpleNamespace(
+            rows=pq.read_table(buf).to_pydict(), expires=None
+        )
+        return types.SimpleNamespace(result=lambda: None)
+
+    def update_table(self, table, fields):
+        assert fields == ["expires"]
+        return table
+
+
+def test_small_id_sets_are_inlined():
+    client = FakeClient()
+    sql, params = activity.id_set(client, ["a", "b"])
+    assert "UNNEST(@user_ids)" in sql
+    assert params[0].values == ["a", "b"]
+    assert client.loads == 0
+
+
+def test_large_id_sets_are_staged_once(monkeypatch):
+    monkeypatch.setattr(activity, "INLINE_IDS_LIMIT", 2)
+    client = FakeClient()
+    ids = ["c", "a", "b", "a"]
+    sql, params = activity.id_set(client, ids)
+    assert params == []
+    [(table_id, table)] = client.tables.items()
+    assert table_id.startswith(f"{config.STAGING_DATASET}._staged_user_pseudo_id_")
+    assert sql == f"SELECT user_pseudo_id FROM `{table_id}`"
+    assert table.rows == {"user_pseudo_id": ["a", "b", "c"]}
+    assert table.expires is not None
+    # The same set, in any order, reuses the staged table.
+    assert activity.id_set(client, reversed(ids)) == (sql, [])
+    assert client.loads == 1
+    assert activity.id_set(client, ids + ["d"])[0] != sql
+    assert client.loads == 2
@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from ftm import cache
+
+TABLE = ("project.dataset.table", "v1")
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    res = cache.Store(10**9)
+    monkeypatch.setattr(cache, "store", res)
+    monkeypatch.setattr(cache, "disk", cache.DiskStore(str(tmp_path)))
+    # TABLE is not a snapshot table.
+    monkeypatch.setattr(cache, "_versions", None)
+    yield res
+    # Entry counts live on the (shared) function caches.
+    res.clear()
+
+
+def counting(calls, **kwargs):
+    @cache.cached(ttl=None, **kwargs)
+    def double(x):
+        calls.append(x)
+        return x * 2
+
+    return double
+
+
+def test_cached_computes_once_per_key(store):
+    calls = []
+    double = counting(calls)
+    assert [double(1), double(1), double(2)] == [2, 2, 4]
+    assert calls == [1, 2]
+
+
+def test_stamped_frames_are_not_hashed(store):
+    @cache.cached(ttl=None)
+    def total(df):
+        return df["a"].sum()
+
+    df = cache.stamp(pd.DataFrame({"a": [1, 2]}), "token", {TABLE})
+    assert total(df) == total(df) == 3
+    assert total.function_cache.hashed == 0
+    assert total(pd.DataFrame({"a": [1, 2]})) == 3
+    assert total.function_cache.hashed == 1
+
+
+def test_concurrent_calls_compute_once(store):
+    calls = []
+    started = threading.Event()
+
+    @cache.cached(ttl=None)
+    def slow(x):
+        calls.append(x)
+        started.wait(1)
+        return x
+
+    threads = [threading.Thread(target=slow, args=(1,)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    started.set()
+    for t in threads:
+        t.join()
+    assert calls == [1]
+
+
+def test_key_lock_released_when_compute_raises(store):
+    @cache.cached(ttl=None)
+    def fails(x):
+        raise ValueError(x)
+
+    with pytest.raises(ValueError):
+        fails(1)
+    assert fails.function_cache.key_locks == {}
+
+
+def test_max_entries_evicts_least_recently_used(store):
+    calls = []
+    double = counting(calls, max_entries=2)
+    evicted = double.function_cache.evicted
+    double(1), double(2), double(1), double(3)
+    double(1)
+    double(2)
+    assert calls == [1, 2, 3, 2]
+    assert double.function_cache.evicted - evicted == 2
+
+
+def test_memory_budget_evicts_oldest(store):
+    @cache.cached(ttl=None)
+    def frame(n):
+        return pd.DataFrame({"a": range(n)})
+
+    frame(1000)
+    store.budget_bytes = store.bytes + 100
+    frame(1001)
+    assert len(store.entries) == 1
+    assert frame.function_cache.evicted == 1
+
+
+def test_ttl_expires(store):
+    @cache.cached(ttl=0.01)
+    def now(x):
+        return time.perf_counter()
+
+    first = now(1)
+    time.sleep(0.02)
+    assert now(1) != first
+    assert now.function_cache.expired == 1
+
+
+def test_invalidate_drops_results_of_older_versions(store):
+    @cache.cached(ttl=None)
+    def total(df):
+        return df["a"].sum()
+
+    df = cache.stamp(pd.DataFrame({"a": [1]}), "token", {TABLE})
+    total(df)
+    assert cache.invalidate(TABLE[0], TABLE[1]) == 0
+    assert cache.invalidate(TABLE[0], "v2") == 1
+    assert not store.entries
+
+
+def test_lookup_drops_results_of_older_versions(store, monkeypatch):
+    latest = {}
+    monkeypatch.setattr(cache, "_versions", latest.get)
+    calls = []
+
+    @cache.cached(ttl=None)
+    def total(df):
+        calls.append(1)
+        return df["a"].sum()
+
+    df = cache.stamp(pd.DataFrame({"a": [1]}), "token", {TABLE})
+    total(df), total(df)
+    latest[TABLE[0]] = TABLE[1]
+    total(df)
+    assert len(calls) == 1
+    latest[TABLE[0]] = "v2"
+    total(df)
+    assert len(calls) == 2
+    assert total.function_cache.entries == 1
+
+
+def test_persisted_results_survive_the_store(store):
+    calls = []
+
+    @cache.cached(ttl=None, persist=True)
+    def frame(n):
+        calls.append(n)
+        return pd.DataFrame({"a": range(n)})
+
+    expected = frame(3)
+    store.clear()
+    pd.testing.assert_frame_equal(frame(3), expected)
+    assert calls == [3]
+    assert frame.function_cache.loaded == 1
+
+
+def test_disk_store_expiry_and_invalidation(tmp_path):
+    disk = cache.DiskStore(str(tmp_path))
+    df = pd.DataFrame({"a": [1, 2]})
+    disk.put("f", 1, df, None, {TABLE})
+    disk.put("f", 2, df, time.time() - 1, {TABLE})
+    value, expires, tables = disk.get("f", 1)
+    pd.testing.assert_frame_equal(value, df)
+    assert (expires, tables) == (None, {TABLE})
+    assert disk.get("f", 2) is None
+    assert disk.invalidate(TABLE[0], "v2") == 1
+    assert disk.get("f", 1) is None
+
+
+def test_disk_store_prunes_on_a_schedule(tmp_path, monkeypatch):
+    disk = cache.DiskStore(str(tmp_path), prune_interval=3600)
+    pruned = []
+    monkeypatch.setattr(disk, "prune", pruned.append)
+    for key in range(5):
+        disk.put("f", key, pd.DataFrame({"a": [key]}), None, ())
+    assert pruned == ["f"]
+
+
+def test_disk_store_drops_results_of_older_versions(tmp_path, monkeypatch):
+    latest = {TABLE[0]: TABLE[1]}
+    monkeypatch.setattr(cache, "_versions", latest.get)
+    disk = cache.DiskStore(str(tmp_path))
+    disk.put("f", 1, pd.DataFrame({"a": [1]}), None, {TABLE})
+    assert disk.get("f", 1) is not None
+    latest[TABLE[0]] = "v2"
+    assert disk.get("f", 1) is None
+    assert not os.path.exists(disk.path("f", 1))
+
+
+def test_disk_store_keeps_the_most_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "_versions", None)
+    disk = cache.DiskStore(str(tmp_path), max_entries=3)
+    for key in range(3):
+        disk.put("f", key, pd.DataFrame({"a": [key]}), None, ())
+        os.utime(disk.path("f", key), ns=(key + 1, key + 1))
+    assert disk.get("f", 0) is not None
+    disk.put("f", 3, pd.DataFrame({"a": [3]}), None, ())
+    disk.put("f", 4, pd.DataFrame({"a": [4]}), None, ())
+    kept = [key for key in range(5) if os.path.exists(disk.path("f", key))]
+    assert kept == [0, 3, 4]
+    # Rewriting an entry does not count as a new one.
+    disk.put("f", 4, pd.DataFrame({"a": [4]}), None, ())
+    assert len(disk._paths("f")) == 3
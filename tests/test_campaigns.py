@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from ftm.campaigns import ALL_COUNTRIES, LearnerIndex
+
+
+def learners(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    country = rng.choice(["India", "Kenya", "Brazil", None], n, p=[0.4, 0.3, 0.2, 0.1])
+    return pd.DataFrame(
+        {
+            "user_pseudo_id": [f"u{i}" for i in range(n)],
+            "LA_date": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(rng.integers(0, 120, n), unit="D"),
+            "app_id": rng.choice(["app.a", "app.b", "app.c"], n),
+            "country": country,
+            "max_lvl": rng.integers(1, 50, n),
+        }
+    )
+
+
+def windows():
+    rows = [
+        ("all countries", "app.a", ALL_COUNTRIES, "2024-01-10", "2024-02-10"),
+        ("india", "app.a", "India", "2024-01-10", "2024-02-10"),
+        ("overlapping", "app.a", "India", "2024-02-01", "2024-03-01"),
+        ("one day", "app.b", "Kenya", "2024-03-05", "2024-03-05"),
+        ("before the data", "app.c", ALL_COUNTRIES, "2023-01-01", "2023-06-01"),
+        ("across the data", "app.c", "Brazil", "2023-06-01", "2025-01-01"),
+        ("unknown app", "app.z", ALL_COUNTRIES, "2024-01-01", "2024-12-31"),
+        ("unknown country", "app.b", "Peru", "2024-01-01", "2024-12-31"),
+        ("missing app", None, ALL_COUNTRIES, "2024-01-01", "2024-12-31"),
+        ("empty", "app.b", ALL_COUNTRIES, "2024-03-01", "2024-02-01"),
+    ]
+    res = pd.DataFrame(rows, columns=["campaign", "app_id", "country", "start", "end"])
+    res[["start", "end"]] = res[["start", "end"]].apply(pd.to_datetime)
+    return res
+
+
+def brute_force(users, windows):
+    parts = []
+    for w in windows.itertuples():
+        mask = (users["app_id"] == w.app_id) & users["LA_date"].between(w.start, w.end)
+        if w.country != ALL_COUNTRIES:
+            mask &= users["country"] == w.country
+        parts.append(users[mask].assign(campaign=w.campaign))
+    return pd.concat(parts, ignore_index=True)
+
+
+def canonical(df):
+    return df.sort_values(["campaign", "user_pseudo_id"]).reset_index(drop=True)
+
+
+def test_select_matches_brute_force():
+    users, w = learners(), windows()
+    got = LearnerIndex(users).select(w)
+    pd.testing.assert_frame_equal(canonical(got), canonical(brute_force(users, w)))
+    assert got.groupby("campaign").size().get("overlapping", 0) > 0
+
+
+def test_select_with_no_learners_or_windows():
+    users, w = learners(), windows()
+    empty = LearnerIndex(users.iloc[:0]).select(w)
+    assert empty.empty and list(empty.columns) == list(users.columns) + ["campaign"]
+    assert LearnerIndex(users).select(w.iloc[:0]).empty
@@ -0,0 +1,91 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ftm import cube
+from ftm.geo import country_index
+from ftm.segments import ra_segments
+from ftm.snapshot import load_ftm_users
+
+TOTAL_LVLS = 50
+
+
+def by_date(df):
+    return df.sort_values("LA_date").reset_index(drop=True)
+
+
+def by_country(df):
+    return df.sort_values("country").reset_index(drop=True)
+
+
+def days_ago(days):
+    return (datetime.date.today() - datetime.timedelta(days=days)).strftime("%Y%m%d")
+
+
+@pytest.fixture(
+    params=[
+        {},
+        {"start": days_ago(300), "end": days_ago(200)},
+        {"apps": ["org.curiouslearning.ftm_english", "org.curiouslearning.ftm_hindi"]},
+        {"countries": ["India", "Kenya"], "start": days_ago(400)},
+    ],
+    ids=["all", "window", "apps", "countries"],
+)
+def frames(request, backend):
+    users = load_ftm_users(backend, **request.param)
+    return (
+        users,
+        cube.load_la_daily_cube(backend, **request.param),
+        cube.load_la_cube(backend, **request.param),
+    )
+
+
+def test_totals_match_learners(frames):
+    users, daily_cube, la_cube = frames
+    assert len(users) > 0
+    assert cube.total_la(daily_cube) == cube.total_la(la_cube) == len(users)
+    assert cube.mean_max_lvl(la_cube) == pytest.approx(users["max_lvl"].mean())
+
+
+def test_daily_cube_sums_over_max_lvl(frames):
+    _, daily_cube, la_cube = frames
+    keys = cube.KEYS[cube.LA_DAILY_CUBE]
+    want = la_cube.groupby(keys, observed=True)["learners"].sum().reset_index()
+    got = daily_cube.sort_values(keys).reset_index(drop=True)
+    want = want.sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(got.astype(str), want.astype(str))
+    assert len(daily_cube) <= len(la_cube)
+
+
+def test_daily_la_matches_groupby(frames):
+    users, daily_cube, _ = frames
+    want = users.groupby("LA_date")["user_pseudo_id"].count().reset_index(name="LA")
+    pd.testing.assert_frame_equal(
+        by_date(cube.daily_la(daily_cube)), by_date(want), check_dtype=False
+    )
+
+
+def test_country_la_matches_learner_rollup(frames):
+    users, daily_cube, _ = frames
+    want = country_index().rollup(users["country"])
+    pd.testing.assert_frame_equal(
+        by_country(cube.country_la(daily_cube)), by_country(want)
+    )
+
+
+def test_ra_segments_match_learner_rows(frames):
+    users, _, la_cube = frames
+    pd.testing.assert_frame_equal(
+        cube.cube_ra_segments(la_cube, TOTAL_LVLS, cost=100.0),
+        ra_segments(users, TOTAL_LVLS, cost=100.0),
+    )
+
+
+def test_empty_cube(backend):
+    daily_cube = cube.load_la_daily_cube(backend, start="20000101", end="20000102")
+    la_cube = cube.load_la_cube(backend, start="20000101", end="20000102")
+    assert cube.total_la(daily_cube) == cube.total_la(la_cube) == 0
+    assert np.isnan(cube.mean_max_lvl(la_cube))
+    assert cube.daily_la(daily_cube).empty
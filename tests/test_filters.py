@@ -0,0 +1,100 @@
+import itertools
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from ftm.filters import Predicate, parquet_filter, plan, predicate, sql_filter
+from ftm.slices import contains
+
+OPTIONS = ["India", "Kenya", "Brazil", "Peru"]
+# Values found in the data that were never offered, and missing ones.
+OTHERS = ["(not set)", None]
+
+
+def keeps(values, value):
+    """Whether predicate ``values`` keeps ``value``, by its definition."""
+    values = predicate(values)
+    if values is None:
+        return True
+    if values.op == "in":
+        return value in values.values
+    return value not in values.values
+
+
+def selections():
+    for k in range(len(OPTIONS) + 1):
+        yield from itertools.combinations(OPTIONS, k)
+
+
+@pytest.fixture(scope="module")
+def parquet(tmp_path_factory):
+    path = tmp_path_factory.mktemp("filters") / "countries.parquet"
+    pq.write_table(pa.table({"country": OPTIONS + OTHERS}), path)
+    return path
+
+
+def test_plan():
+    assert plan(OPTIONS[::-1], OPTIONS) is None
+    assert plan(["Kenya", "India", "Kenya"], OPTIONS) == Predicate(
+        "in", ("India", "Kenya")
+    )
+    assert plan(["Kenya", "India", "Peru"], OPTIONS) == Predicate(
+        "in", ("India", "Kenya", "Peru")
+    )
+    assert plan(["Kenya", "India", "Peru"], OPTIONS, closed=True) == Predicate(
+        "not in", ("Brazil",)
+    )
+    assert plan([], OPTIONS) == Predicate("in", ())
+
+
+@pytest.mark.parametrize("closed", [False, True])
+@pytest.mark.parametrize("selected", list(selections()))
+def test_plan_keeps_the_selection(selected, closed):
+    planned = plan(selected, OPTIONS, closed)
+    assert {v for v in OPTIONS if keeps(planned, v)} == set(selected)
+    if closed:
+        assert planned is None or len(planned.values) <= len(OPTIONS) // 2
+    elif planned is not None:
+        # Values never offered go with a partial selection, whatever it is.
+        assert not any(keeps(planned, v) for v in OTHERS)
+
+
+def test_selections_one_country_apart_treat_unknown_values_alike(parquet):
+    def rows(selected):
+        filters = parquet_filter("country", plan(selected, OPTIONS))
+        return pq.read_table(parquet, filters=filters)["country"].to_pylist()
+
+    # Three of four countries used to be sent as an exclude list, which kept
+    # "(not set)" and missing countries; two as an include list, which did not.
+    assert rows(["India", "Kenya", "Peru"]) == ["India", "Kenya", "Peru"]
+    assert rows(["India", "Kenya"]) == ["India", "Kenya"]
+
+
+@pytest.mark.parametrize("closed", [False, True])
+@pytest.mark.parametrize("selected", list(selections()))
+def test_parquet_filter_matches_predicate(parquet, selected, closed):
+    planned = plan(selected, OPTIONS, closed)
+    filters = parquet_filter("country", planned)
+    rows = pq.read_table(parquet, filters=filters or None)["country"].to_pylist()
+    # Exclude lists keep NULLs, like the SQL condition.
+    assert rows == [v for v in OPTIONS + OTHERS if keeps(planned, v)]
+
+
+def test_sql_filter():
+    assert sql_filter("country", "c", None) is None
+    sql, param = sql_filter("country", "c", ["Kenya", "India"])
+    assert sql == "country IN UNNEST(@c)"
+    assert param.values == ["India", "Kenya"]
+    sql, param = sql_filter("country", "c", Predicate("not in", ("Peru",)))
+    assert sql == "(country IS NULL OR country NOT IN UNNEST(@c))"
+
+
+def test_contains_matches_brute_force():
+    planned = [None] + [plan(s, OPTIONS) for s in selections()]
+    planned += [plan(s, OPTIONS, closed=True) for s in selections()]
+    planned += [Predicate("not in", ("Chile",)), Predicate("in", ("Chile",))]
+    universe = OPTIONS + ["Chile", "(not set)"]
+    for outer, inner in itertools.product(planned, repeat=2):
+        want = all(keeps(outer, v) for v in universe if keeps(inner, v))
+        assert contains(outer, inner) == want, (outer, inner)
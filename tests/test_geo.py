@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from ftm import geo
+
+NAMES = [
+    "India",
+    "United States",
+    "United States of America",
+    "Côte d’Ivoire",
+    "Ivory Coast",
+    "Congo - Kinshasa",
+    "kenya ",
+    "(not set)",
+    "Atlantis",
+    None,
+]
+
+
+def canonical_names():
+    """ISO name of every spelling, from countries.csv and the aliases."""
+    countries = pd.read_csv(geo.COUNTRIES_CSV, keep_default_na=False)
+    names = {n.casefold(): n for n in countries["name"]}
+    by_alpha3 = dict(zip(countries["alpha3"], countries["name"]))
+    for alpha3, aliases in geo.GA4_ALIASES.items():
+        for alias in aliases:
+            names[alias.casefold()] = by_alpha3[alpha3]
+    return names, dict(zip(countries["name"], countries["alpha3"].str.upper()))
+
+
+def test_rollup_matches_value_counts():
+    rng = np.random.default_rng(0)
+    country = pd.Series(rng.choice(np.array(NAMES, dtype=object), 5000))
+    names, iso = canonical_names()
+    canonical = country.map(
+        lambda n: names.get(n.strip().replace("’", "'").casefold(), n)
+        if isinstance(n, str)
+        else "(missing)"
+    )
+    want = canonical.value_counts()
+    got = geo.country_index().rollup(country).set_index("country")
+    assert got["LA"].sort_index().equals(want.sort_index().rename("LA"))
+    assert got["iso_alpha"].fillna("").to_dict() == {
+        n: iso.get(n, "") for n in got.index
+    }
+    # Countries first, then the names that could not be placed.
+    assert got["iso_alpha"].isna().to_numpy().tolist() == sorted(
+        got["iso_alpha"].isna()
+    )
+
+
+def test_rollup_sums_weights():
+    country = pd.Series(["Kenya", "India", "Kenya", "(not set)"], dtype="category")
+    got = geo.country_index().rollup(country, weights=[2, 3, 4, 5], name="learners")
+    assert dict(zip(got["country"], got["learners"])) == {
+        "India": 3,
+        "Kenya": 6,
+        "(not set)": 5,
+    }
+    assert geo.unmatched_note(got, "learners") == "Not on the map: (not set) (5)."
+
+
+def test_ga4_names_adds_other_spellings():
+    assert geo.country_index().ga4_names(["United States of America", "Peru"]) == [
+        "United States of America",
+        "Peru",
+        "United States",
+    ]
@@ -0,0 +1,35 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+from ftm import bench, sheets
+from ftm.backend import set_backend
+
+
+def _millify(n, precision=0):
+    return f"{float(n):.{precision}f}"
+
+
+# Display-only imports of the page scripts, stood in for when not installed.
+STUBS = {"millify": {"millify": _millify}, "calplot": {}}
+
+
+@pytest.fixture(autouse=True)
+def page_imports(monkeypatch):
+    for name, attrs in STUBS.items():
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            module = types.ModuleType(name)
+            module.__dict__.update(attrs)
+            monkeypatch.setitem(sys.modules, name, module)
+    yield
+    set_backend(None)
+    sheets.clear()
+
+
+@pytest.mark.parametrize("page", list(bench.SCRIPTS))
+def test_page_runs_on_fixtures(backend, page):
+    assert bench.run_script(backend, page) == []
@@ -0,0 +1,82 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ftm import fixtures, refresh
+
+START = datetime.date(2024, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def fixture():
+    cohort = fixtures.learners(2000, 90, seed=1)
+    users = fixtures.users_table(cohort, START).to_pandas()
+    gameplay = fixtures.gameplay_table(cohort, START, seed=1).to_pandas()
+    success = gameplay[gameplay["action"].str.startswith("LevelSuccess")]
+    events = success.assign(lvl=success["action"].str.split("_").str[1].astype(int))
+    return users, events.drop(columns="action")
+
+
+def fold(batches):
+    cohort, levels = refresh.empty_state()
+    for events in batches:
+        cohort, levels = refresh.apply_increment(cohort, levels, events)
+    return refresh.build_ftm_users(cohort, levels)
+
+
+def canonical(users):
+    return (
+        users.astype({"max_lvl": "int64", "total_lvls_succeeded": "int64"})
+        .sort_values(["user_pseudo_id", "app_id", "country"])
+        .reset_index(drop=True)
+    )
+
+
+def test_incremental_matches_full_rebuild(fixture):
+    _, events = fixture
+    full = fold([events])
+    cuts = ["20240105", "20240106", "20240120", "20240301"]
+    bounds = zip([refresh.INITIAL_WATERMARK] + cuts, cuts + ["99991231"])
+    batches = [
+        events[(events["event_date"] > lo) & (events["event_date"] <= hi)]
+        for lo, hi in bounds
+    ]
+    pd.testing.assert_frame_equal(canonical(fold(batches)), canonical(full))
+
+
+def test_full_rebuild_matches_fixture_users(fixture):
+    users, events = fixture
+    pd.testing.assert_frame_equal(
+        canonical(fold([events])),
+        canonical(users.astype({"user_pseudo_id": object})),
+        check_dtype=False,
+    )
+
+
+def test_refolding_a_shard_double_counts(fixture):
+    # Why a shard must be final when it is folded in.
+    _, events = fixture
+    day = events[events["event_date"] == "20240110"]
+    once = canonical(fold([events]))
+    twice = canonical(fold([events, day]))
+    assert (twice["total_lvls_succeeded"] > once["total_lvls_succeeded"]).any()
+    assert np.array_equal(twice["max_lvl"], once["max_lvl"])
+
+
+def test_latest_complete_shard_waits_for_the_next_shard():
+    today = datetime.date(2024, 3, 10)
+    assert refresh.latest_complete_shard([], today) == "20240308"
+    assert refresh.latest_complete_shard(["20240309", None], today) == "20240308"
+    assert refresh.latest_complete_shard(["20240309", "20240305"], today) == "20240304"
+
+
+def test_print_does_not_touch_the_warehouse(monkeypatch, capsys):
+    def no_client():
+        raise AssertionError("--print queried BigQuery")
+
+    monkeypatch.setattr("ftm.clients.get_bq_client", no_client)
+    refresh.main(["--print", "--watermark", "20240101", "--through", "20240105"])
+    script = capsys.readouterr().out
+    assert "_table_suffix > '240101' AND _table_suffix <= '240105'" in script
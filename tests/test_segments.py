@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ftm.segments import ra_segments
+
+EDGES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+def decile(perc):
+    # The pages' original if/elif chain.
+    for edge in EDGES:
+        if perc < edge:
+            return edge
+    return 1.0
+
+
+def reference(users, total_lvls, by, cost):
+    """Per-group pandas segmentation, as the pages did before ra_segments."""
+    parts = []
+    for group, rows in users.groupby(by):
+        perc = rows["max_lvl"] / total_lvls[group]
+        segs = (
+            pd.DataFrame({"seg": perc.map(decile), "perc": perc})
+            .groupby("seg")["perc"]
+            .agg(la="count", ra="mean")
+            .reset_index()
+        )
+        segs["la_perc"] = segs["la"] / len(rows)
+        segs["rac"] = round(cost[group] * segs["la_perc"] / (segs["ra"] * len(rows)), 2)
+        segs.insert(0, by, group)
+        parts.append(segs)
+    return pd.concat(parts, ignore_index=True)
+
+
+@pytest.fixture
+def users():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    return pd.DataFrame(
+        {
+            "max_lvl": rng.integers(0, 70, n),
+            "campaign": rng.choice(["a", "b", "c", None], n),
+        }
+    )
+
+
+TOTALS = {"a": 60, "b": 30, "c": 45}
+COSTS = {"a": 1000.0, "b": 250.0, "c": 80.0}
+
+
+def test_matches_groupby_reference(users):
+    got = ra_segments(users, TOTALS, by="campaign", cost=COSTS)
+    want = reference(users, TOTALS, "campaign", COSTS)
+    pd.testing.assert_frame_equal(got, want, check_dtype=False)
+
+
+def test_weighted_rows_match_learner_rows(users):
+    counts = users.groupby(["campaign", "max_lvl"]).size().reset_index(name="n")
+    got = ra_segments(counts, TOTALS, by="campaign", cost=COSTS, weight="n")
+    want = ra_segments(users, TOTALS, by="campaign", cost=COSTS)
+    pd.testing.assert_frame_equal(got, want)
+
+
+def test_without_groups(users):
+    got = ra_segments(users, 60)
+    want = reference(users.assign(campaign="all"), {"all": 60}, "campaign", {"all": 1})
+    pd.testing.assert_frame_equal(
+        got, want.drop(columns=["campaign", "rac"]), check_dtype=False
+    )
+
+
+def test_missing_total_raises(users):
+    with pytest.raises(KeyError):
+        ra_segments(users, {"a": 60}, by="campaign")
@@ -0,0 +1,103 @@
+import pytest
+import requests
+
+from ftm import config, sheets
+from ftm.backend import set_backend
+
+SPREADSHEET = "sheet-id"
+VALUES = {0: [["a"], ["1"]], 7: [["b"], ["2"]]}
+
+
+class Response:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    """Drive and Sheets API responses for one spreadsheet, with counters."""
+
+    def __init__(self, version="1"):
+        self.version = version
+        self.down = False
+        self.version_checks = 0
+        self.batch_gets = 0
+
+    def get(self, url, params):
+        if self.down:
+            raise requests.ConnectionError(url)
+        self.version_checks += 1
+        return Response({"version": self.version})
+
+    def post(self, url, json):
+        self.batch_gets += 1
+        gids = [f["gridRange"]["sheetId"] for f in json["dataFilters"]]
+        return Response(
+            {"valueRanges": [{"valueRange": {"values": VALUES[g]}} for g in gids]}
+        )
+
+
+@pytest.fixture
+def disk(tmp_path):
+    return sheets.SheetsCache(str(tmp_path))
+
+
+def test_unchanged_version_skips_the_batch_get(disk):
+    session = FakeSession()
+    assert sheets.fetch_spreadsheet(session, SPREADSHEET, [0, 7], disk) == VALUES
+    assert sheets.fetch_spreadsheet(session, SPREADSHEET, [0, 7], disk) == VALUES
+    assert (session.version_checks, session.batch_gets) == (2, 1)
+    session.version = "2"
+    sheets.fetch_spreadsheet(session, SPREADSHEET, [0, 7], disk)
+    assert session.batch_gets == 2
+    # A sheet the cached copy lacks is fetched even at the same version.
+    sheets.fetch_spreadsheet(session, SPREADSHEET, [7], disk)
+    assert session.batch_gets == 2
+    disk.write(SPREADSHEET, "2", {"0": VALUES[0]})
+    assert sheets.fetch_spreadsheet(session, SPREADSHEET, [0, 7], disk) == VALUES
+    assert session.batch_gets == 3
+
+
+def test_unreachable_drive_serves_the_cached_copy(disk):
+    session = FakeSession()
+    sheets.fetch_spreadsheet(session, SPREADSHEET, [0], disk)
+    session.down = True
+    assert sheets.fetch_spreadsheet(session, SPREADSHEET, [0], disk) == {0: VALUES[0]}
+    with pytest.raises(RuntimeError, match="does not hold all of its sheets"):
+        sheets.fetch_spreadsheet(session, SPREADSHEET, [0, 7], disk)
+    with pytest.raises(RuntimeError):
+        sheets.fetch_spreadsheet(session, "other", [0], disk)
+
+
+class CountingBackend:
+    loads = 0
+
+    def load_sheets(self):
+        self.loads += 1
+        return {"apps": sheets.SHEETS["apps"].frame([["app_id"], ["x"]])}
+
+
+def test_frames_are_reused_within_the_ttl(monkeypatch):
+    backend = CountingBackend()
+    set_backend(backend)
+    sheets.clear()
+    now = [1000.0]
+    monkeypatch.setattr(sheets.time, "time", lambda: now[0])
+    try:
+        first = sheets.get("apps")
+        now[0] += config.SHEETS_TTL_SECONDS
+        second = sheets.get("apps")
+        assert backend.loads == 1
+        # Callers get copies.
+        assert first is not second
+        now[0] += 1
+        sheets.get("apps")
+        assert backend.loads == 2
+    finally:
+        set_backend(None)
+        sheets.clear()
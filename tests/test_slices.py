@@ -0,0 +1,80 @@
+import random
+
+import pandas as pd
+
+from ftm import cache, cube, snapshot
+from ftm.filters import plan
+from ftm.slices import SliceCache
+
+KEY = ["LA_date", "app_id", "country", "max_lvl"]
+
+
+def canonical(df):
+    df = df.astype({"app_id": str, "country": str})
+    return df.sort_values(KEY).reset_index(drop=True)
+
+
+def random_requests(full, n, seed=0):
+    rng = random.Random(seed)
+    apps = sorted(full["app_id"].unique())
+    countries = sorted(full["country"].dropna().unique())
+    first = full["LA_date"].min()
+
+    def pick(values):
+        if rng.random() < 0.4:
+            return None
+        selected = rng.sample(values, rng.randint(0, len(values)))
+        # Closed options also give exclude lists.
+        return plan(selected, values, closed=rng.random() < 0.5)
+
+    for _ in range(n):
+        start = first + pd.Timedelta(rng.randint(-5, 600), unit="D")
+        end = start + pd.Timedelta(rng.randint(0, 120), unit="D")
+        start, end = start.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+        if rng.random() < 0.1:
+            start = None
+        if rng.random() < 0.1:
+            end = None
+        yield start, end, pick(apps), pick(countries)
+
+
+def test_slices_match_direct_reads(backend):
+    version = snapshot.store.ensure(backend, cube.LA_CUBE)
+    full = snapshot.load(cube.LA_CUBE, version, [])
+    slices = SliceCache(cube.LA_CUBE, max_entries=4)
+    for start, end, apps, countries in random_requests(full, 150):
+        got = slices.load(version, start, end, apps, countries)
+        filters = snapshot.learner_filters(start, end, apps, countries)
+        want = snapshot.load(cube.LA_CUBE, version, filters)
+        pd.testing.assert_frame_equal(canonical(got), canonical(want))
+        assert cache.fingerprint(got) == cache.fingerprint(want)
+    assert slices.hits and slices.partial and slices.misses
+    assert len(slices.slices) <= 4
+
+
+def test_shifted_window_reads_only_the_new_days(backend, monkeypatch):
+    version = snapshot.store.ensure(backend, cube.LA_CUBE)
+    slices = SliceCache(cube.LA_CUBE)
+    slices.load(version, "20250101", "20250131")
+    reads = []
+    read = slices._read
+    monkeypatch.setattr(
+        slices, "_read", lambda *args: reads.append(args[1:3]) or read(*args)
+    )
+    slices.load(version, "20250105", "20250210")
+    assert [(s.strftime("%Y%m%d"), e.strftime("%Y%m%d")) for s, e in reads] == [
+        ("20250201", "20250210")
+    ]
+    assert (slices.hits, slices.partial, slices.misses) == (0, 1, 1)
+
+
+def test_frames_count_towards_the_store(backend):
+    version = snapshot.store.ensure(backend, cube.LA_CUBE)
+    slices = SliceCache(cube.LA_CUBE)
+    frame = slices.load(version)
+    assert slices.cache.entries == 1
+    assert slices.cache.bytes == cache.sizeof(frame)
+    cache.store.clear()
+    # An evicted frame is read again.
+    slices.load(version, "20250101", "20250131")
+    assert slices.misses == 2
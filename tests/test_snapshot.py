@@ -0,0 +1,94 @@
+import os
+import shutil
+
+import pytest
+
+from ftm import cache, config, snapshot
+from ftm.backend import LocalBackend
+
+TABLE = snapshot.FTM_USERS_TABLE
+
+
+class CountingBackend(LocalBackend):
+    downloads = 0
+
+    def read_batches(self, table_id):
+        self.downloads += 1
+        return super().read_batches(table_id)
+
+
+@pytest.fixture
+def counting(local_db, data_dir):
+    # A copy, so touching it does not change the version the other tests see.
+    path = str(data_dir / "fixtures.duckdb")
+    shutil.copy(local_db, path)
+    return CountingBackend(path)
+
+
+def touch(backend, seconds):
+    stat = os.stat(backend.path)
+    os.utime(backend.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+
+def test_snapshot_is_reused_while_the_table_is_unchanged(counting):
+    version = snapshot.store.ensure(counting, TABLE)
+    assert snapshot.store.ensure(counting, TABLE) == version
+    assert counting.downloads == 1
+    assert snapshot.store.versions(TABLE) == [version]
+    assert len(snapshot.load_ftm_users(counting)) == 3000
+
+
+def test_snapshot_is_downloaded_again_when_the_table_changes(counting):
+    first = snapshot.store.ensure(counting, TABLE)
+    touch(counting, 1)
+    second = snapshot.store.ensure(counting, TABLE)
+    assert second != first
+    assert counting.downloads == 2
+    touch(counting, 2)
+    third = snapshot.store.ensure(counting, TABLE)
+    assert counting.downloads == 3
+    # Only the newest versions are kept.
+    assert snapshot.store.versions(TABLE) == sorted([second, third])
+
+
+def test_table_change_invalidates_cached_results(counting):
+    calls = []
+
+    @cache.cached(max_entries=4)
+    def learners():
+        calls.append(1)
+        return len(snapshot.load_ftm_users(counting))
+
+    try:
+        assert learners() == learners() == 3000
+        assert len(calls) == 1
+        touch(counting, 1)
+        snapshot.store.ensure(counting, TABLE)
+        assert learners() == 3000
+        assert len(calls) == 2
+    finally:
+        learners.clear()
+
+
+def test_cached_results_follow_a_late_table_change(counting, monkeypatch):
+    calls = []
+
+    @cache.cached(max_entries=4)
+    def learners():
+        calls.append(1)
+        return len(snapshot.load_ftm_users(counting))
+
+    try:
+        learners()
+        # The refresh finishes after the results were cached: they are kept
+        # until the version is checked again, without another ensure.
+        touch(counting, 1)
+        learners()
+        assert len(calls) == 1
+        monkeypatch.setattr(config, "SNAPSHOT_CHECK_SECONDS", 0)
+        learners()
+        learners()
+        assert len(calls) == 2
+        assert counting.downloads == 2
+    finally:
+        learners.clear()
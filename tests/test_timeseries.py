@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ftm.timeseries import downsample, lttb, normalized_start, rolling_means
+
+WINDOWS = {"weekly": 7, "monthly": 30}
+
+
+@pytest.fixture
+def daily():
+    rng = np.random.default_rng(0)
+    parts = []
+    for campaign, days in (("a", 90), ("b", 5), ("c", 40)):
+        dates = pd.date_range("2024-01-01", periods=days, freq="D") + pd.Timedelta(
+            int(rng.integers(0, 30)), unit="D"
+        )
+        # Leave gaps, which count as days without learners.
+        keep = rng.random(days) < 0.7
+        keep[0] = keep[-1] = True
+        parts.append(
+            pd.DataFrame(
+                {
+                    "campaign": campaign,
+                    "LA_date": dates[keep],
+                    "LA": rng.integers(1, 100, keep.sum()),
+                }
+            )
+        )
+    res = pd.concat(parts, ignore_index=True)
+    return res.sample(frac=1, random_state=0)
+
+
+def reference(daily):
+    """Per-group reindex to every day, then ``Series.rolling``."""
+    parts = []
+    for campaign, rows in daily.groupby("campaign"):
+        series = rows.set_index("LA_date")["LA"].sort_index()
+        days = pd.date_range(series.index.min(), series.index.max(), freq="D")
+        series = series.reindex(days, fill_value=0)
+        part = pd.DataFrame({"campaign": campaign, "LA_date": days, "LA": series})
+        for name, window in WINDOWS.items():
+            part[name] = series.rolling(window).mean().to_numpy()
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+def test_rolling_means_match_pandas(daily):
+    got = rolling_means(daily, "LA", WINDOWS, by="campaign")
+    pd.testing.assert_frame_equal(got, reference(daily), check_dtype=False)
+
+
+def test_rolling_means_leave_out_missing_groups(daily):
+    missing = daily.assign(campaign=daily["campaign"].where(daily["LA"] % 5 > 0))
+    got = rolling_means(missing, "LA", WINDOWS, by="campaign")
+    want = reference(missing.dropna(subset=["campaign"]))
+    pd.testing.assert_frame_equal(got, want, check_dtype=False)
+
+
+def test_normalized_start_counts_from_each_group_start(daily):
+    res = normalized_start(daily)
+    start = daily.groupby("campaign")["LA_date"].transform("min")
+    assert ((daily["LA_date"] - start).dt.days + 1).equals(res["day"])
+
+
+def test_normalized_start_in_weeks(daily):
+    res = normalized_start(daily, unit="W", name="week")
+    start = daily.groupby("campaign")["LA_date"].transform("min")
+    assert ((daily["LA_date"] - start).dt.days // 7 + 1).equals(res["week"])
+    assert res.loc[res["campaign"] == "b", "week"].unique().tolist() == [1]
+
+
+def test_normalized_start_in_whole_months():
+    # A month has elapsed once the start's day of the month is reached again.
+    rows = [
+        ("a", "2024-01-31", 1),
+        ("a", "2024-02-29", 1),
+        ("a", "2024-03-30", 2),
+        ("a", "2024-03-31", 3),
+        ("a", "2024-12-31", 12),
+        ("a", "2025-01-31", 13),
+        ("b", "2024-02-01", 1),
+        ("b", "2024-02-29", 1),
+        ("b", "2024-03-01", 2),
+    ]
+    daily = pd.DataFrame(rows, columns=["campaign", "LA_date", "want"])
+    daily = daily.sample(frac=1, random_state=0)
+    res = normalized_start(daily, unit="M", name="month")
+    assert res["month"].tolist() == res["want"].tolist()
+
+
+def test_normalized_start_rejects_other_units(daily):
+    with pytest.raises(ValueError):
+        normalized_start(daily, unit="Q")
+
+
+def reference_lttb(x, y, n):
+    """Steinarsson's Largest-Triangle-Three-Buckets, one point at a time."""
+    every = (len(x) - 2) / (n - 2)
+    keep = [0]
+    for i in range(n - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nxt = range(hi, min(int((i + 2) * every) + 1, len(x)))
+        if i == n - 3:
+            nxt = [len(x) - 1]
+        next_x = sum(x[j] for j in nxt) / len(nxt)
+        next_y = sum(y[j] for j in nxt) / len(nxt)
+        a = keep[-1]
+        areas = [
+            abs((x[a] - next_x) * (y[j] - y[a]) - (x[a] - x[j]) * (next_y - y[a]))
+            for j in range(lo, hi)
+        ]
+        keep.append(lo + areas.index(max(areas)))
+    return keep + [len(x) - 1]
+
+
+@pytest.mark.parametrize("size, n", [(1000, 50), (101, 7), (30, 29)])
+def test_lttb_matches_reference(size, n):
+    rng = np.random.default_rng(size)
+    x = np.sort(rng.random(size)) * 100
+    y = rng.normal(size=size).cumsum()
+    assert list(lttb(x, y, n)) == reference_lttb(x, y, n)
+
+
+def test_lttb_keeps_ends_and_extremes():
+    x = np.arange(1000)
+    y = np.sin(x / 50.0)
+    y[437] = 10
+    keep = lttb(x, y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert 437 in keep
+
+
+def test_lttb_returns_everything_when_under_budget():
+    assert list(lttb(np.arange(5), np.arange(5), 10)) == list(range(5))
+
+
+def test_downsample_shares_the_budget(daily):
+    weekly = rolling_means(daily, "LA", {"weekly": 7}, by="campaign")
+    drawn = weekly[weekly["weekly"].notna()]
+    res = downsample(weekly, "LA_date", "weekly", 30, by="campaign")
+    assert len(res) <= 30
+    assert set(res["campaign"]) == set(drawn["campaign"])
+    for _, rows in res.groupby("campaign"):
+        assert rows["LA_date"].is_monotonic_increasing
+    pd.testing.assert_frame_equal(
+        downsample(weekly, "LA_date", "weekly", 10_000, by="campaign"), drawn
+    )